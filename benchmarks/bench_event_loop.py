@@ -0,0 +1,124 @@
+"""
+Event-loop blocking by DB work inside `async def` handlers.
+
+Drives POST /providers/sync_from_npi concurrently against a mock NPPES with
+simulated latency, once through a copy of the old handler (sync Session on
+the event loop) and once through the real handler (NPPES awaited, the write
+run off the loop by the write queue). Reports
+throughput and the worst event-loop stall seen by a ticker task as JSON.
+
+Keep --concurrency below the sync pool size (15 by default). Above it, the
+sync-session handler blocks the loop in a pool checkout while the sessions
+that could return a connection are awaiting NPPES on that same loop. It
+then stalls until the pool timeout.
+
+    python -m benchmarks.bench_event_loop --requests 400 --concurrency 10 --latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+# Removed when the interpreter exits
+_tmp = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp.name}/bench.db")
+os.environ.setdefault("NPI_CACHE_PERSIST", "0")
+
+import httpx  # noqa: E402
+from fastapi import Depends, FastAPI  # noqa: E402
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+
+from credentialwatch_backend import app_cred  # noqa: E402
+from credentialwatch_backend.db import DATABASE_URL  # noqa: E402
+from credentialwatch_backend.init_db import create_all  # noqa: E402
+from credentialwatch_backend.models import Provider  # noqa: E402
+from credentialwatch_backend.nppes_client import nppes_client  # noqa: E402
+from credentialwatch_backend.schemas_cred import ProviderResponse, ProviderSyncRequest  # noqa: E402
+from benchmarks.mock_nppes import MockNPPES  # noqa: E402
+
+legacy_app = FastAPI()
+# The old engine setup: default QueuePool (5 + 10 overflow), no PRAGMAs
+legacy_engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+LegacySession = sessionmaker(autoflush=False, bind=legacy_engine)
+
+
+def get_db():
+    db = LegacySession()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@legacy_app.post("/providers/sync_from_npi", response_model=ProviderResponse)
+async def legacy_sync_provider_from_npi(req: ProviderSyncRequest, db: Session = Depends(get_db)):
+    # The pre-async handler: every SELECT/commit runs on the event loop thread.
+    provider = db.execute(select(Provider).where(Provider.npi == req.npi)).scalars().first()
+    npi_data = await app_cred.fetch_npi_data(req.npi)
+    if not provider:
+        provider = Provider(npi=req.npi, is_active=True)
+        db.add(provider)
+    app_cred._apply_npi_data(provider, npi_data)
+    db.commit()
+    db.refresh(provider)
+    return provider
+
+
+async def _loop_stall_probe(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - t - interval)
+    return worst
+
+
+async def _run(name: str, app, npis, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    probe = asyncio.ensure_future(_loop_stall_probe(stop))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(npi):
+            async with semaphore:
+                resp = await client.post("/providers/sync_from_npi", json={"npi": npi})
+                resp.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(npi) for npi in npis))
+        elapsed = time.perf_counter() - start
+    stop.set()
+    return {
+        "handler": name,
+        "requests": len(npis),
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(npis) / elapsed, 1),
+        "max_loop_stall_ms": round(await probe * 1000, 2),
+    }
+
+
+async def main(requests: int, concurrency: int, latency_ms: float) -> list:
+    create_all()
+    server = await MockNPPES(latency_ms=latency_ms).start()
+    nppes_client.base_url = server.url
+
+    results = []
+    for offset, (name, app) in enumerate([("sync_session_on_loop", legacy_app), ("write_queue", app_cred.app)]):
+        # Fresh NPIs per run so every request really goes to NPPES and inserts
+        npis = [str(1000000000 + offset * requests + i) for i in range(requests)]
+        results.append(await _run(name, app, npis, concurrency))
+
+    await nppes_client.aclose()
+    await server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.requests, args.concurrency, args.latency_ms)), indent=2))
@@ -0,0 +1,71 @@
+"""
+NPPES client benchmark: per-request clients vs the pooled single-flight client.
+
+Fires a burst of concurrent lookups (with duplicate NPIs, as an agent fan-out
+produces) at a local mock registry and reports wall time, TCP connections
+opened and upstream requests for each strategy as JSON.
+
+    python -m benchmarks.bench_nppes_client --requests 500 --unique 100
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from credentialwatch_backend.nppes_client import NPPESClient, NPPES_VERSION
+from benchmarks.mock_nppes import MockNPPES
+
+
+async def _per_request_client(url: str, npi: str) -> dict:
+    # What app_npi did before: a fresh client (and connection) per lookup.
+    async with httpx.AsyncClient() as client:
+        response = await client.get(url, params={"version": NPPES_VERSION, "number": npi})
+        response.raise_for_status()
+        return response.json()
+
+
+async def _run(name, server: MockNPPES, npis, fetch) -> dict:
+    server.reset_counters()
+    start = time.perf_counter()
+    await asyncio.gather(*(fetch(npi) for npi in npis))
+    elapsed = time.perf_counter() - start
+    return {
+        "strategy": name,
+        "lookups": len(npis),
+        "seconds": round(elapsed, 4),
+        "lookups_per_sec": round(len(npis) / elapsed, 1),
+        "tcp_connections": server.connections,
+        "upstream_requests": server.requests,
+    }
+
+
+async def main(requests: int, unique: int, latency_ms: float, seed: int) -> list:
+    server = await MockNPPES(latency_ms=latency_ms).start()
+    rng = random.Random(seed)
+    pool = [str(1000000000 + i) for i in range(unique)]
+    npis = [rng.choice(pool) for _ in range(requests)]
+
+    results = [await _run("per_request_client", server, npis, lambda npi: _per_request_client(server.url, npi))]
+
+    pooled = NPPESClient(base_url=server.url)
+    results.append(await _run(
+        "pooled_single_flight", server, npis,
+        lambda npi: pooled.fetch({"version": NPPES_VERSION, "number": npi}),
+    ))
+    results[-1]["coalesced"] = pooled.coalesced_calls
+    await pooled.aclose()
+    await server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--unique", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.requests, args.unique, args.latency_ms, args.seed)), indent=2))
@@ -0,0 +1,108 @@
+"""
+Serialization cost of /credentials/expiring responses, before and after the
+fast JSON path.
+
+"before" is the old path: ORM Provider/Credential rows wrapped in
+ExpiringCredentialResult models, re-validated against the response_model and
+dumped by Pydantic. That is what FastAPI does with a returned list of models.
+"after" is fast_json: Core rows packed into dicts and encoded by orjson.
+Both variants time the query plus the encoding, and the bytes are
+checked to be identical. Results are reported as JSON.
+
+    python -m benchmarks.bench_serialization --rows 20000 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import Integer, case, cast, func, insert, select
+from sqlalchemy.orm import Session
+
+from credentialwatch_backend.app_cred import EXPIRING_CREDENTIAL_COLUMNS, EXPIRING_PROVIDER_COLUMNS, _expiring_result
+from credentialwatch_backend.db import Base, create_sqlite_engine
+from credentialwatch_backend.fast_json import dumps
+from credentialwatch_backend.models import Credential, Provider
+from credentialwatch_backend.schemas_cred import ExpiringCredentialResult
+
+
+def _seed(engine, rows: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    today = date.today()
+    now = datetime.utcnow()
+    rng = random.Random(0)
+    providers = max(1, rows // 4)
+    with engine.begin() as conn:
+        conn.execute(insert(Provider), [
+            {"id": i, "npi": str(1000000000 + i), "full_name": f"Provider {i}", "dept": "Cardiology",
+             "location": "Boston, MA", "is_active": True, "created_at": now, "updated_at": now}
+            for i in range(1, providers + 1)
+        ])
+        conn.execute(insert(Credential), [
+            {"provider_id": rng.randint(1, providers), "type": "state_license", "issuer": "State Board",
+             "number": f"L{i}", "status": "active", "expiry_date": today + timedelta(days=rng.randint(0, 365)),
+             "metadata_json": {"source": "bench"}, "created_at": now, "updated_at": now}
+            for i in range(rows)
+        ])
+
+
+def _columns():
+    today = date.today()
+    days_to_expiry = cast(func.julianday(Credential.expiry_date) - func.julianday(today.isoformat()), Integer)
+    return days_to_expiry.label("days_to_expiry"), case((days_to_expiry < 30, 1.0), else_=0.5).label("risk_score")
+
+
+def before(db: Session) -> bytes:
+    days, risk = _columns()
+    stmt = select(Credential, Provider, days, risk).join(Provider, Credential.provider_id == Provider.id)
+    results = [
+        ExpiringCredentialResult(provider=r.Provider, credential=r.Credential,
+                                 days_to_expiry=r.days_to_expiry, risk_score=r.risk_score)
+        for r in db.execute(stmt.order_by(Credential.expiry_date, Credential.id))
+    ]
+    adapter = TypeAdapter(List[ExpiringCredentialResult])
+    return adapter.dump_json(adapter.validate_python(results))
+
+
+def after(db: Session) -> bytes:
+    days, risk = _columns()
+    stmt = select(*EXPIRING_PROVIDER_COLUMNS, *EXPIRING_CREDENTIAL_COLUMNS, days, risk).select_from(Credential).join(
+        Provider, Credential.provider_id == Provider.id
+    )
+    return dumps([_expiring_result(r) for r in db.execute(stmt.order_by(Credential.expiry_date, Credential.id))])
+
+
+def run(rows: int, repeat: int) -> list:
+    engine = create_sqlite_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    _seed(engine, rows)
+    outputs, results = {}, []
+    for name, fn in [("before", before), ("after", after)]:
+        timings = []
+        for _ in range(repeat):
+            with Session(engine) as db:
+                start = time.perf_counter()
+                outputs[name] = fn(db)
+                timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append({
+            "path": name,
+            "rows": rows,
+            "best_seconds": round(best, 4),
+            "rows_per_sec": round(rows / best),
+            "bytes": len(outputs[name]),
+        })
+    assert outputs["before"] == outputs["after"], "fast path output differs"
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
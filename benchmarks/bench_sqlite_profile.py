@@ -0,0 +1,129 @@
+"""
+Mixed read/write SQLite load: default engine vs the tuned profile.
+
+"before" is the original setup: one engine with the default pool and no
+PRAGMAs, which means rollback journal, full fsync and no busy timeout. "after" is db.py's
+performance profile: WAL, synchronous=NORMAL, mmap, a larger page cache and
+busy_timeout, with a single-connection write pool and a query_only read pool.
+
+Reader threads page through expiring credentials while writer threads
+insert and commit credentials. Results are reported as JSON.
+
+    python -m benchmarks.bench_sqlite_profile --readers 8 --writers 4 --seconds 5
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from credentialwatch_backend.db import Base, create_sqlite_engine
+from credentialwatch_backend.models import Credential, Provider
+
+
+def _seed(engine, credentials: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    today = date.today()
+    rng = random.Random(0)
+    with engine.begin() as conn:
+        conn.execute(insert(Provider), [{"id": i, "full_name": f"Provider {i}", "is_active": True} for i in range(1, 1001)])
+        conn.execute(insert(Credential), [
+            {
+                "provider_id": rng.randint(1, 1000), "type": "state_license", "issuer": "State",
+                "number": f"L{i}", "status": "active", "expiry_date": today + timedelta(days=rng.randint(-30, 720)),
+            }
+            for i in range(credentials)
+        ])
+
+
+def _engines(url: str, profile: str):
+    if profile == "before":
+        eng = create_engine(url, connect_args={"check_same_thread": False})
+        return eng, eng
+    write = create_sqlite_engine(url, profile="performance", pool_size=1, max_overflow=0)
+    read = create_sqlite_engine(url, profile="performance", read_only=True, pool_size=8, max_overflow=0)
+    return write, read
+
+
+def run(profile: str, readers: int, writers: int, seconds: float, credentials: int) -> dict:
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    write_engine, read_engine = _engines(url, profile)
+    _seed(write_engine, credentials)
+    WriteSession = sessionmaker(bind=write_engine)
+    ReadSession = sessionmaker(bind=read_engine)
+
+    stop = time.perf_counter() + seconds
+    counts = {"reads": 0, "writes": 0, "lock_errors": 0}
+    lock = threading.Lock()
+    target = date.today() + timedelta(days=90)
+
+    def reader():
+        n = errors = 0
+        while time.perf_counter() < stop:
+            with ReadSession() as db:
+                try:
+                    db.execute(
+                        select(Credential).where(Credential.status == "active", Credential.expiry_date <= target)
+                        .order_by(Credential.expiry_date, Credential.id).limit(100)
+                    ).all()
+                    n += 1
+                except OperationalError:
+                    errors += 1
+        with lock:
+            counts["reads"] += n
+            counts["lock_errors"] += errors
+
+    def writer(worker: int):
+        n = errors = 0
+        while time.perf_counter() < stop:
+            with WriteSession() as db:
+                try:
+                    db.add(Credential(
+                        provider_id=1, type="dea", issuer="DEA", number=f"W{worker}-{n}-{errors}",
+                        status="active", expiry_date=date.today() + timedelta(days=365),
+                    ))
+                    db.commit()
+                    n += 1
+                except OperationalError:
+                    db.rollback()
+                    errors += 1
+        with lock:
+            counts["writes"] += n
+            counts["lock_errors"] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "profile": profile,
+        "readers": readers,
+        "writers": writers,
+        "seconds": round(elapsed, 2),
+        "reads_per_sec": round(counts["reads"] / elapsed, 1),
+        "writes_per_sec": round(counts["writes"] / elapsed, 1),
+        "lock_errors": counts["lock_errors"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--credentials", type=int, default=50_000)
+    args = parser.parse_args()
+    results = [run(p, args.readers, args.writers, args.seconds, args.credentials) for p in ("before", "after")]
+    print(json.dumps(results, indent=2))
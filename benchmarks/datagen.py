@@ -0,0 +1,187 @@
+"""
+Synthetic CredentialWatch dataset generator.
+
+Builds a SQLite database with providers, credentials and alerts at a
+configurable size (10k to several million credentials), fast: rows are
+generated as tuples and bulk-inserted through the DB-API in chunks. Output
+is deterministic for a given --seed.
+
+The shape aims to look like a real roster:
+- Each provider holds 3-6 credentials.
+- Each credential type renews on its own cycle: state licenses every 2 years,
+  DEA every 3, board certs every 10, and so on. Expiry dates are spread
+  over one cycle ahead.
+- About 40% of license expiries fall on a month end.
+- A few percent have lapsed. Some of those are already marked expired, and
+  the rest are still "active" for the sweeper to catch.
+- Open alerts come from a real sweeper run. Resolved historical alerts are
+  added on top.
+
+    python -m benchmarks.datagen --credentials 1000000 --db /tmp/cw_1m.db
+"""
+import argparse
+import calendar
+import json
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterator, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from credentialwatch_backend import alert_counters
+from credentialwatch_backend.db import Base, create_sqlite_engine
+from credentialwatch_backend.sweeper import run_sweep
+
+INSERT_CHUNK = 50_000
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "Wei", "Priya", "Mohammed", "Sofia", "Hiroshi", "Zoë", "José", "Aisha", "Olga", "Kwame",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Nguyen", "Patel", "Kim", "Chen", "Okafor", "Müller", "Rossi", "Kowalski", "Haddad", "Tanaka",
+]
+DEPARTMENTS = [
+    "Cardiology", "Pediatrics", "Oncology", "Radiology", "Neurology", "Emergency Medicine",
+    "Family Medicine", "Orthopedic Surgery", "Psychiatry", "Anesthesiology", "Dermatology", "Nursing",
+]
+CITIES = [
+    ("Boston", "MA"), ("New York", "NY"), ("Chicago", "IL"), ("Houston", "TX"), ("Phoenix", "AZ"),
+    ("Philadelphia", "PA"), ("San Diego", "CA"), ("Seattle", "WA"), ("Denver", "CO"), ("Atlanta", "GA"),
+    ("Miami", "FL"), ("Minneapolis", "MN"), ("Portland", "OR"), ("Nashville", "TN"), ("Columbus", "OH"),
+]
+# (type, issuer, renewal cycle in days, snaps to month end)
+CREDENTIAL_TYPES = [
+    ("state_license", "State Medical Board", 730, True),
+    ("dea", "DEA", 1095, False),
+    ("board_cert", "Specialty Board", 3650, False),
+    ("bls", "American Heart Association", 730, True),
+    ("malpractice", "Insurer", 365, False),
+    ("hospital_privileges", "Medical Staff Office", 730, False),
+]
+LAPSED_SHARE = 0.03
+CREDENTIALS_PER_PROVIDER = (3, 6)
+
+
+def _month_end(d: date) -> date:
+    return d.replace(day=calendar.monthrange(d.year, d.month)[1])
+
+
+# SQLAlchemy's SQLite storage formats; rows go straight to the DB-API driver
+def _d(value: date) -> str:
+    return value.isoformat()
+
+
+def _dt(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+PROVIDER_COLUMNS = ("id", "npi", "full_name", "dept", "location", "primary_specialty", "is_active", "created_at", "updated_at")
+CREDENTIAL_COLUMNS = (
+    "provider_id", "type", "issuer", "number", "status", "issue_date", "expiry_date", "created_at", "updated_at",
+)
+ALERT_COLUMNS = (
+    "provider_id", "credential_id", "severity", "window_days", "message", "channel",
+    "created_at", "resolved_at", "resolution_note",
+)
+
+
+def _providers(rng: random.Random, count: int, now: str) -> Iterator[Tuple]:
+    for i in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        dept = rng.choice(DEPARTMENTS)
+        name = f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        yield (i, str(1_000_000_000 + i), name, dept, f"{city}, {state}", dept, int(rng.random() > 0.02), now, now)
+
+
+def _credentials(rng: random.Random, providers: int, count: int, today: date, now: str) -> Iterator[Tuple]:
+    made = 0
+    provider_id = 0
+    while made < count:
+        provider_id = provider_id % providers + 1
+        kinds = rng.sample(CREDENTIAL_TYPES, min(rng.randint(*CREDENTIALS_PER_PROVIDER), count - made))
+        for cred_type, issuer, cycle, month_end in kinds:
+            if rng.random() < LAPSED_SHARE:
+                expiry = today - timedelta(days=rng.randint(1, 180))
+                status = "expired" if rng.random() < 0.5 else "active"  # half not yet swept
+            else:
+                expiry = today + timedelta(days=rng.randint(0, cycle))
+                status = "active"
+            if month_end and rng.random() < 0.4:
+                expiry = _month_end(expiry)
+            made += 1
+            number = f"{cred_type[:3].upper()}-{made:08d}"
+            yield (provider_id, cred_type, issuer, number, status, _d(expiry - timedelta(days=cycle)), _d(expiry), now, now)
+
+
+def _resolved_alerts(rng: random.Random, credentials: int, providers: int, now: datetime) -> Iterator[Tuple]:
+    # Roughly one past (resolved) alert per three credentials
+    for _ in range(credentials // 3):
+        created = now - timedelta(days=rng.randint(30, 1000))
+        yield (
+            rng.randint(1, providers), rng.randint(1, credentials),
+            rng.choice(["info", "warning", "critical"]), rng.choice([90, 30, 7]),
+            "Credential renewal reminder", "ui",
+            _dt(created), _dt(created + timedelta(days=rng.randint(1, 30))), "Renewed",
+        )
+
+
+def _insert_chunked(conn, table: str, columns: Sequence[str], rows: Iterator[Tuple]) -> int:
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    total = 0
+    while True:
+        chunk = list(islice(rows, INSERT_CHUNK))
+        if not chunk:
+            return total
+        conn.exec_driver_sql(sql, chunk)
+        total += len(chunk)
+
+
+def generate(url: str, credentials: int, seed: int = 0) -> Dict:
+    """Create the schema at ``url`` and fill it; returns row counts and timings."""
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow()
+    stamp = _dt(now)
+    providers = max(1, round(credentials / sum(CREDENTIALS_PER_PROVIDER) * 2))
+
+    engine = create_sqlite_engine(url, profile="performance")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # Bulk load: nothing to protect until it finishes
+        conn.execute(text("PRAGMA synchronous=OFF"))
+        counts = {
+            "providers": _insert_chunked(conn, "providers", PROVIDER_COLUMNS, _providers(rng, providers, stamp)),
+            "credentials": _insert_chunked(
+                conn, "credentials", CREDENTIAL_COLUMNS, _credentials(rng, providers, credentials, today, stamp)
+            ),
+            "resolved_alerts": _insert_chunked(
+                conn, "alerts", ALERT_COLUMNS, _resolved_alerts(rng, credentials, providers, now)
+            ),
+        }
+    with Session(engine) as db:
+        # Open alerts the way production creates them, then counters to match
+        counts.update(run_sweep(db, today=today))
+        alert_counters.rebuild(db)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+    counts["seconds"] = round(time.perf_counter() - start, 2)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credentials", type=int, default=10_000)
+    parser.add_argument("--db", required=True, help="SQLite file to create (must not exist)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+    print(json.dumps(generate(f"sqlite:///{args.db}", args.credentials, args.seed), indent=2))
@@ -0,0 +1,111 @@
+"""
+Minimal local stand-in for the NPPES registry API.
+
+Speaks just enough HTTP/1.1 (keep-alive, Content-Length) to be driven by
+httpx, and counts TCP connections and requests so benchmarks can show
+connection reuse. Latency per request is configurable.
+
+    python -m benchmarks.mock_nppes --port 8765 --latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def fake_result(npi: str) -> dict:
+    return {
+        "number": npi,
+        "enumeration_type": "NPI-1",
+        "basic": {"first_name": "TEST", "last_name": f"PROVIDER{npi[-4:]}"},
+        "addresses": [
+            {
+                "address_purpose": "LOCATION",
+                "address_1": "1 MAIN ST",
+                "city": "BOSTON",
+                "state": "MA",
+                "postal_code": "02110",
+                "country_code": "US",
+                "telephone_number": "617-555-0100",
+            }
+        ],
+        "taxonomies": [
+            {"code": "207RC0000X", "desc": "Cardiovascular Disease", "primary": True, "state": "MA", "license": f"MA-{npi[-5:]}"}
+        ],
+    }
+
+
+class MockNPPES:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000.0
+        self.connections = 0
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/api/"
+
+    def reset_counters(self) -> None:
+        self.connections = 0
+        self.requests = 0
+
+    async def start(self) -> "MockNPPES":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _body_for(self, target: str) -> bytes:
+        params = {k: v[0] for k, v in parse_qs(urlsplit(target).query).items()}
+        npi = params.get("number")
+        if npi:
+            results = [] if npi.startswith("0000") else [fake_result(npi)]
+        else:
+            limit = int(params.get("limit", 10))
+            results = [fake_result(f"{1000000000 + i}") for i in range(limit)]
+        return json.dumps({"result_count": len(results), "results": results}).encode()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line = head.split(b"\r\n", 1)[0].decode()
+                _, target, _ = request_line.split(" ", 2)
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                body = self._body_for(target)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(port: int, latency_ms: float) -> None:
+    server = await MockNPPES(port=port, latency_ms=latency_ms).start()
+    print(f"Mock NPPES listening on {server.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.port, args.latency_ms))
@@ -0,0 +1,317 @@
+"""
+End-to-end benchmark suite for all three apps.
+
+Generates a synthetic dataset (benchmarks.datagen), or reuses an existing
+one. It then points the backend at that database and at a local mock NPPES
+with configurable latency, and drives every endpoint of the cred, npi and
+alert apps as modal_app.create_app builds them (with metrics unless
+METRICS_ENABLED=0). Requests go in-process through httpx's ASGI transport,
+so the numbers cover the app and SQLite, not the network.
+
+For each scenario it reports p50/p95/p99 latency, throughput, error count and
+peak RSS as JSON. With --out the results go to a file, tagged with the git
+commit and dataset, so runs can be compared over time.
+
+    python -m benchmarks.suite --credentials 100000 --requests 200 --concurrency 8
+    python -m benchmarks.suite --db /tmp/cw_1m.db --only cred. --out results/1m.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from benchmarks.mock_nppes import MockNPPES
+
+# Imported lazily: the backend (which datagen uses) reads DATABASE_URL at import time
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+]
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    # Called with (request number, rng, dataset facts) -> (path, httpx request kwargs)
+    build: Callable[[int, random.Random, Dict], tuple]
+    stream: bool = False
+    # Run once before the timed requests, e.g. to prime a cache or record an ETag in the facts
+    setup: Optional[Callable[[httpx.AsyncClient, Dict], Awaitable[None]]] = None
+
+
+HISTOGRAM_PARAMS = {"bucket": "week", "group_by": "type", "window_days": 365}
+
+
+async def _prime_histogram(client: httpx.AsyncClient, facts: Dict) -> None:
+    response = await client.get("/cred/credentials/expiry_histogram", params=HISTOGRAM_PARAMS)
+    facts["histogram_etag"] = response.headers.get("ETag")
+
+
+RISK_PAGE = {"window_days": 90, "sort": "risk", "limit": 100}
+
+
+async def _first_risk_page(client: httpx.AsyncClient, facts: Dict) -> None:
+    response = await client.post("/cred/credentials/expiring", json=RISK_PAGE)
+    facts["risk_cursor"] = response.headers.get("X-Next-Cursor")
+
+
+def _scenarios() -> List[Scenario]:
+    today = date.today()
+
+    def provider_id(rng, facts):
+        return rng.randint(1, facts["providers"])
+
+    def change_since(rng, facts, page):
+        # A follower somewhere in the log, with at least a page still to read
+        first, head = facts["change_seq"]
+        return rng.randint(first, max(first, head - page))
+
+    def cred_row(i, rng, facts):
+        return {
+            "provider_id": provider_id(rng, facts), "type": "bench_license", "issuer": "Bench Board",
+            "number": f"B-{i}-{rng.randrange(10**9)}", "expiry_date": str(today + timedelta(days=rng.randint(-30, 900))),
+        }
+
+    def roster_csv(i, rng, facts, rows=1000):
+        # Mostly known providers (datagen's NPIs are 1_000_000_000 + id), some new
+        lines = ["npi,full_name,dept,location,type,issuer,number,expiry_date"]
+        for j in range(rows):
+            expiry = today + timedelta(days=rng.randint(-30, 900))
+            if rng.random() < 0.8:
+                npi, name = 1_000_000_000 + provider_id(rng, facts), ""
+            else:
+                npi, name = 1_800_000_000 + i * rows + j, f"Dr. Roster {rng.choice(LAST_NAMES)}"
+            lines.append(f"{npi},{name},,,bench_roster,Bench Board,R-{npi}-{rng.randrange(3)},{expiry}")
+        return "\n".join(lines) + "\n"
+
+    return [
+        # Reads
+        Scenario("npi.provider", "GET", lambda i, rng, f: (f"/npi/provider/{1_500_000_000 + rng.randrange(500)}", {})),
+        Scenario("npi.search_providers", "POST", lambda i, rng, f: (
+            "/npi/search_providers", {"json": {"query": rng.choice(LAST_NAMES), "state": "MA"}})),
+        Scenario("npi.cache_stats", "GET", lambda i, rng, f: ("/npi/cache/stats", {})),
+        Scenario("cred.expiring_30d", "POST", lambda i, rng, f: ("/cred/credentials/expiring", {"json": {"window_days": 30}})),
+        Scenario("cred.expiring_90d_location", "POST", lambda i, rng, f: (
+            "/cred/credentials/expiring", {"json": {"window_days": 90, "location": "Boston", "limit": 500}})),
+        Scenario("cred.expiring_30d_ndjson", "POST", lambda i, rng, f: (
+            "/cred/credentials/expiring",
+            {"json": {"window_days": 30}, "headers": {"Accept": "application/x-ndjson"}}), stream=True),
+        # Sorted by the precomputed risk_score (risk.py) instead of expiry
+        Scenario("cred.expiring_30d_risk", "POST", lambda i, rng, f: (
+            "/cred/credentials/expiring", {"json": {"window_days": 30, "sort": "risk"}})),
+        Scenario("cred.expiring_90d_location_risk", "POST", lambda i, rng, f: (
+            "/cred/credentials/expiring",
+            {"json": {"window_days": 90, "location": "Boston", "sort": "risk", "limit": 500}})),
+        Scenario("cred.expiring_365d_min_risk", "POST", lambda i, rng, f: (
+            "/cred/credentials/expiring", {"json": {"window_days": 365, "sort": "risk", "min_risk": 0.7}})),
+        Scenario("cred.expiring_risk_page_2", "POST", lambda i, rng, f: (
+            "/cred/credentials/expiring", {"json": {**RISK_PAGE, "cursor": f["risk_cursor"]}}), setup=_first_risk_page),
+        Scenario("cred.snapshot", "POST", lambda i, rng, f: (
+            "/cred/providers/snapshot", {"json": {"provider_id": provider_id(rng, f)}})),
+        Scenario("cred.snapshot_batch_50", "POST", lambda i, rng, f: (
+            "/cred/providers/snapshot/batch",
+            {"json": {"provider_ids": [provider_id(rng, f) for _ in range(50)], "include_alerts": True}})),
+        # Cold: a new window per request, so every one misses the histogram cache
+        Scenario("cred.expiry_histogram_cold_type", "GET", lambda i, rng, f: (
+            "/cred/credentials/expiry_histogram",
+            {"params": {"bucket": "week", "group_by": "type", "window_days": 30 + i % 3600}})),
+        Scenario("cred.expiry_histogram_cold_dept", "GET", lambda i, rng, f: (
+            "/cred/credentials/expiry_histogram",
+            {"params": {"bucket": "month", "group_by": "dept", "window_days": 30 + i % 3600}})),
+        Scenario("cred.expiry_histogram_warm", "GET", lambda i, rng, f: (
+            "/cred/credentials/expiry_histogram", {"params": HISTOGRAM_PARAMS}), setup=_prime_histogram),
+        Scenario("cred.expiry_histogram_etag", "GET", lambda i, rng, f: (
+            "/cred/credentials/expiry_histogram",
+            {"params": HISTOGRAM_PARAMS, "headers": {"If-None-Match": f["histogram_etag"]}}), setup=_prime_histogram),
+        Scenario("cred.changes_page_500", "GET", lambda i, rng, f: (
+            "/cred/changes", {"params": {"since": change_since(rng, f, 500), "limit": 500}})),
+        Scenario("cred.changes_page_1000_ids_only", "GET", lambda i, rng, f: (
+            "/cred/changes", {"params": {"since": change_since(rng, f, 1000), "limit": 1000, "include_data": "false"}})),
+        # A caught-up follower polling the head of the log
+        Scenario("cred.changes_tail", "GET", lambda i, rng, f: (
+            "/cred/changes", {"params": {"since": max(f["change_seq"][0], f["change_seq"][1] - 10)}})),
+        Scenario("cred.providers_search", "GET", lambda i, rng, f: (
+            "/cred/providers/search", {"params": {"q": rng.choice(LAST_NAMES)}})),
+        Scenario("alert.open_by_provider", "GET", lambda i, rng, f: (
+            "/alert/alerts/open", {"params": {"provider_id": provider_id(rng, f)}})),
+        Scenario("alert.summary", "POST", lambda i, rng, f: ("/alert/alerts/summary", {"json": {}})),
+        Scenario("alert.summary_30d", "POST", lambda i, rng, f: ("/alert/alerts/summary", {"json": {"window_days": 30}})),
+        # Writes
+        Scenario("cred.add_or_update", "POST", lambda i, rng, f: ("/cred/credentials/add_or_update", {"json": cred_row(i, rng, f)})),
+        Scenario("cred.bulk_upsert_100", "POST", lambda i, rng, f: (
+            "/cred/credentials/bulk_upsert", {"json": {"credentials": [cred_row(i * 100 + j, rng, f) for j in range(100)]}})),
+        Scenario("cred.sync_from_npi", "POST", lambda i, rng, f: (
+            "/cred/providers/sync_from_npi", {"json": {"npi": str(1_600_000_000 + i)}})),
+        Scenario("cred.sync_from_npi_batch_20", "POST", lambda i, rng, f: (
+            "/cred/providers/sync_from_npi/batch",
+            {"json": {"npis": [str(1_700_000_000 + i * 20 + j) for j in range(20)]}})),
+        Scenario("cred.import_roster_1000", "POST", lambda i, rng, f: (
+            "/cred/credentials/import",
+            {"content": roster_csv(i, rng, f).encode(), "headers": {"Content-Type": "text/csv"}})),
+        Scenario("alert.create", "POST", lambda i, rng, f: (
+            "/alert/alerts",
+            {"json": {"provider_id": provider_id(rng, f), "severity": "info", "window_days": 30, "message": "bench"}})),
+        Scenario("alert.resolve", "POST", lambda i, rng, f: (
+            f"/alert/alerts/{f['open_alert_ids'][i % len(f['open_alert_ids'])]}/resolve",
+            {"json": {"resolution_note": "bench"}})),
+    ]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    if len(latencies) < 2:
+        value = round(latencies[0] * 1000, 2) if latencies else None
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50_ms": round(cuts[49] * 1000, 2), "p95_ms": round(cuts[94] * 1000, 2), "p99_ms": round(cuts[98] * 1000, 2)}
+
+
+async def _run_scenario(client: httpx.AsyncClient, scenario: Scenario, facts: Dict, requests: int, concurrency: int, seed: int) -> Dict:
+    rng = random.Random(f"{seed}:{scenario.name}")
+    if scenario.setup:
+        await scenario.setup(client, facts)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        path, kwargs = scenario.build(i, rng, facts)
+        async with semaphore:
+            start = time.perf_counter()
+            if scenario.stream:
+                async with client.stream(scenario.method, path, **kwargs) as response:
+                    async for _ in response.aiter_bytes():
+                        pass
+            else:
+                response = await client.request(scenario.method, path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": scenario.name,
+        "requests": requests,
+        "errors": errors,
+        **_percentiles(latencies),
+        "requests_per_sec": round(requests / elapsed, 1),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _change_seq(conn) -> tuple:
+    # (oldest readable ``since``, head) of the change log; datasets from
+    # before the change log have none
+    try:
+        oldest, head = conn.execute("SELECT MIN(seq), MAX(seq) FROM change_log").fetchone()
+    except sqlite3.OperationalError:
+        return 0, 0
+    return (oldest - 1, head) if head is not None else (0, 0)
+
+
+def _dataset_facts(path: str) -> Dict:
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            "change_seq": _change_seq(conn),
+            "providers": conn.execute("SELECT MAX(id) FROM providers").fetchone()[0],
+            "credentials": conn.execute("SELECT COUNT(*) FROM credentials").fetchone()[0],
+            "open_alert_ids": [r[0] for r in conn.execute(
+                "SELECT id FROM alerts WHERE resolved_at IS NULL ORDER BY id LIMIT 100000"
+            )],
+        }
+    finally:
+        conn.close()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> Dict:
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    # The backend reads its configuration at import time, so set it first
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("NPI_BACKEND", "remote")
+    from benchmarks.datagen import generate
+
+    generated = None
+    if not os.path.exists(db_path):
+        generated = generate(f"sqlite:///{db_path}", args.credentials, args.seed)
+    facts = _dataset_facts(db_path)
+
+    from credentialwatch_backend.modal_app import create_app
+    from credentialwatch_backend.nppes_client import nppes_client
+
+    main_app = create_app()
+
+    server = await MockNPPES(latency_ms=args.latency_ms).start()
+    nppes_client.base_url = server.url
+
+    results = []
+    transport = httpx.ASGITransport(app=main_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in _scenarios():
+            if args.only and not any(scenario.name.startswith(prefix) for prefix in args.only):
+                continue
+            results.append(await _run_scenario(client, scenario, facts, args.requests, args.concurrency, args.seed))
+
+    await nppes_client.aclose()
+    await server.stop()
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "database": db_path,
+            "dataset": {k: v for k, v in facts.items() if k != "open_alert_ids"},
+            "generated": generated,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "nppes_latency_ms": args.latency_ms,
+        },
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credentials", type=int, default=10_000, help="Dataset size when generating")
+    parser.add_argument("--db", help="Reuse this dataset if it exists, otherwise generate it here")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock NPPES latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="Scenario name prefixes to run, e.g. cred. alert.summary")
+    parser.add_argument("--out", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+    print(report)
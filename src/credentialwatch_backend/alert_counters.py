@@ -0,0 +1,102 @@
+"""
+Open-alert counters backing /alerts/summary.
+
+``alert_counters`` holds one row per (severity, provider_id) with the number
+of open alerts, plus a provider_id 0 row per severity for the totals. Writers
+adjust it in the same transaction as the alert change, so an unwindowed
+summary is a lookup rather than a scan of ``alerts``.
+
+``rebuild`` recomputes the table from ``alerts`` and reports any drift:
+
+    python -m credentialwatch_backend.alert_counters
+"""
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import change_versions
+from .db import SessionLocal
+from .models import Alert, AlertCounter
+
+ALL_PROVIDERS = 0
+
+
+def bump(db: Session, changes: Iterable[Tuple[str, int, int]]) -> None:
+    """
+    Apply ``(severity, provider_id, delta)`` changes to the per-provider and
+    total rows. Does not commit; callers commit with their alert writes.
+    """
+    totals: Counter = Counter()
+    for severity, provider_id, delta in changes:
+        totals[(severity, provider_id)] += delta
+        totals[(severity, ALL_PROVIDERS)] += delta
+    rows = [
+        {"severity": severity, "provider_id": provider_id, "open_count": delta}
+        for (severity, provider_id), delta in totals.items() if delta
+    ]
+    if not rows:
+        return
+    # Core insert on the table, as in change_versions
+    counters = AlertCounter.__table__
+    stmt = sqlite_insert(counters)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[counters.c.severity, counters.c.provider_id],
+        set_={"open_count": counters.c.open_count + stmt.excluded.open_count},
+    )
+    db.execute(stmt, rows)
+
+
+def open_counts(db: Session, provider_id: int = ALL_PROVIDERS) -> Dict[str, int]:
+    stmt = select(AlertCounter.severity, AlertCounter.open_count).where(
+        AlertCounter.provider_id == provider_id, AlertCounter.open_count > 0
+    )
+    return {severity: count for severity, count in db.execute(stmt).all()}
+
+
+def rebuild(db: Session) -> Dict[str, int]:
+    """
+    Recompute every counter from the open alerts and commit. Returns how many
+    counter rows were wrong, missing or stale.
+    """
+    current = {
+        (row.severity, row.provider_id): row.open_count
+        for row in db.execute(select(AlertCounter)).scalars()
+    }
+    actual: Counter = Counter()
+    stmt = (
+        select(Alert.severity, Alert.provider_id, func.count())
+        .where(Alert.resolved_at == None)
+        .group_by(Alert.severity, Alert.provider_id)
+    )
+    for severity, provider_id, count in db.execute(stmt).all():
+        actual[(severity, provider_id)] += count
+        actual[(severity, ALL_PROVIDERS)] += count
+
+    drift = sum(1 for key in set(current) | set(actual) if current.get(key, 0) != actual.get(key, 0))
+    db.execute(delete(AlertCounter))
+    if actual:
+        db.execute(sqlite_insert(AlertCounter), [
+            {"severity": severity, "provider_id": provider_id, "open_count": count}
+            for (severity, provider_id), count in actual.items()
+        ])
+    if drift:
+        # /alerts/summary answers change with the counters
+        change_versions.bump(db, change_versions.ALERTS)
+    db.commit()
+    return {"rows": len(actual), "drift": drift}
+
+
+def main() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return rebuild(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    stats = main()
+    print(f"Rebuilt {stats['rows']} alert counters; {stats['drift']} were out of date.")
@@ -1,17 +1,29 @@
 from datetime import datetime, timedelta
 from typing import List, Optional
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import select, and_
 
-from .db import get_db
+from . import alert_counters, change_versions, risk
+from .change_versions import ALERTS, CREDENTIALS
+from .db import get_read_db
+from .fast_json import FastJSONResponse, dumps, schema_columns, schema_dict
+from .metrics import TimedRoute
 from .models import Alert, Provider, Credential
+from .snapshot_cache import snapshot_cache
 from .schemas_alert import AlertCreate, AlertResponse, AlertResolve, AlertSummaryRequest
+from .streaming import negotiate_stream, stream_rows, STREAM_CHUNK_ROWS
+from .write_queue import WriteCoordinator, get_write_queue
 
 app = FastAPI(title="ALERT_API")
+app.router.route_class = TimedRoute
 
-@app.post("/alerts", response_model=AlertResponse)
-def create_alert(alert_in: AlertCreate, db: Session = Depends(get_db)):
+def _rescore_provider(db: Session, provider_id: int) -> None:
+    # Open alerts feed the provider's credential risk scores
+    if risk.rescore_providers(db, [provider_id]):
+        change_versions.bump(db, CREDENTIALS)
+
+def _create_alert(db: Session, alert_in: AlertCreate) -> AlertResponse:
     # Verify provider exists
     if not db.get(Provider, alert_in.provider_id):
         raise HTTPException(status_code=404, detail="Provider not found")
@@ -30,51 +42,96 @@ def create_alert(alert_in: AlertCreate, db: Session = Depends(get_db)):
         created_at=datetime.utcnow()
     )
     db.add(new_alert)
-    db.commit()
-    db.refresh(new_alert)
-    return new_alert
+    alert_counters.bump(db, [(new_alert.severity, new_alert.provider_id, 1)])
+    change_versions.bump(db, ALERTS)
+    _rescore_provider(db, new_alert.provider_id)
+    db.flush()
+    return AlertResponse.model_validate(new_alert)
+
+@app.post("/alerts", response_model=AlertResponse)
+async def create_alert(alert_in: AlertCreate, writes: WriteCoordinator = Depends(get_write_queue)):
+    # Committed together with whatever else is being written right now; see write_queue
+    alert = await writes.submit(lambda db: _create_alert(db, alert_in))
+    snapshot_cache.invalidate([alert.provider_id], alerts_only=True)
+    return alert
+
+ALERT_CSV_HEADER = list(AlertResponse.model_fields)
+ALERT_COLUMNS = schema_columns(Alert.__table__, AlertResponse)
 
 @app.get("/alerts/open", response_model=List[AlertResponse])
 def get_open_alerts(
+    request: Request,
+    response: Response,
     provider_id: Optional[int] = None,
     severity: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    stmt = select(Alert).where(Alert.resolved_at == None)
+    not_modified = change_versions.conditional(request, response, db, [ALERTS])
+    if not_modified:
+        return not_modified
+
+    # Core rows straight into response dicts; see fast_json
+    stmt = select(*ALERT_COLUMNS).where(Alert.resolved_at == None)
 
     if provider_id:
         stmt = stmt.where(Alert.provider_id == provider_id)
     if severity:
         stmt = stmt.where(Alert.severity == severity)
 
-    alerts = db.execute(stmt).scalars().all()
-    return alerts
+    stream_type = negotiate_stream(request)
+    if stream_type:
+        alerts = db.execute(stmt.order_by(Alert.id).execution_options(yield_per=STREAM_CHUNK_ROWS))
+        stream = stream_rows(
+            stream_type, alerts,
+            to_json=lambda alert: dumps(schema_dict(alert._mapping, AlertResponse)).decode(),
+            csv_header=ALERT_CSV_HEADER,
+            to_csv=lambda alert: list(alert),
+        )
+        stream.headers["ETag"] = response.headers["ETag"]
+        return stream
 
-@app.post("/alerts/{alert_id}/resolve", response_model=AlertResponse)
-def resolve_alert(alert_id: int, resolve_in: AlertResolve, db: Session = Depends(get_db)):
+    alerts = db.execute(stmt).all()
+    return FastJSONResponse.replacing(response, [schema_dict(alert._mapping, AlertResponse) for alert in alerts])
+
+def _resolve_alert(db: Session, alert_id: int, resolve_in: AlertResolve) -> AlertResponse:
     alert = db.get(Alert, alert_id)
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
 
+    if alert.resolved_at is None:
+        alert_counters.bump(db, [(alert.severity, alert.provider_id, -1)])
+        _rescore_provider(db, alert.provider_id)
     alert.resolved_at = datetime.utcnow()
     alert.resolution_note = resolve_in.resolution_note
-    db.commit()
-    db.refresh(alert)
+    change_versions.bump(db, ALERTS)
+    db.flush()
+    return AlertResponse.model_validate(alert)
+
+@app.post("/alerts/{alert_id}/resolve", response_model=AlertResponse)
+async def resolve_alert(alert_id: int, resolve_in: AlertResolve, writes: WriteCoordinator = Depends(get_write_queue)):
+    alert = await writes.submit(lambda db: _resolve_alert(db, alert_id, resolve_in))
+    snapshot_cache.invalidate([alert.provider_id], alerts_only=True)
     return alert
 
 @app.post("/alerts/summary")
-def get_alerts_summary(req: AlertSummaryRequest, db: Session = Depends(get_db)):
-    # Simple count by severity
-    # In real SQL we might do a group by
-    from sqlalchemy import func
+def get_alerts_summary(req: AlertSummaryRequest, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    # Counts of open alerts by severity
+    if not req.window_days:
+        not_modified = change_versions.conditional(request, response, db, [ALERTS])
+        if not_modified:
+            return not_modified
+        return alert_counters.open_counts(db)
 
-    stmt = select(Alert.severity, func.count(Alert.id)).where(Alert.resolved_at == None).group_by(Alert.severity)
-
-    # If window_days is provided, filter by created_at...
-    # (assuming window means "in the last X days"?)
-    if req.window_days:
-        start_date = datetime.utcnow() - timedelta(days=req.window_days)
-        stmt = stmt.where(Alert.created_at >= start_date)
+    # Alerts created in the last window_days: range scan per severity on
+    # ix_alerts_open_severity_created. The window slides with the clock, so
+    # these aren't given an ETag.
+    from sqlalchemy import func
 
+    start_date = datetime.utcnow() - timedelta(days=req.window_days)
+    stmt = (
+        select(Alert.severity, func.count())
+        .where(Alert.resolved_at == None, Alert.created_at >= start_date)
+        .group_by(Alert.severity)
+    )
     results = db.execute(stmt).all()
     return {severity: count for severity, count in results}
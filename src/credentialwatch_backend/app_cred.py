@@ -1,14 +1,33 @@
+import asyncio
+import base64
+import json
+import os
+import tempfile
 from datetime import datetime, date, timedelta
-from typing import List, Optional
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
+from typing import Dict, List, Literal, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, and_, or_, cast, func, tuple_, Integer
 
-from .db import get_db
-from .models import Provider, Credential
+from . import change_versions, provider_search, risk, roster_import
+from .change_versions import PROVIDERS, CREDENTIALS
+from .db import SQL_IN_CHUNK, get_db, get_read_db
+from .snapshot_cache import snapshot_cache
+from .histogram_cache import histogram_cache
+from .upserts import credential_upsert_statement
+from .fast_json import FastJSONResponse, dumps, schema_columns, schema_dict
+from .metrics import TimedRoute
+from .models import Provider, Credential, Alert, ChangeLogEntry
+from .schemas_alert import AlertResponse
+from .streaming import negotiate_stream, stream_rows, STREAM_CHUNK_ROWS
+from .write_queue import WriteCoordinator, get_write_queue
 from .schemas_cred import (
-    ProviderSyncRequest, ProviderResponse, CredentialCreateOrUpdate, CredentialResponse,
-    ExpiringCredentialsRequest, ExpiringCredentialResult, ProviderSnapshotRequest, ProviderSnapshotResponse
+    ProviderSyncRequest, ProviderResponse, ProviderBatchSyncRequest, ProviderBatchSyncResponse, ProviderSyncResult, CredentialCreateOrUpdate, CredentialResponse,
+    CredentialBulkUpsertRequest, CredentialBulkUpsertResponse, CredentialBulkUpsertError,
+    ExpiringCredentialsRequest, ExpiringCredentialResult, ExpiryHistogramResponse, ProviderSnapshotRequest, ProviderSnapshotResponse,
+    ChangeFeedResponse,
+    ProviderSnapshotBatchRequest, ProviderSnapshotBatchResponse, RosterImportResponse
 )
 # In a real microservice setup, we might call NPI_API via HTTP.
 # For simplicity/monolith within Modal, we can import the logic or assume the URL.
@@ -28,33 +47,31 @@ import httpx
 from .app_npi import get_provider as fetch_npi_data
 
 app = FastAPI(title="CRED_API")
+app.router.route_class = TimedRoute
 
-@app.post("/providers/sync_from_npi", response_model=ProviderResponse)
-async def sync_provider_from_npi(req: ProviderSyncRequest, db: Session = Depends(get_db)):
-    # 1. Check if provider exists
-    stmt = select(Provider).where(Provider.npi == req.npi)
-    provider = db.execute(stmt).scalars().first()
+# Max concurrent NPPES fetches for batch syncs (per request).
+NPI_SYNC_CONCURRENCY = int(os.getenv("NPI_SYNC_CONCURRENCY", "16"))
+NPI_SYNC_MAX_CONCURRENCY = int(os.getenv("NPI_SYNC_MAX_CONCURRENCY", "64"))
+# Rows per executemany round in /credentials/bulk_upsert
+BULK_UPSERT_CHUNK = 5000
+# Bytes of an uploaded roster buffered in memory per write to its spool file
+ROSTER_SPOOL_BUFFER_BYTES = 1024 * 1024
+# Page size for /credentials/expiring
+EXPIRING_DEFAULT_LIMIT = 100
+EXPIRING_MAX_LIMIT = 1000
+# Results per /providers/search call
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Max ids + NPIs per /providers/snapshot/batch call
+SNAPSHOT_BATCH_MAX = 500
+# Longest /credentials/expiry_histogram window
+EXPIRY_HISTOGRAM_MAX_DAYS = 3650
+# Entries per /changes page
+CHANGES_DEFAULT_LIMIT = 500
+CHANGES_MAX_LIMIT = 1000
 
-    # 2. Fetch data from NPI API (using our internal function logic directly)
-    try:
-        npi_data = await fetch_npi_data(req.npi)
-    except HTTPException as e:
-        if e.status_code == 404:
-             raise HTTPException(status_code=404, detail="NPI not found in registry")
-        raise e
-
-    # 3. Upsert
-    if not provider:
-        provider = Provider(
-            npi=req.npi,
-            full_name=npi_data.full_name,
-            # basic mapping
-            is_active=True
-        )
-        db.add(provider)
-    else:
-        provider.full_name = npi_data.full_name
-        # update other fields...
+def _apply_npi_data(provider: Provider, npi_data) -> None:
+    provider.full_name = npi_data.full_name
 
     # Extract location from addresses if possible
     # npi_data.addresses has list of ProviderAddress
@@ -66,63 +83,242 @@ async def sync_provider_from_npi(req: ProviderSyncRequest, db: Session = Depends
     # Extract specialty
     # npi_data.taxonomies
     primary_tax = next((t for t in npi_data.taxonomies if t.primary), None)
-    if primary_tax:
+    # The local NPPES index has codes only (desc None); keep what we have
+    if primary_tax and primary_tax.desc:
         provider.primary_specialty = primary_tax.desc
 
-    db.commit()
-    db.refresh(provider)
+def _upsert_from_npi(db: Session, npi: str, npi_data) -> ProviderResponse:
+    # 2. Check if provider exists
+    provider = db.execute(select(Provider).where(Provider.npi == npi)).scalars().first()
+
+    # 3. Upsert
+    if not provider:
+        provider = Provider(
+            npi=npi,
+            # basic mapping
+            is_active=True
+        )
+        db.add(provider)
+    _apply_npi_data(provider, npi_data)
+    change_versions.bump(db, PROVIDERS)
+    db.flush()
+    return ProviderResponse.model_validate(provider)
+
+@app.post("/providers/sync_from_npi", response_model=ProviderResponse)
+async def sync_provider_from_npi(req: ProviderSyncRequest, writes: WriteCoordinator = Depends(get_write_queue)):
+    # 1. Fetch data from NPI API (using our internal function logic directly).
+    # Done before queueing the write so the batch never waits on NPPES.
+    try:
+        npi_data = await fetch_npi_data(req.npi)
+    except HTTPException as e:
+        if e.status_code == 404:
+             raise HTTPException(status_code=404, detail="NPI not found in registry")
+        raise e
+
+    provider = await writes.submit(lambda db: _upsert_from_npi(db, req.npi, npi_data))
+    snapshot_cache.invalidate([provider.id], [req.npi])
     return provider
 
-@app.post("/credentials/add_or_update", response_model=CredentialResponse)
-def add_or_update_credential(cred: CredentialCreateOrUpdate, db: Session = Depends(get_db)):
+def _upsert_batch_from_npi(db: Session, npis: List[str], fetched) -> ProviderBatchSyncResponse:
+    # 1. Load all existing providers in a handful of IN queries
+    found = [npi for npi, (npi_data, _) in zip(npis, fetched) if npi_data is not None]
+    existing = {}
+    for i in range(0, len(found), SQL_IN_CHUNK):
+        stmt = select(Provider).where(Provider.npi.in_(found[i:i + SQL_IN_CHUNK]))
+        existing.update((p.npi, p) for p in db.execute(stmt).scalars())
+
+    # 2. Upsert them all in the one write
+    providers = {}
+    for npi, (npi_data, _) in zip(npis, fetched):
+        if npi_data is None:
+            continue
+        provider = existing.get(npi)
+        if provider is None:
+            provider = Provider(npi=npi, is_active=True)
+            db.add(provider)
+        _apply_npi_data(provider, npi_data)
+        providers[npi] = provider
+    db.flush()
+    if providers:
+        change_versions.bump(db, PROVIDERS)
+
+    results = []
+    for npi, (_, error) in zip(npis, fetched):
+        if npi in providers:
+            results.append(ProviderSyncResult(npi=npi, ok=True, provider=ProviderResponse.model_validate(providers[npi])))
+        else:
+            results.append(ProviderSyncResult(npi=npi, ok=False, error=error))
+    return ProviderBatchSyncResponse(synced=len(providers), failed=len(npis) - len(providers), results=results)
+
+@app.post("/providers/sync_from_npi/batch", response_model=ProviderBatchSyncResponse)
+async def sync_providers_from_npi_batch(req: ProviderBatchSyncRequest, writes: WriteCoordinator = Depends(get_write_queue)):
+    npis = list(dict.fromkeys(npi.strip() for npi in req.npis))
+    concurrency = max(1, min(req.concurrency or NPI_SYNC_CONCURRENCY, NPI_SYNC_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(npi: str):
+        async with semaphore:
+            try:
+                return await fetch_npi_data(npi), None
+            except HTTPException as e:
+                return None, "NPI not found in registry" if e.status_code == 404 else str(e.detail)
+
+    # Fetch everything from NPPES concurrently, bounded by the semaphore, then
+    # write through the single writer like every other write
+    fetched = await asyncio.gather(*(fetch(npi) for npi in npis))
+    response = await writes.submit(lambda db: _upsert_batch_from_npi(db, npis, fetched))
+    synced = [r.provider for r in response.results if r.ok]
+    snapshot_cache.invalidate([p.id for p in synced], [p.npi for p in synced])
+    return response
+
+def _add_or_update_credential(db: Session, cred: CredentialCreateOrUpdate) -> CredentialResponse:
     # Check if provider exists
     provider = db.get(Provider, cred.provider_id)
     if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
 
-    # Try to find existing credential by (provider_id, type, number)
-    stmt = select(Credential).where(
-        Credential.provider_id == cred.provider_id,
-        Credential.type == cred.type,
-        Credential.number == cred.number
-    )
-    existing_cred = db.execute(stmt).scalars().first()
-
-    status = "active" # Default logic
-    # simplistic status logic based on expiry
-    if cred.expiry_date and cred.expiry_date < date.today():
-        status = "expired"
-
-    if existing_cred:
-        existing_cred.issuer = cred.issuer
-        existing_cred.expiry_date = cred.expiry_date
-        existing_cred.status = status
-        existing_cred.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(existing_cred)
-        return existing_cred
-    else:
-        new_cred = Credential(
-            provider_id=cred.provider_id,
-            type=cred.type,
-            issuer=cred.issuer,
-            number=cred.number,
-            status=status,
-            expiry_date=cred.expiry_date,
-            issue_date=None, # Not in input
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
-        )
-        db.add(new_cred)
-        db.commit()
-        db.refresh(new_cred)
-        return new_cred
+    # Upsert by (provider_id, type, number); the unique index makes this safe
+    # against concurrent writers without a SELECT first.
+    stmt = credential_upsert_statement().returning(Credential.id)
+    cred_id = db.execute(stmt, cred.model_dump()).scalar_one()
+    risk.rescore_credentials(db, [cred_id])
+    change_versions.bump(db, CREDENTIALS)
+    # The upsert bypassed the identity map; don't answer with a stale copy
+    return CredentialResponse.model_validate(db.get(Credential, cred_id, populate_existing=True))
+
+@app.post("/credentials/add_or_update", response_model=CredentialResponse)
+async def add_or_update_credential(cred: CredentialCreateOrUpdate, writes: WriteCoordinator = Depends(get_write_queue)):
+    credential = await writes.submit(lambda db: _add_or_update_credential(db, cred))
+    snapshot_cache.invalidate([cred.provider_id])
+    return credential
+
+@app.post("/credentials/bulk_upsert", response_model=CredentialBulkUpsertResponse)
+def bulk_upsert_credentials(req: CredentialBulkUpsertRequest, db: Session = Depends(get_db)):
+    # 1. Resolve which providers exist in a few IN queries
+    provider_ids = list({c.provider_id for c in req.credentials})
+    known = set()
+    for i in range(0, len(provider_ids), SQL_IN_CHUNK):
+        chunk = provider_ids[i:i + SQL_IN_CHUNK]
+        known.update(db.execute(select(Provider.id).where(Provider.id.in_(chunk))).scalars())
+
+    rows, errors = [], []
+    for index, cred in enumerate(req.credentials):
+        if cred.provider_id in known:
+            rows.append(cred.model_dump())
+        else:
+            errors.append(CredentialBulkUpsertError(index=index, error="Provider not found"))
+
+    # 2. One statement, executemany'd in chunks, one transaction
+    stmt = credential_upsert_statement()
+    for i in range(0, len(rows), BULK_UPSERT_CHUNK):
+        db.execute(stmt, rows[i:i + BULK_UPSERT_CHUNK])
+    if rows:
+        risk.rescore_providers(db, {row["provider_id"] for row in rows})
+        change_versions.bump(db, CREDENTIALS)
+    db.commit()
+    snapshot_cache.invalidate({row["provider_id"] for row in rows})
+
+    return CredentialBulkUpsertResponse(upserted=len(rows), failed=len(errors), errors=errors)
+
+@app.post("/credentials/import", response_model=RosterImportResponse)
+async def import_roster(request: Request, db: Session = Depends(get_db)):
+    # Body is the raw roster: Content-Type text/csv or application/x-ndjson.
+    # It is spooled to a temp file as it arrives, then parsed and imported
+    # batch by batch off the event loop.
+    fmt = roster_import.detect_format(request.headers.get("content-type", ""))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send the roster as text/csv or application/x-ndjson")
+    with tempfile.TemporaryFile() as spool:
+        # Disk writes go to the threadpool too, a buffer at a time rather
+        # than per network chunk
+        buffered, size = [], 0
+        async for chunk in request.stream():
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= ROSTER_SPOOL_BUFFER_BYTES:
+                await run_in_threadpool(spool.write, b"".join(buffered))
+                buffered, size = [], 0
+        if buffered:
+            await run_in_threadpool(spool.write, b"".join(buffered))
+        await run_in_threadpool(spool.seek, 0)
+        return await run_in_threadpool(roster_import.import_roster, db, spool, fmt)
+
+def _encode_cursor(sort_key, cred_id: int) -> str:
+    # expiry: [expiry_date, id]; risk: ["risk", risk_score, id]
+    key = ["risk", sort_key] if not isinstance(sort_key, date) else [sort_key.isoformat()]
+    raw = json.dumps([*key, cred_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, sort: str = "expiry"):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+        # Anything but a list of the right length (e.g. an object) is invalid
+        if not isinstance(key, list):
+            raise ValueError(key)
+        if sort == "risk" and len(key) == 3 and key[0] == "risk":
+            return (None if key[1] is None else float(key[1])), int(key[2])
+        if sort == "expiry" and len(key) == 2:
+            return date.fromisoformat(key[0]), int(key[1])
+    except (ValueError, TypeError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+EXPIRING_CSV_HEADER = [
+    "provider_id", "npi", "full_name", "dept", "location",
+    "credential_id", "type", "issuer", "number", "status", "expiry_date",
+    "days_to_expiry", "risk_score",
+]
+
+# Core columns for the expiring-credentials rows, labelled provider_* / credential_*
+EXPIRING_PROVIDER_COLUMNS = schema_columns(Provider.__table__, ProviderResponse, "provider_")
+EXPIRING_CREDENTIAL_COLUMNS = schema_columns(Credential.__table__, CredentialResponse, "credential_")
+
+def _expiring_result(row) -> dict:
+    # Same shape and field order as ExpiringCredentialResult
+    m = row._mapping
+    return {
+        "provider": schema_dict(m, ProviderResponse, "provider_"),
+        "credential": schema_dict(m, CredentialResponse, "credential_"),
+        "days_to_expiry": m["days_to_expiry"],
+        "risk_score": m["risk_score"],
+    }
+
+def _expiring_csv_row(row) -> list:
+    return [
+        row.provider_id, row.provider_npi, row.provider_full_name, row.provider_dept, row.provider_location,
+        row.credential_id, row.credential_type, row.credential_issuer, row.credential_number,
+        row.credential_status, row.credential_expiry_date,
+        row.days_to_expiry, row.risk_score,
+    ]
 
 @app.post("/credentials/expiring", response_model=List[ExpiringCredentialResult])
-def get_expiring_credentials(req: ExpiringCredentialsRequest, db: Session = Depends(get_db)):
-    target_date = date.today() + timedelta(days=req.window_days)
+def get_expiring_credentials(req: ExpiringCredentialsRequest, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    today = date.today()
+    target_date = today + timedelta(days=req.window_days)
+    limit = max(1, min(req.limit or EXPIRING_DEFAULT_LIMIT, EXPIRING_MAX_LIMIT))
+    stream_type = negotiate_stream(request)
+
+    # days_to_expiry and the active/expired cut-off move with the date
+    not_modified = change_versions.conditional(
+        request, response, db, [PROVIDERS, CREDENTIALS], req.model_dump_json(), today
+    )
+    if not_modified:
+        return not_modified
 
-    stmt = select(Credential).join(Provider).where(
+    # One query: provider joined in, days computed by SQLite, risk precomputed
+    # (risk.py), rows walked in (expiry_date, id) order along
+    # ix_credentials_status_expiry, or (risk_score, id) descending along
+    # ix_credentials_status_risk. Plain Core rows, serialized without ORM
+    # objects or Pydantic models.
+    days_to_expiry = cast(func.julianday(Credential.expiry_date) - func.julianday(today.isoformat()), Integer)
+    risk_score = func.coalesce(Credential.risk_score, 0.0)
+
+    stmt = select(
+        *EXPIRING_PROVIDER_COLUMNS, *EXPIRING_CREDENTIAL_COLUMNS,
+        days_to_expiry.label("days_to_expiry"), risk_score.label("risk_score"),
+        Credential.risk_score.label("stored_risk_score"),  # NULL kept, for the cursor
+    ).select_from(Credential).join(Provider, Credential.provider_id == Provider.id).where(
         Credential.status == "active",
         Credential.expiry_date <= target_date,
         # Credential.expiry_date >= date.today() # Optional: do we show already expired? "expiry_date <= now + window" implies expired too
@@ -131,42 +327,316 @@ def get_expiring_credentials(req: ExpiringCredentialsRequest, db: Session = Depe
     if req.dept:
         stmt = stmt.where(Provider.dept == req.dept)
     if req.location:
-        # Simple contains match
-        stmt = stmt.where(Provider.location.contains(req.location))
+        # Word-prefix match through providers_fts rather than an unindexable LIKE '%...%'
+        location_ids = provider_search.matching_ids(req.location, "location")
+        if location_ids is None:
+            # e.g. ",,": dropping the filter would return every location
+            raise HTTPException(status_code=400, detail="location must contain at least one word")
+        stmt = stmt.where(Provider.id.in_(location_ids))
+    if req.min_risk is not None:
+        stmt = stmt.where(Credential.risk_score >= req.min_risk)
+    if req.cursor:
+        after_key, after_id = _decode_cursor(req.cursor, req.sort)
+        if req.sort == "expiry":
+            stmt = stmt.where(tuple_(Credential.expiry_date, Credential.id) > tuple_(after_key, after_id))
+        elif after_key is None:
+            # Not yet scored: those sort last, by id
+            stmt = stmt.where(Credential.risk_score.is_(None), Credential.id < after_id)
+        else:
+            stmt = stmt.where(or_(
+                tuple_(Credential.risk_score, Credential.id) < tuple_(after_key, after_id),
+                Credential.risk_score.is_(None),
+            ))
+
+    if req.sort == "expiry":
+        stmt = stmt.order_by(Credential.expiry_date, Credential.id)
+    else:
+        stmt = stmt.order_by(Credential.risk_score.desc(), Credential.id.desc())
+
+    if stream_type:
+        # Streaming reports return every row (or an explicit limit), read in chunks
+        if req.limit:
+            stmt = stmt.limit(req.limit)
+        rows = db.execute(stmt.execution_options(yield_per=STREAM_CHUNK_ROWS))
+        stream = stream_rows(
+            stream_type, rows,
+            to_json=lambda row: dumps(_expiring_result(row)).decode(),
+            csv_header=EXPIRING_CSV_HEADER,
+            to_csv=_expiring_csv_row,
+        )
+        stream.headers["ETag"] = response.headers["ETag"]
+        return stream
+
+    rows = db.execute(stmt.limit(limit + 1)).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        sort_key = last.credential_expiry_date if req.sort == "expiry" else last.stored_risk_score
+        response.headers["X-Next-Cursor"] = _encode_cursor(sort_key, last.credential_id)
+
+    # Rows are already in response_model's shape; skip re-validation
+    return FastJSONResponse.replacing(response, [_expiring_result(row) for row in rows])
+
+HISTOGRAM_GROUP_COLUMNS = {"dept": Provider.dept, "location": Provider.location, "type": Credential.type}
+
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+def _expiry_histogram(db: Session, bucket: str, group_by: Optional[str], start: date, end: date) -> dict:
+    # SQLite counts per (expiry_date, group) straight off the covering
+    # ix_credentials_status_expiry_type, in index order; rolling days up into
+    # weeks or months here is cheaper than grouping on date() expressions.
+    key = HISTOGRAM_GROUP_COLUMNS[group_by] if group_by else None
+    columns = [Credential.expiry_date] + ([key] if key is not None else [])
+    stmt = select(*columns, func.count()).where(
+        Credential.status == "active", Credential.expiry_date >= start, Credential.expiry_date <= end,
+    ).group_by(*columns)
+    if group_by in ("dept", "location"):
+        stmt = stmt.join(Provider, Credential.provider_id == Provider.id)
 
-    results = db.execute(stmt).scalars().all()
+    counts: Dict[date, Dict[Optional[str], int]] = {}
+    for row in db.execute(stmt):
+        groups = counts.setdefault(_bucket_start(row[0], bucket), {})
+        group = row[1] if key is not None else None
+        groups[group] = groups.get(group, 0) + row[-1]
 
-    output = []
-    for cred in results:
-        days = (cred.expiry_date - date.today()).days if cred.expiry_date else 0
-        risk = 1.0 if days < 30 else 0.5 # Dummy risk logic
+    buckets = []
+    current = _bucket_start(start, bucket)
+    while current <= end:
+        groups = counts.get(current, {})
+        ordered = sorted(groups.items(), key=lambda item: (-item[1], item[0] is None, item[0] or ""))
+        buckets.append({
+            "start": current,
+            "total": sum(groups.values()),
+            "groups": [{"key": k, "count": n} for k, n in ordered] if key is not None else [],
+        })
+        current = _next_bucket(current, bucket)
+    # Same shape and field order as ExpiryHistogramResponse
+    return {
+        "bucket": bucket,
+        "group_by": group_by,
+        "start": start,
+        "end": end,
+        "total": sum(b["total"] for b in buckets),
+        "buckets": buckets,
+    }
 
-        output.append(ExpiringCredentialResult(
-            provider=cred.provider,
-            credential=cred,
-            days_to_expiry=days,
-            risk_score=risk
-        ))
-    return output
+@app.get("/credentials/expiry_histogram", response_model=ExpiryHistogramResponse)
+def get_expiry_histogram(
+    request: Request,
+    response: Response,
+    bucket: Literal["day", "week", "month"] = "week",
+    group_by: Optional[Literal["dept", "location", "type"]] = None,
+    window_days: int = Query(365, ge=0, le=EXPIRY_HISTOGRAM_MAX_DAYS),
+    db: Session = Depends(get_read_db),
+):
+    # Active credentials expiring from today through today + window_days
+    today = date.today()
+    not_modified = change_versions.conditional(request, response, db, [PROVIDERS, CREDENTIALS], today)
+    if not_modified:
+        return not_modified
+    etag = response.headers["ETag"]
+
+    # Rendered histograms are cached by ETag (see histogram_cache)
+    body = histogram_cache.get(etag)
+    if body is None:
+        body = dumps(_expiry_histogram(db, bucket, group_by, today, today + timedelta(days=window_days)))
+        histogram_cache.put(etag, body)
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
 @app.post("/providers/snapshot", response_model=ProviderSnapshotResponse)
-def get_provider_snapshot(req: ProviderSnapshotRequest, db: Session = Depends(get_db)):
-    stmt = select(Provider)
-    if req.provider_id:
-        stmt = stmt.where(Provider.id == req.provider_id)
-    elif req.npi:
-        stmt = stmt.where(Provider.npi == req.npi)
-    else:
+def get_provider_snapshot(req: ProviderSnapshotRequest, request: Request, db: Session = Depends(get_read_db)):
+    if not req.provider_id and not req.npi:
         raise HTTPException(status_code=400, detail="Must provide provider_id or npi")
 
-    provider = db.execute(stmt).scalars().first()
-    if not provider:
-        raise HTTPException(status_code=404, detail="Provider not found")
+    # Hot providers are answered from memory; the session never connects
+    entry = snapshot_cache.get(provider_id=req.provider_id or None, npi=req.npi)
+    if entry is None:
+        generation = snapshot_cache.generation
+        stmt = select(Provider)
+        if req.provider_id:
+            stmt = stmt.where(Provider.id == req.provider_id)
+        else:
+            # Several providers can share an NPI; answer with the oldest, as the batch does
+            stmt = stmt.where(Provider.npi == req.npi).order_by(Provider.id)
+
+        provider = db.execute(stmt).scalars().first()
+        if not provider:
+            raise HTTPException(status_code=404, detail="Provider not found")
+
+        # Lazy load credentials
+        entry = snapshot_cache.put(generation, provider, provider.credentials, by_npi=not req.provider_id)
+
+    return snapshot_cache.respond(request, entry.snapshot_body())
+
+@app.post("/providers/snapshot/batch", response_model=ProviderSnapshotBatchResponse)
+def get_provider_snapshots(req: ProviderSnapshotBatchRequest, request: Request, db: Session = Depends(get_read_db)):
+    ids = list(dict.fromkeys(req.provider_ids))
+    npis = list(dict.fromkeys(req.npis))
+    if not ids and not npis:
+        raise HTTPException(status_code=400, detail="Must provide provider_ids or npis")
+    if len(ids) + len(npis) > SNAPSHOT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {SNAPSHOT_BATCH_MAX} providers per batch")
+
+    # Cached providers first; only the rest go to the database
+    entries = {}
+    found_npis = {}
+    for provider_id in ids:
+        entry = snapshot_cache.get(provider_id=provider_id, with_alerts=req.include_alerts)
+        if entry is not None:
+            entries[provider_id] = entry
+    for npi in npis:
+        entry = snapshot_cache.get(npi=npi, with_alerts=req.include_alerts)
+        if entry is not None:
+            entries[entry.provider_id] = found_npis[npi] = entry
+
+    missing_ids = [i for i in ids if i not in entries]
+    missing_npis = [n for n in npis if n not in found_npis]
+    if missing_ids or missing_npis:
+        generation = snapshot_cache.generation
+        # One query for the providers, one per relationship (selectinload batches
+        # the IN lists), instead of a lazy load per provider.
+        options = [selectinload(Provider.credentials)]
+        if req.include_alerts:
+            options.append(selectinload(Provider.alerts.and_(Alert.resolved_at == None)))
+        stmt = (
+            select(Provider)
+            .where(or_(Provider.id.in_(missing_ids), Provider.npi.in_(missing_npis)))
+            .order_by(Provider.id)
+            .options(*options)
+        )
+        for provider in db.execute(stmt).scalars():
+            by_npi = provider.npi in missing_npis and provider.npi not in found_npis
+            if provider.id not in missing_ids and not by_npi:
+                continue  # several providers share the NPI; keep the first one
+            entry = snapshot_cache.put(
+                generation, provider, provider.credentials,
+                open_alerts=provider.alerts if req.include_alerts else None, by_npi=by_npi,
+            )
+            entries[provider.id] = entry
+            if by_npi:
+                found_npis[provider.npi] = entry
+
+    # Assembled from the cached JSON pieces, in the shape of ProviderSnapshotBatchResponse
+    snapshots = b",".join(
+        b'"%d":%s' % (provider_id, entries[provider_id].batch_item_body(req.include_alerts))
+        for provider_id in sorted(entries)
+    )
+    body = b'{"snapshots":{%s},"missing_ids":%s,"missing_npis":%s}' % (
+        snapshots,
+        dumps([i for i in ids if i not in entries]),
+        dumps([n for n in npis if n not in found_npis]),
+    )
+    return snapshot_cache.respond(request, body)
+
+@app.get("/cache/stats")
+def get_snapshot_cache_stats():
+    return snapshot_cache.snapshot()
+
+@app.get("/cache/histogram_stats")
+def get_histogram_cache_stats():
+    return histogram_cache.snapshot()
+
+SEARCH_COLUMNS = schema_columns(Provider.__table__, ProviderResponse)
+
+# Current rows for /changes entries, per entity: (model, Core columns, response schema)
+CHANGE_ENTITIES = {
+    "provider": (Provider, schema_columns(Provider.__table__, ProviderResponse), ProviderResponse),
+    "credential": (Credential, schema_columns(Credential.__table__, CredentialResponse), CredentialResponse),
+    "alert": (Alert, schema_columns(Alert.__table__, AlertResponse), AlertResponse),
+}
+
+@app.get("/changes", response_model=ChangeFeedResponse)
+def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(CHANGES_DEFAULT_LIMIT, ge=0, le=CHANGES_MAX_LIMIT),
+    include_data: bool = True,
+    db: Session = Depends(get_read_db),
+):
+    # Entries after seq ``since``, oldest first, from the trigger-maintained
+    # change_log (see change_log.py). Each page is a primary-key range read,
+    # plus one IN query per entity type for the current rows.
+    oldest, head = db.execute(select(func.min(ChangeLogEntry.seq), func.max(ChangeLogEntry.seq))).one()
+    if oldest is not None and since < oldest - 1:
+        raise HTTPException(
+            status_code=410,
+            detail=f"Changes after {since} have been pruned; re-sync from a snapshot, then follow from head={head}",
+        )
+
+    log = ChangeLogEntry.__table__
+    entries = db.execute(select(log).where(log.c.seq > since).order_by(log.c.seq).limit(limit + 1)).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    current = {}
+    if include_data:
+        wanted: Dict[str, set] = {}
+        for entry in entries:
+            if entry.op != "delete":
+                wanted.setdefault(entry.entity, set()).add(entry.entity_id)
+        for entity, ids in wanted.items():
+            model, columns, schema = CHANGE_ENTITIES[entity]
+            ids = list(ids)
+            for i in range(0, len(ids), SQL_IN_CHUNK):
+                stmt = select(*columns).where(model.id.in_(ids[i:i + SQL_IN_CHUNK]))
+                for row in db.execute(stmt):
+                    current[entity, row.id] = schema_dict(row._mapping, schema)
+
+    # Same shape and field order as ChangeFeedResponse
+    return FastJSONResponse({
+        "changes": [
+            {
+                "seq": entry.seq, "entity": entry.entity, "id": entry.entity_id, "provider_id": entry.provider_id,
+                "op": entry.op, "changed_at": entry.changed_at, "data": current.get((entry.entity, entry.entity_id)),
+            }
+            for entry in entries
+        ],
+        "next_since": entries[-1].seq if entries else since,
+        "head": head or 0,
+        "has_more": has_more,
+    })
+
+@app.get("/providers/search", response_model=List[ProviderResponse])
+def search_providers(
+    request: Request,
+    response: Response,
+    q: str,
+    active_only: bool = True,
+    limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT),
+    db: Session = Depends(get_read_db),
+):
+    # Ranked full-text search over name, location, dept and specialty; every
+    # word in q must match the start of a word, e.g. "card bost" or "Zoe Sm".
+    expression = provider_search.match_expression(q)
+    if expression is None:
+        raise HTTPException(status_code=400, detail="q must contain at least one word")
 
-    # Lazy load credentials
-    creds = provider.credentials
+    not_modified = change_versions.conditional(request, response, db, [PROVIDERS])
+    if not_modified:
+        return not_modified
 
-    return ProviderSnapshotResponse(
-        provider=provider,
-        credentials=creds
+    fts = provider_search.providers_fts
+    stmt = (
+        select(*SEARCH_COLUMNS)
+        .select_from(Provider)
+        .join(fts, fts.c.rowid == Provider.id)
+        .where(provider_search.matches(expression))
+        .order_by(provider_search.rank(), Provider.id)
+        .limit(limit)
     )
+    if active_only:
+        stmt = stmt.where(Provider.is_active == True)
+    rows = db.execute(stmt).all()
+    return FastJSONResponse.replacing(response, [schema_dict(row._mapping, ProviderResponse) for row in rows])
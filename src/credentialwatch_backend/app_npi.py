@@ -1,12 +1,37 @@
+import json
+import os
 import httpx
 from fastapi import FastAPI, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+from .nppes_client import nppes_client, NPPES_VERSION
+from .npi_cache import npi_cache
+from .db import ReadSessionLocal
+from . import nppes_local
+from .metrics import TimedRoute
 from .schemas_npi import SearchProviderRequest, SearchProviderResponse, ProviderResult, ProviderAddress, ProviderDetail, ProviderTaxonomy
 
+# The pooled nppes_client opens lazily on first lookup. It is closed by the
+# combined app's lifespan (startup.lifespan); mounted sub-apps get no
+# lifespan events of their own.
 app = FastAPI(title="NPI_API")
+app.router.route_class = TimedRoute
 
-NPPES_API_URL = "https://npiregistry.cms.hhs.gov/api/"
-NPPES_VERSION = "2.1"
+# "remote" queries the live registry (through the cache); "local" answers from
+# the nppes_providers index loaded by nppes_local, with no network at all.
+NPI_BACKEND = os.getenv("NPI_BACKEND", "remote")
+
+def _local_lookup(params: dict) -> dict:
+    db = ReadSessionLocal()
+    try:
+        return nppes_local.lookup(db, params)
+    finally:
+        db.close()
+
+async def _registry_lookup(endpoint: str, key: str, params: dict) -> dict:
+    if NPI_BACKEND == "local":
+        return await run_in_threadpool(_local_lookup, params)
+    return await npi_cache.get_or_fetch(endpoint, key, lambda: nppes_client.fetch(params))
 
 def _map_address(addr_data: dict) -> ProviderAddress:
     return ProviderAddress(
@@ -42,12 +67,15 @@ async def search_providers(request: SearchProviderRequest):
     # or partial name search.
     # Actually, often users want to search by name.
 
-    if request.query.isdigit() and len(request.query) == 10:
-        params["number"] = request.query
+    # Normalize whitespace so equivalent searches share one in-flight request
+    query = " ".join(request.query.split())
+
+    if query.isdigit() and len(query) == 10:
+        params["number"] = query
     else:
         # If it has a space, assume first/last name
-        if " " in request.query:
-            parts = request.query.split(" ", 1)
+        if " " in query:
+            parts = query.split(" ", 1)
             params["first_name"] = parts[0]
             params["last_name"] = parts[1]
         else:
@@ -57,22 +85,19 @@ async def search_providers(request: SearchProviderRequest):
             # Or maybe try a broad search if possible?
             # NPPES doesn't have a generic "q" parameter.
             # Let's try setting last_name if it looks like a name.
-            params["last_name"] = request.query
+            params["last_name"] = query
             # Also could be organization_name
             # params["organization_name"] = request.query # Can't do both usually in one query simply
 
     if request.state:
-        params["state"] = request.state
+        params["state"] = request.state.strip().upper()
     if request.taxonomy:
-        params["taxonomy_description"] = request.taxonomy
+        params["taxonomy_description"] = " ".join(request.taxonomy.split())
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(NPPES_API_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=502, detail=f"NPPES API error: {str(e)}")
+    try:
+        data = await _registry_lookup("search", json.dumps(params, sort_keys=True), params)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"NPPES API error: {str(e)}")
 
     results = []
     if "results" in data:
@@ -113,13 +138,10 @@ async def get_provider(npi: str):
         "version": NPPES_VERSION,
         "number": npi
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(NPPES_API_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=502, detail=f"NPPES API error: {str(e)}")
+    try:
+        data = await _registry_lookup("provider", npi, params)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"NPPES API error: {str(e)}")
 
     if "results" not in data or not data["results"]:
         raise HTTPException(status_code=404, detail="Provider not found")
@@ -140,3 +162,7 @@ async def get_provider(npi: str):
         taxonomies=taxonomies,
         addresses=addresses
     )
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return npi_cache.snapshot()
@@ -0,0 +1,94 @@
+"""
+Change log: one row per mutation of a provider, credential or alert.
+
+SQLite triggers append to ``change_log`` on every insert, delete and update,
+in the writer's transaction, so no write path can forget to log. An update
+is logged only when a column clients see actually changed. No-op upserts
+and the risk scorer's ``risk_score`` writes don't add entries. An alert
+whose ``resolved_at`` gets set is logged as a ``resolve``.
+
+``seq`` is AUTOINCREMENT: it only grows and is never reused, even after
+pruning. That makes it the cursor for ``GET /cred/changes``. The triggers
+are created with the tables (metadata DDL events). ``ensure_triggers`` adds
+them to existing databases.
+"""
+import os
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy import MetaData, event, text
+from sqlalchemy.orm import Session
+
+CHANGE_LOG_TABLE = "change_log"
+# The sweeper prunes entries older than this (always keeping the newest)
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+
+# (table, entity name, provider id column, columns whose changes are logged)
+_TRACKED = [
+    ("providers", "provider", "id",
+     ("npi", "full_name", "dept", "location", "primary_specialty", "is_active")),
+    ("credentials", "credential", "provider_id",
+     ("provider_id", "type", "issuer", "number", "status", "issue_date", "expiry_date", "last_verified_at", "metadata_json")),
+    ("alerts", "alert", "provider_id",
+     ("provider_id", "credential_id", "severity", "window_days", "message", "channel", "resolved_at", "resolution_note")),
+]
+
+# Same text format SQLAlchemy's DateTime stores (microseconds, UTC)
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+
+def _log(entity: str, row: str, provider_column: str, op: str) -> str:
+    return (
+        f"INSERT INTO {CHANGE_LOG_TABLE} (entity, entity_id, provider_id, op, changed_at) "
+        f"VALUES ('{entity}', {row}.id, {row}.{provider_column}, {op}, {_NOW});"
+    )
+
+
+def _triggers(table: str, entity: str, provider_column: str, columns: Sequence[str]):
+    changed = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+    update_op = "'update'"
+    if table == "alerts":
+        update_op = "CASE WHEN old.resolved_at IS NULL AND new.resolved_at IS NOT NULL THEN 'resolve' ELSE 'update' END"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS change_log_{table}_ai AFTER INSERT ON {table} BEGIN
+            {_log(entity, "new", provider_column, "'insert'")}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS change_log_{table}_au AFTER UPDATE ON {table} WHEN {changed} BEGIN
+            {_log(entity, "new", provider_column, update_op)}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS change_log_{table}_ad AFTER DELETE ON {table} BEGIN
+            {_log(entity, "old", provider_column, "'delete'")}
+        END""",
+    ]
+
+
+_CREATE = [ddl for tracked in _TRACKED for ddl in _triggers(*tracked)]
+
+
+def ensure_triggers(conn) -> None:
+    """Create the logging triggers if missing. Existing rows aren't back-filled."""
+    if conn.dialect.name != "sqlite":
+        return
+    for ddl in _CREATE:
+        conn.execute(text(ddl))
+
+
+def prune(db: Session, before: datetime) -> int:
+    """
+    Delete entries logged before ``before``, always keeping the newest so
+    the feed still knows where it is. Doesn't commit.
+    """
+    # seq and changed_at grow together: walk from the oldest entry to the first
+    # one to keep, rather than scanning the whole log for old timestamps
+    return db.execute(text(f"""
+        DELETE FROM {CHANGE_LOG_TABLE}
+        WHERE seq < coalesce(
+            (SELECT seq FROM {CHANGE_LOG_TABLE} WHERE changed_at >= :before ORDER BY seq LIMIT 1),
+            (SELECT max(seq) FROM {CHANGE_LOG_TABLE})
+        )
+    """), {"before": before.isoformat(" ")}).rowcount
+
+
+def attach(metadata: MetaData) -> None:
+    # After the whole metadata: the triggers need the log and all three tables
+    event.listen(metadata, "after_create", lambda target, conn, **kw: ensure_triggers(conn))
@@ -0,0 +1,94 @@
+"""
+Per-table change versions for conditional GETs.
+
+Every write path bumps the version of the tables it touched, in the same
+transaction as the write. Read endpoints hash those versions together with
+the request into a strong ETag, and when it matches ``If-None-Match`` they
+answer ``304 Not Modified`` without running their query.
+"""
+import hashlib
+from typing import Any, Dict, Optional, Sequence
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models import ChangeVersion
+
+PROVIDERS = "providers"
+CREDENTIALS = "credentials"
+ALERTS = "alerts"
+
+
+def _bump_statement():
+    # On the table: a parameter list then skips the ORM's bulk-insert layer,
+    # which costs more than the statement itself on every write
+    versions = ChangeVersion.__table__
+    stmt = sqlite_insert(versions)
+    return stmt.on_conflict_do_update(
+        index_elements=[versions.c.table_name],
+        set_={"version": versions.c.version + 1},
+    )
+
+
+def bump(db: Session, *tables: str) -> None:
+    """Increment the versions of ``tables``; commits with the caller's transaction."""
+    db.execute(_bump_statement(), [{"table_name": t, "version": 1} for t in tables])
+
+
+def versions(db: Session, tables: Sequence[str]) -> Dict[str, int]:
+    stmt = select(ChangeVersion.table_name, ChangeVersion.version).where(ChangeVersion.table_name.in_(tables))
+    found = dict(db.execute(stmt).all())
+    return {t: found.get(t, 0) for t in tables}
+
+
+def make_etag(table_versions: Dict[str, int], *parts: Any) -> str:
+    digest = hashlib.sha1(repr((sorted(table_versions.items()), parts)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def conditional(
+    request: Request,
+    response: Response,
+    db: Session,
+    tables: Sequence[str],
+    *params: Any,
+) -> Optional[Response]:
+    """
+    Compute the ETag for this request and set it on ``response``. Returns a
+    304 response to send instead when the client's copy is current.
+
+    Call it before the endpoint's own query. Versions read first can only
+    be older than the data, so at worst a write in between costs the client
+    one extra full response; a 304 is never sent for changed data.
+    ``params`` must cover everything else the response depends on.
+    """
+    etag = make_etag(
+        versions(db, tables),
+        request.url.path,
+        request.url.query,
+        request.headers.get("accept", ""),
+        *params,
+    )
+    not_modified = if_none_match(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers["ETag"] = etag
+    return None
+
+
+def if_none_match(request: Request, etag: str) -> Optional[Response]:
+    """The 304 to send if the client's copy has ``etag``, else None."""
+    if _matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
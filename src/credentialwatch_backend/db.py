@@ -1,17 +1,92 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from . import diagnostics
+
 # Default to local file for dev, but can be overridden.
 # Modal volume path would be /data/credentialwatch.db
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./credentialwatch.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}  # Needed for SQLite
-)
+# Connection PRAGMAs per profile. "default" leaves SQLite's own defaults
+# (rollback journal, full fsync, no busy timeout); "performance" is what we
+# run in production. Any single PRAGMA can be overridden with SQLITE_<NAME>,
+# e.g. SQLITE_MMAP_SIZE=0.
+SQLITE_PROFILES = {
+    "default": {},
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # negative = KiB, i.e. 64 MiB
+        "temp_store": "MEMORY",
+    },
+}
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+# Keep IN (...) lists well under SQLite's bound-parameter limit.
+SQL_IN_CHUNK = 500
+
+def sqlite_pragmas(profile: str = SQLITE_PROFILE) -> dict:
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in SQLITE_PROFILES["performance"]:
+        override = os.getenv(f"SQLITE_{name.upper()}")
+        if override is not None:
+            pragmas[name] = override
+    return pragmas
+
+def _is_memory(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+def _pool_args(url: str, size: int) -> dict:
+    # In-memory SQLite uses a singleton/static pool that takes no sizing
+    return {} if _is_memory(url) else {"pool_size": size, "max_overflow": 0}
+
+def _on_connect(pragmas: dict, read_only: bool):
+    def apply(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=1")
+        cursor.close()
+    return apply
+
+def create_sqlite_engine(url: str, profile: str = SQLITE_PROFILE, read_only: bool = False, **kwargs):
+    """
+    Engine with the profile's PRAGMAs applied to every new connection.
+    ``read_only`` connections also set ``query_only`` so a read pool can
+    never take the write lock.
+    """
+    kwargs.setdefault("connect_args", {"check_same_thread": False})  # Needed for SQLite
+    eng = create_engine(url, **kwargs)
+    if url.startswith("sqlite"):
+        event.listen(eng, "connect", _on_connect(sqlite_pragmas(profile), read_only))
+    return eng
+
+# SQLite allows one writer at a time, so writes go through a single pooled
+# connection and queue in the pool instead of fighting over the file lock.
+# Reads use their own pool; under WAL they run alongside the writer.
+# This is the only writer in the process: async handlers hand their writes
+# to write_queue, which runs them here. Other processes (the sweeper cron,
+# CLI imports, other containers) still contend for the file lock and wait
+# up to busy_timeout for it.
+engine = create_sqlite_engine(DATABASE_URL, **_pool_args(DATABASE_URL, 1))
+
+if _is_memory(DATABASE_URL):
+    # A second engine would open a second, empty in-memory database
+    read_engine = engine
+else:
+    read_engine = create_sqlite_engine(DATABASE_URL, read_only=True, **_pool_args(DATABASE_URL, SQLITE_READ_POOL_SIZE))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# DB_DIAGNOSTICS=1: slow-query log with plans, full-scan and N+1 warnings
+if diagnostics.DB_DIAGNOSTICS:
+    diagnostics.enable(engine, read_engine)
 
 Base = declarative_base()
 
@@ -21,3 +96,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
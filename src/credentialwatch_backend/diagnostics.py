@@ -0,0 +1,190 @@
+"""
+Opt-in query diagnostics (DB_DIAGNOSTICS=1).
+
+When enabled on an engine, every query is timed, and each distinct statement
+is run through EXPLAIN QUERY PLAN once. Findings go to the
+``credentialwatch_backend.diagnostics`` logger:
+- queries slower than SLOW_QUERY_MS, with their plan
+- statements whose plan scans a whole table
+- statements repeated N_PLUS_ONE_THRESHOLD or more times within one request
+  (an N+1: a lazy load or a per-row query in a loop). Requests are scoped by
+  ``DiagnosticsMiddleware``, or by ``request_scope`` outside the apps.
+
+EXPLAIN runs on a separate cursor of the same connection, so costs show up
+only in diagnostics mode. ``count_queries`` and ``assert_max_queries`` don't
+need the mode; tests use them to pin each endpoint's query count.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DB_DIAGNOSTICS = os.getenv("DB_DIAGNOSTICS", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+# Scanning a table ANALYZE says is this small is the right plan, not a finding
+FULL_SCAN_MIN_ROWS = int(os.getenv("FULL_SCAN_MIN_ROWS", "1000"))
+
+# Distinct statements whose plans are kept; expanding IN lists make many
+_PLAN_CACHE_MAX = 2048
+_plans: Dict[str, List[str]] = {}
+
+# "SCAN credentials" is a full scan; "SCAN ... USING INDEX", virtual tables
+# (FTS), subqueries and constant rows are not
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!\()(?!.*\bUSING\b)(?!.*VIRTUAL TABLE)(\w+)")
+
+_request_statements: ContextVar[Optional[Counter]] = ContextVar("request_statements", default=None)
+
+
+def _first_parameters(parameters, executemany: bool):
+    if executemany:
+        return parameters[0] if parameters else ()
+    return parameters
+
+
+def _raw_query(conn, sql: str, parameters=()) -> Optional[list]:
+    # A separate DB-API cursor: the statement's own cursor may still hold rows,
+    # and going through SQLAlchemy would fire these events again
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(sql, parameters)
+        return cursor.fetchall()
+    except Exception as e:  # e.g. statements EXPLAIN doesn't accept, no sqlite_stat1
+        logger.debug("Diagnostics query failed for %s: %s", sql, e)
+        return None
+    finally:
+        cursor.close()
+
+
+def explain(conn, statement: str, parameters=()) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for ``statement``; empty if SQLite can't explain it."""
+    rows = _raw_query(conn, f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [row[3] for row in rows or ()]
+
+
+def _estimated_rows(conn, table: str) -> Optional[int]:
+    """Row count from ANALYZE statistics, if there are any for ``table``."""
+    rows = _raw_query(conn, "SELECT stat FROM sqlite_stat1 WHERE tbl = ?", (table,))
+    counts = [int(stat.split()[0]) for (stat,) in rows or () if stat]
+    return max(counts) if counts else None
+
+
+def full_scans(conn, plan: List[str]) -> List[str]:
+    scans = []
+    for line in plan:
+        match = _FULL_SCAN.match(line)
+        if match:
+            rows = _estimated_rows(conn, match.group(1))
+            if rows is None or rows >= FULL_SCAN_MIN_ROWS:
+                scans.append(line if rows is None else f"{line}, ~{rows} rows")
+    return scans
+
+
+def _plan_for(conn, statement: str, parameters, executemany: bool) -> List[str]:
+    plan = _plans.get(statement)
+    if plan is None:
+        plan = explain(conn, statement, _first_parameters(parameters, executemany))
+        if len(_plans) < _PLAN_CACHE_MAX:
+            _plans[statement] = plan
+            scans = full_scans(conn, plan)
+            if scans:
+                logger.warning("Full table scan (%s): %s", "; ".join(scans), statement)
+    return plan
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["diagnostics_query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("diagnostics_query_start", None)
+    if start is None or statement.startswith("PRAGMA"):
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    seen = _request_statements.get()
+    if seen is not None:
+        seen[statement] += 1
+    plan = _plan_for(conn, statement, parameters, executemany)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s\n  plan: %s", elapsed_ms, statement, " | ".join(plan) or "(none)"
+        )
+
+
+def enable(*engines: Engine) -> None:
+    for eng in engines:
+        if not event.contains(eng, "after_cursor_execute", _after_cursor_execute):
+            event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+            event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+
+
+def disable(*engines: Engine) -> None:
+    for eng in engines:
+        if event.contains(eng, "after_cursor_execute", _after_cursor_execute):
+            event.remove(eng, "before_cursor_execute", _before_cursor_execute)
+            event.remove(eng, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def request_scope(name: str) -> Iterator[Counter]:
+    """Count statements run inside the block and log any repeated N+1-style."""
+    seen: Counter = Counter()
+    token = _request_statements.set(seen)
+    try:
+        yield seen
+    finally:
+        _request_statements.reset(token)
+        for statement, count in seen.items():
+            if count >= N_PLUS_ONE_THRESHOLD:
+                logger.warning("Possible N+1 in %s: %d x %s", name, count, statement)
+
+
+class DiagnosticsMiddleware:
+    """Scopes N+1 detection to each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with request_scope(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
+
+
+@contextmanager
+def count_queries() -> Iterator[List[str]]:
+    """Collect the SQL of every statement any engine runs inside the block."""
+    statements: List[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[List[str]]:
+    """
+    Fail if the block runs more than ``limit`` statements, listing them.
+    For tests: ``with assert_max_queries(3): client.post(...)``.
+    """
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > limit:
+        listing = "\n".join(f"  {i}. {s}" for i, s in enumerate(statements, 1))
+        raise AssertionError(f"{len(statements)} queries, expected at most {limit}:\n{listing}")
@@ -0,0 +1,68 @@
+"""
+In-process cache of rendered ``/credentials/expiry_histogram`` responses.
+
+Entries are keyed by the response's ETag. The ETag hashes the providers and
+credentials versions, the query string and today's date, so any provider or
+credential write (from any process) moves requests on to a new key and
+nothing needs invalidating; superseded entries just age out. At most
+EXPIRY_HISTOGRAM_CACHE_ENTRIES bodies are kept, least recently used evicted
+first.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from . import metrics
+
+EXPIRY_HISTOGRAM_CACHE_ENTRIES = int(os.getenv("EXPIRY_HISTOGRAM_CACHE_ENTRIES", "256"))
+
+
+class HistogramCache:
+    def __init__(self, max_entries: int = EXPIRY_HISTOGRAM_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        # Sync handlers run in the threadpool
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            metrics.HISTOGRAM_CACHE_ENTRIES.set(0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is None:
+                self.stats["misses"] += 1
+                metrics.HISTOGRAM_CACHE_LOOKUPS.inc(1.0, "miss")
+                return None
+            self._entries.move_to_end(etag)
+            self.stats["hits"] += 1
+            metrics.HISTOGRAM_CACHE_LOOKUPS.inc(1.0, "hit")
+            return body
+
+    def put(self, etag: str, body: bytes) -> None:
+        with self._lock:
+            self._entries[etag] = body
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            metrics.HISTOGRAM_CACHE_ENTRIES.set(len(self._entries))
+
+
+histogram_cache = HistogramCache()
@@ -1,9 +1,79 @@
 from datetime import datetime, date, timedelta
+from sqlalchemy import inspect, text
 from .db import engine, Base, SessionLocal
+from . import alert_counters, change_versions, provider_search, risk
 from .models import Provider, Credential, Alert
 
+def dedupe_credentials():
+    # Databases created before uq_credentials_provider_type_number may hold
+    # duplicate (provider_id, type, number) rows. Keep the newest row of each
+    # group, repoint alerts at it, and drop the rest so the index can build.
+    with engine.begin() as conn:
+        has_index = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_credentials_provider_type_number'"
+        )).first()
+        if has_index:
+            return
+        conn.execute(text("""
+            CREATE TEMP TABLE credential_dupes AS
+            SELECT c.id AS dup_id, g.keep_id
+            FROM credentials c
+            JOIN (
+                SELECT provider_id, type, number, MAX(id) AS keep_id
+                FROM credentials
+                GROUP BY provider_id, type, number
+                HAVING COUNT(*) > 1
+            ) g ON c.provider_id = g.provider_id AND c.type = g.type AND c.number = g.number
+            WHERE c.id != g.keep_id
+        """))
+        conn.execute(text("""
+            UPDATE alerts SET credential_id = (
+                SELECT keep_id FROM credential_dupes WHERE dup_id = alerts.credential_id
+            )
+            WHERE credential_id IN (SELECT dup_id FROM credential_dupes)
+        """))
+        conn.execute(text("DELETE FROM credentials WHERE id IN (SELECT dup_id FROM credential_dupes)"))
+        conn.execute(text("DROP TABLE credential_dupes"))
+
+def add_missing_columns():
+    # create_all never alters existing tables; add nullable columns introduced
+    # since the database was created (their indexes are created below).
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    col_type = column.type.compile(dialect=conn.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
 def create_all():
+    with engine.connect() as conn:
+        had_counters = inspect(conn).has_table("alert_counters")
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    dedupe_credentials()
+    # create_all skips tables that already exist, so indexes added to an
+    # existing table later on are created here.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        # Likewise the providers FTS index (built from existing rows if new)
+        provider_search.ensure_index(conn)
+    with engine.begin() as conn:
+        # Planner statistics; lets SQLite skip-scan the low-cardinality severity column
+        conn.execute(text("ANALYZE alerts"))
+    if not had_counters:
+        # Existing alerts predate the counter table
+        with SessionLocal() as db:
+            alert_counters.rebuild(db)
+    with SessionLocal() as db:
+        # Credentials from before risk_score, or written by older code
+        risk.rescore(db, Credential.risk_score.is_(None))
+        db.commit()
 
 def seed_data():
     db = SessionLocal()
@@ -80,6 +150,9 @@ def seed_data():
     )
 
     db.add(a1)
+    alert_counters.bump(db, [(a1.severity, a1.provider_id, 1)])
+    risk.rescore(db)
+    change_versions.bump(db, change_versions.PROVIDERS, change_versions.CREDENTIALS, change_versions.ALERTS)
     db.commit()
     db.close()
     print("Seeded demo data.")
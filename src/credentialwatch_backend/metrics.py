@@ -0,0 +1,341 @@
+"""
+Per-request performance metrics.
+
+``MetricsMiddleware`` (installed on the combined app by ``instrument``) times
+every request and keeps a ``RequestTimings`` for it in a context variable.
+Work done on behalf of the request adds to it:
+- SQLAlchemy cursor events add query counts and time, for every engine,
+  sync or async.
+- The NPPES client adds the time spent waiting on the registry.
+- Routes built with ``TimedRoute`` mark when the endpoint returned, so
+  FastAPI's validation and serialization can be told apart from the
+  handler. ``FastJSONResponse`` adds its own encoding time.
+
+The breakdown goes out in a ``Server-Timing`` header. Per-route totals and
+latency histograms are served in Prometheus text format on ``/metrics``.
+Recording is a few ``perf_counter`` calls and dict updates per request or
+query; there is no sampling and nothing leaves the process until scraped.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metric updates come from the event loop and from threadpool workers
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {value!r}" for labels, value in items)
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        with _lock:
+            self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with _lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {value!r}" for labels, value in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = 'le="%s"' % (bound if isinstance(bound, str) else repr(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency, to the last body byte.", ("method", "route"))
+HTTP_DB_SECONDS = Counter("http_request_db_seconds_total", "Time in database queries on behalf of requests.", ("route",))
+HTTP_DB_QUERIES = Counter("http_request_db_queries_total", "Database queries run on behalf of requests.", ("route",))
+HTTP_UPSTREAM_SECONDS = Counter(
+    "http_request_upstream_seconds_total", "Time requests spent waiting on upstream APIs.", ("route",)
+)
+HTTP_SERIALIZE_SECONDS = Counter(
+    "http_request_serialize_seconds_total", "Time spent validating and encoding response bodies.", ("route",)
+)
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Latency of every database query.", buckets=QUERY_BUCKETS)
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total", "Upstream API calls by outcome (2xx, 4xx, 5xx, timeout, error).", ("service", "outcome")
+)
+UPSTREAM_DURATION = Histogram("upstream_request_duration_seconds", "Upstream API call latency.", ("service",))
+WRITE_BATCH_SIZE = Histogram(
+    "db_write_batch_size", "Writes per group commit of the write queue.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+SNAPSHOT_CACHE_LOOKUPS = Counter("snapshot_cache_lookups_total", "Provider snapshot cache lookups.", ("result",))
+SNAPSHOT_CACHE_BYTES = Gauge("snapshot_cache_bytes", "Encoded JSON held by the provider snapshot cache.")
+SNAPSHOT_CACHE_ENTRIES = Gauge("snapshot_cache_entries", "Providers in the snapshot cache.")
+HISTOGRAM_CACHE_LOOKUPS = Counter("histogram_cache_lookups_total", "Expiry histogram cache lookups.", ("result",))
+HISTOGRAM_CACHE_ENTRIES = Gauge("histogram_cache_entries", "Rendered expiry histograms in the cache.")
+
+REGISTRY = [
+    HTTP_REQUESTS, HTTP_DURATION, HTTP_DB_SECONDS, HTTP_DB_QUERIES, HTTP_UPSTREAM_SECONDS, HTTP_SERIALIZE_SECONDS,
+    DB_QUERY_DURATION, UPSTREAM_REQUESTS, UPSTREAM_DURATION, WRITE_BATCH_SIZE,
+    SNAPSHOT_CACHE_LOOKUPS, SNAPSHOT_CACHE_BYTES, SNAPSHOT_CACHE_ENTRIES,
+    HISTOGRAM_CACHE_LOOKUPS, HISTOGRAM_CACHE_ENTRIES,
+]
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class RequestTimings:
+    __slots__ = ("db_seconds", "db_queries", "upstream_seconds", "serialize_seconds", "endpoint_done", "_waiting", "_waiting_since")
+
+    def __init__(self):
+        self.db_seconds = self.upstream_seconds = self.serialize_seconds = 0.0
+        self.db_queries = 0
+        self.endpoint_done: Optional[float] = None
+        self._waiting = 0
+        self._waiting_since = 0.0
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.db_queries} queries", '
+            f"upstream;dur={self.upstream_seconds * 1000:.2f}, "
+            f"serialize;dur={self.serialize_seconds * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def add_serialize(seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.serialize_seconds += seconds
+
+
+@contextmanager
+def upstream_wait() -> Iterator[None]:
+    """
+    Time the current request spends waiting on an upstream call. Overlapping
+    waits (a batch sync fanning out) count once, as wall-clock time.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    if timings._waiting == 0:
+        timings._waiting_since = time.perf_counter()
+    timings._waiting += 1
+    try:
+        yield
+    finally:
+        timings._waiting -= 1
+        if timings._waiting == 0:
+            timings.upstream_seconds += time.perf_counter() - timings._waiting_since
+
+
+def observe_upstream(service: str, seconds: float, outcome: str) -> None:
+    UPSTREAM_REQUESTS.inc(1.0, service, outcome)
+    UPSTREAM_DURATION.observe(seconds, service)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # A connection runs one statement at a time, so one slot is enough
+    conn.info["metrics_query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("metrics_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    DB_QUERY_DURATION.observe(elapsed)
+    timings = _current.get()
+    if timings is not None:
+        timings.db_seconds += elapsed
+        timings.db_queries += 1
+
+
+def _mark_endpoint_done() -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.endpoint_done = time.perf_counter()
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute that records when its endpoint returns. Anything between that
+    and the response starting is FastAPI validating and serializing the
+    return value. Set as ``app.router.route_class`` before declaring routes.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed(*args, **kw):
+                try:
+                    return await endpoint(*args, **kw)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @functools.wraps(endpoint)
+            def timed(*args, **kw):
+                try:
+                    return endpoint(*args, **kw)
+                finally:
+                    _mark_endpoint_done()
+        super().__init__(path, timed, **kwargs)
+
+
+def _route_label(scope: dict, root_path: str) -> str:
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        # Unmatched paths would make one series per URL
+        return "unmatched"
+    # Mounts extend root_path ("/cred"); the route's template is relative to it
+    return scope.get("root_path", "")[len(root_path):] + path_format
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: no extra task or body buffering, so streaming is unaffected."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        root_path = scope.get("root_path", "")
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                now = time.perf_counter()
+                if timings.endpoint_done is not None:
+                    timings.serialize_seconds += now - timings.endpoint_done
+                header = timings.server_timing(now - start).encode("latin-1")
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            route = _route_label(scope, root_path)
+            HTTP_REQUESTS.inc(1.0, scope["method"], route, str(status))
+            HTTP_DURATION.observe(elapsed, scope["method"], route)
+            HTTP_DB_SECONDS.inc(timings.db_seconds, route)
+            HTTP_DB_QUERIES.inc(timings.db_queries, route)
+            HTTP_UPSTREAM_SECONDS.inc(timings.upstream_seconds, route)
+            HTTP_SERIALIZE_SECONDS.inc(timings.serialize_seconds, route)
+
+
+async def metrics_endpoint(request) -> Response:
+    return Response(render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def instrument(app: FastAPI) -> None:
+    """Add the middleware and ``/metrics`` to ``app``, and start timing queries on every engine."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_middleware(MetricsMiddleware)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
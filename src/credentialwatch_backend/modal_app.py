@@ -2,33 +2,49 @@ import modal
 import os
 from fastapi import FastAPI
 
-# Define the image
+# Define the image. Keep these lower bounds in step with pyproject.toml;
+# streaming responses rely on FastAPI >= 0.118 dependency lifetimes.
 image = modal.Image.debian_slim().pip_install(
-    "fastapi",
-    "sqlalchemy",
-    "uvicorn",
-    "httpx",
-    "pydantic"
+    "fastapi>=0.118.0",
+    "sqlalchemy>=2.0.0",
+    "uvicorn>=0.23.0",
+    "httpx>=0.24.0",
+    "pydantic>=2.0.0",
+    "orjson>=3.8.0",
+    "numpy>=1.24.0"
 ).env({"DATABASE_URL": "sqlite:////data/credentialwatch.db"})
 
 app = modal.App("credentialwatch-backend")
 volume = modal.Volume.from_name("credentialwatch-data", create_if_missing=True)
 
+def create_app() -> FastAPI:
+    from . import diagnostics, metrics
+    from .startup import LazyApp, lifespan
+
+    # Each sub-app (and its models, schemas and routes) is imported on the
+    # first request under its prefix, or by the background warm-up.
+    sub_apps = {
+        "/cred": LazyApp(".app_cred:app", __package__),
+        "/npi": LazyApp(".app_npi:app", __package__),
+        "/alert": LazyApp(".app_alert:app", __package__),
+    }
+    main_app = FastAPI(title="CredentialWatch Backend", lifespan=lifespan(sub_apps.values()))
+    for prefix, sub_app in sub_apps.items():
+        main_app.mount(prefix, sub_app)
+
+    # Route/DB/upstream timings, Server-Timing headers and GET /metrics
+    if metrics.METRICS_ENABLED:
+        metrics.instrument(main_app)
+    # Per-request N+1 detection for DB_DIAGNOSTICS=1 (see db.py)
+    if diagnostics.DB_DIAGNOSTICS:
+        main_app.add_middleware(diagnostics.DiagnosticsMiddleware)
+    
+    return main_app
+
 @app.function(image=image, volumes={"/data": volume})
 @modal.asgi_app()
 def fastapi_app():
-    # Import apps here to ensure they pick up the env var (although set in image env)
-    from .app_cred import app as cred_app
-    from .app_npi import app as npi_app
-    from .app_alert import app as alert_app
-    
-    main_app = FastAPI(title="CredentialWatch Backend")
-    
-    main_app.mount("/cred", cred_app)
-    main_app.mount("/npi", npi_app)
-    main_app.mount("/alert", alert_app)
-    
-    return main_app
+    return create_app()
 
 @app.function(image=image, volumes={"/data": volume})
 def init_db():
@@ -38,3 +54,20 @@ def init_db():
     create_all()
     seed_data()
     print("Database initialized.")
+
+@app.function(image=image, volumes={"/data": volume}, timeout=3 * 60 * 60)
+def import_nppes(path: str):
+    # Load a full or weekly NPPES dissemination file already uploaded to the volume,
+    # e.g. `modal volume put credentialwatch-data npidata.zip /nppes/npidata.zip`
+    from .nppes_local import import_file
+    stats = import_file(path)
+    volume.commit()
+    print(f"Imported {stats['rows']:,} rows ({stats['deactivated']:,} deactivated) in {stats['seconds']}s")
+
+@app.function(image=image, volumes={"/data": volume}, schedule=modal.Cron("0 6 * * *"))
+def sweep_expiries():
+    # Daily: flip expired credentials and raise window alerts (idempotent)
+    from .sweeper import main
+    stats = main()
+    volume.commit()
+    print(f"Expiry sweep: {stats}")
@@ -1,9 +1,10 @@
 from datetime import datetime, date
 from typing import Optional, List
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Float, ForeignKey, Text, JSON, Index, text
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 from .db import Base
+from . import change_log, provider_search
 
 class Provider(Base):
     __tablename__ = "providers"
@@ -22,8 +23,23 @@ class Provider(Base):
     alerts: Mapped[List["Alert"]] = relationship("Alert", back_populates="provider")
 
 
+# FTS5 index over name/location/dept/specialty, created and dropped with the table
+provider_search.attach(Provider.__table__)
+
+
 class Credential(Base):
     __tablename__ = "credentials"
+    __table_args__ = (
+        # Serves /credentials/expiring: equality on status, ordered range on expiry
+        Index("ix_credentials_status_expiry", "status", "expiry_date"),
+        # Natural key of a credential; target of the ON CONFLICT upserts
+        Index("uq_credentials_provider_type_number", "provider_id", "type", "number", unique=True),
+        # Serves /credentials/expiring?sort=risk: status, then highest risk first
+        Index("ix_credentials_status_risk", "status", "risk_score"),
+        # Covers /credentials/expiry_histogram: counts per (expiry_date, type)
+        # without touching the table; provider_id for the dept/location join
+        Index("ix_credentials_status_expiry_type", "status", "expiry_date", "type", "provider_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     provider_id: Mapped[int] = mapped_column(Integer, ForeignKey("providers.id"))
@@ -35,6 +51,8 @@ class Credential(Base):
     expiry_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
     last_verified_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     metadata_json: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    # Precomputed by risk.rescore; see risk.py
+    risk_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -44,6 +62,15 @@ class Credential(Base):
 
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        Index("uq_alerts_dedup_key", "dedup_key", unique=True),
+        # Partial indexes over open alerts only; they stay small as resolved alerts pile up.
+        # /alerts/open by severity, and windowed /alerts/summary (a skip-scan: one
+        # created_at range per severity once ANALYZE has run)
+        Index("ix_alerts_open_severity_created", "severity", "created_at", sqlite_where=text("resolved_at IS NULL")),
+        # /alerts/open by provider
+        Index("ix_alerts_open_provider", "provider_id", "severity", sqlite_where=text("resolved_at IS NULL")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     provider_id: Mapped[int] = mapped_column(Integer, ForeignKey("providers.id"))
@@ -55,6 +82,75 @@ class Alert(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     resolved_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     resolution_note: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Set by the expiry sweeper so re-runs never duplicate an alert; NULL for manual alerts
+    dedup_key: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
     provider: Mapped["Provider"] = relationship("Provider", back_populates="alerts")
     credential: Mapped[Optional["Credential"]] = relationship("Credential", back_populates="alerts")
+
+
+class AlertCounter(Base):
+    """Open-alert count per (severity, provider); provider_id 0 holds the totals."""
+    __tablename__ = "alert_counters"
+
+    severity: Mapped[str] = mapped_column(String, primary_key=True)
+    provider_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    open_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ChangeVersion(Base):
+    """Monotonic version per table, bumped by every write; feeds the read endpoints' ETags."""
+    __tablename__ = "change_versions"
+
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ChangeLogEntry(Base):
+    """One mutation of a provider, credential or alert; appended by triggers (see change_log.py)."""
+    __tablename__ = "change_log"
+    # AUTOINCREMENT: seq is never reused, so clients' cursors stay valid after pruning
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True)
+    entity: Mapped[str] = mapped_column(String)  # "provider", "credential", "alert"
+    entity_id: Mapped[int] = mapped_column(Integer)
+    provider_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    op: Mapped[str] = mapped_column(String)  # "insert", "update", "delete", "resolve"
+    changed_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+# Logging triggers on providers, credentials and alerts, created with the tables
+change_log.attach(Base.metadata)
+
+
+class NPICacheEntry(Base):
+    __tablename__ = "npi_cache"
+
+    endpoint: Mapped[str] = mapped_column(String, primary_key=True)  # "provider", "search"
+    cache_key: Mapped[str] = mapped_column(String, primary_key=True)
+    payload: Mapped[dict] = mapped_column(JSON)
+    fetched_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class NPPESRecord(Base):
+    """One row of the NPPES dissemination file, shaped for local lookups."""
+    __tablename__ = "nppes_providers"
+    __table_args__ = (
+        Index("ix_nppes_providers_name", "last_name", "first_name"),
+        Index("ix_nppes_providers_org", "organization_name"),
+        Index("ix_nppes_providers_state_name", "state", "last_name"),
+    )
+
+    npi: Mapped[str] = mapped_column(String, primary_key=True)
+    enumeration_type: Mapped[str] = mapped_column(String)  # "NPI-1" individual, "NPI-2" organization
+    first_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    last_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    organization_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    city: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    state: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    postal_code: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    addresses: Mapped[list] = mapped_column(JSON)  # NPPES API address objects
+    taxonomies: Mapped[list] = mapped_column(JSON)  # NPPES API taxonomy objects
+    last_update_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    deactivation_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
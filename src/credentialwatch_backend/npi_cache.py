@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+
+from .db import SessionLocal, ReadSessionLocal
+from .models import NPICacheEntry
+from .write_queue import WriteCoordinator, write_queue
+
+logger = logging.getLogger(__name__)
+
+NPI_CACHE_MAX_ENTRIES = int(os.getenv("NPI_CACHE_MAX_ENTRIES", "10000"))
+NPI_CACHE_PERSIST = os.getenv("NPI_CACHE_PERSIST", "1") == "1"
+
+# Per-endpoint (fresh_ttl, stale_ttl) in seconds. Within fresh_ttl an entry is
+# served as-is; past it but within fresh_ttl + stale_ttl it is served while a
+# background refresh runs; after that it is a miss.
+NPI_CACHE_TTLS: Dict[str, Tuple[float, float]] = {
+    "provider": (
+        float(os.getenv("NPI_CACHE_PROVIDER_TTL", str(7 * 86400))),
+        float(os.getenv("NPI_CACHE_PROVIDER_STALE_TTL", str(30 * 86400))),
+    ),
+    "search": (
+        float(os.getenv("NPI_CACHE_SEARCH_TTL", str(86400))),
+        float(os.getenv("NPI_CACHE_SEARCH_STALE_TTL", str(86400))),
+    ),
+}
+# Empty result sets expire quickly so newly enumerated NPIs show up.
+NPI_CACHE_NEGATIVE_TTL = float(os.getenv("NPI_CACHE_NEGATIVE_TTL", "3600"))
+
+Loader = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+@dataclass
+class _Entry:
+    payload: Dict[str, Any]
+    fetched_at: float
+
+
+def _timestamp(fetched_at: datetime) -> float:
+    # Stored as naive UTC
+    return fetched_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+class NPICache:
+    """
+    Two-tier cache for NPPES responses: a bounded in-process LRU in front of
+    the ``npi_cache`` table in the application database.
+
+    Payloads are the raw NPPES JSON bodies, so both endpoints keep mapping
+    them exactly as they would a live response.
+
+    Concurrent misses for one key share a single load: only the first
+    caller fetches and persists, the rest await its result. Persisting goes
+    through the write queue, so a burst of misses (a batch sync) lands in a
+    few group commits alongside the API's writes rather than one commit each.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = NPI_CACHE_MAX_ENTRIES,
+        ttls: Optional[Dict[str, Tuple[float, float]]] = None,
+        negative_ttl: float = NPI_CACHE_NEGATIVE_TTL,
+        session_factory=SessionLocal,
+        persist: bool = NPI_CACHE_PERSIST,
+        read_session_factory=None,
+        writes: Optional[WriteCoordinator] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or NPI_CACHE_TTLS)
+        self.negative_ttl = negative_ttl
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory or session_factory
+        self.writes = writes or WriteCoordinator(session_factory)
+        self.persist = persist
+        self._memory: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        # In-flight loads (misses and refreshes), one per key
+        self._loading: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "refreshes": 0,
+            "persist_errors": 0,
+        }
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["persistent_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _freshness(self, endpoint: str, entry: _Entry, now: float) -> str:
+        fresh_ttl, stale_ttl = self.ttls[endpoint]
+        if not entry.payload.get("results"):
+            fresh_ttl, stale_ttl = min(fresh_ttl, self.negative_ttl), 0.0
+        age = now - entry.fetched_at
+        if age < fresh_ttl:
+            return "fresh"
+        if age < fresh_ttl + stale_ttl:
+            return "stale"
+        return "expired"
+
+    def _remember(self, key: Tuple[str, str], entry: _Entry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get_or_fetch(self, endpoint: str, key: str, loader: Loader) -> Dict[str, Any]:
+        """
+        Return the cached payload for ``(endpoint, key)``, falling back to
+        ``loader`` (the upstream fetch) on a miss.
+        """
+        cache_key = (endpoint, key)
+        now = time.time()
+
+        entry = self._memory.get(cache_key)
+        if entry is not None:
+            state = self._freshness(endpoint, entry, now)
+            if state != "expired":
+                self._memory.move_to_end(cache_key)
+                self.stats["memory_hits"] += 1
+                if state == "stale":
+                    self.stats["stale_hits"] += 1
+                    self._revalidate(cache_key, loader)
+                return entry.payload
+            del self._memory[cache_key]
+
+        if self.persist:
+            entry = await run_in_threadpool(self._load, endpoint, key)
+            if entry is not None:
+                state = self._freshness(endpoint, entry, now)
+                if state != "expired":
+                    self._remember(cache_key, entry)
+                    self.stats["persistent_hits"] += 1
+                    if state == "stale":
+                        self.stats["stale_hits"] += 1
+                        self._revalidate(cache_key, loader)
+                    return entry.payload
+
+        self.stats["misses"] += 1
+        task = self._inflight(cache_key)
+        if task is None:
+            task = self._start_load(cache_key, loader)
+        else:
+            self.stats["coalesced"] += 1
+        # shield: one caller going away mustn't cancel the others' load
+        return await asyncio.shield(task)
+
+    def _inflight(self, cache_key: Tuple[str, str]) -> Optional[asyncio.Task]:
+        task = self._loading.get(cache_key)
+        # A load started on another event loop (e.g. an earlier test client) can't be awaited here
+        if task is not None and task.get_loop() is not asyncio.get_running_loop():
+            return None
+        return task
+
+    def _start_load(self, cache_key: Tuple[str, str], loader: Loader) -> asyncio.Task:
+        task = asyncio.ensure_future(self._fetch_and_store(cache_key, loader))
+        self._loading[cache_key] = task
+        task.add_done_callback(lambda t: self._load_done(cache_key, t))
+        return task
+
+    def _load_done(self, cache_key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self._loading.get(cache_key) is task:
+            del self._loading[cache_key]
+        # Retrieve the error so an unawaited refresh doesn't log "never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("NPI cache load failed for %s: %s", cache_key, task.exception())
+
+    async def _fetch_and_store(self, cache_key: Tuple[str, str], loader: Loader) -> Dict[str, Any]:
+        payload = await loader()
+        entry = _Entry(payload=payload, fetched_at=time.time())
+        self._remember(cache_key, entry)
+        if self.persist:
+            try:
+                await self.writes.submit(lambda db: self._store(db, cache_key[0], cache_key[1], entry))
+            except SQLAlchemyError as e:
+                self.stats["persist_errors"] += 1
+                logger.warning("NPI cache write failed: %s", e)
+        return payload
+
+    def _revalidate(self, cache_key: Tuple[str, str], loader: Loader) -> None:
+        if self._inflight(cache_key) is not None:
+            return
+        self.stats["refreshes"] += 1
+        task = self._start_load(cache_key, loader)
+        task.add_done_callback(self._refresh_done)
+
+    @staticmethod
+    def _refresh_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            # Keep serving the stale entry; the next stale hit retries.
+            logger.warning("NPI cache refresh failed: %s", task.exception())
+
+    async def prime(self, limit: Optional[int] = None) -> int:
+        """
+        Load the most recently fetched persistent entries into memory (e.g. at
+        container start) so early lookups skip the table. Returns how many.
+        """
+        if not self.persist:
+            return 0
+        rows = await run_in_threadpool(self._load_recent, min(limit or self.max_entries, self.max_entries))
+        now = time.time()
+        loaded = 0
+        # Oldest first, so the newest end up most recently used
+        for row in reversed(rows):
+            cache_key = (row.endpoint, row.cache_key)
+            entry = _Entry(payload=row.payload, fetched_at=_timestamp(row.fetched_at))
+            if row.endpoint in self.ttls and cache_key not in self._memory and self._freshness(row.endpoint, entry, now) != "expired":
+                self._remember(cache_key, entry)
+                loaded += 1
+        return loaded
+
+    def _load_recent(self, limit: int) -> list:
+        db = self.read_session_factory()
+        try:
+            return db.execute(
+                select(NPICacheEntry.endpoint, NPICacheEntry.cache_key, NPICacheEntry.payload, NPICacheEntry.fetched_at)
+                .order_by(NPICacheEntry.fetched_at.desc())
+                .limit(limit)
+            ).all()
+        except SQLAlchemyError as e:
+            self.stats["persist_errors"] += 1
+            logger.warning("NPI cache read failed: %s", e)
+            return []
+        finally:
+            db.close()
+
+    def _load(self, endpoint: str, key: str) -> Optional[_Entry]:
+        db = self.read_session_factory()
+        try:
+            row = db.execute(
+                select(NPICacheEntry.payload, NPICacheEntry.fetched_at).where(
+                    NPICacheEntry.endpoint == endpoint,
+                    NPICacheEntry.cache_key == key,
+                )
+            ).first()
+        except SQLAlchemyError as e:
+            self.stats["persist_errors"] += 1
+            logger.warning("NPI cache read failed: %s", e)
+            return None
+        finally:
+            db.close()
+        if row is None:
+            return None
+        return _Entry(payload=row.payload, fetched_at=_timestamp(row.fetched_at))
+
+    @staticmethod
+    def _store(db, endpoint: str, key: str, entry: _Entry) -> None:
+        # A write-queue op: runs in the next group commit
+        fetched_at = datetime.fromtimestamp(entry.fetched_at, tz=timezone.utc).replace(tzinfo=None)
+        stmt = sqlite_insert(NPICacheEntry).values(
+            endpoint=endpoint, cache_key=key, payload=entry.payload, fetched_at=fetched_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[NPICacheEntry.endpoint, NPICacheEntry.cache_key],
+            set_={"payload": stmt.excluded.payload, "fetched_at": stmt.excluded.fetched_at},
+        )
+        db.execute(stmt)
+
+
+npi_cache = NPICache(read_session_factory=ReadSessionLocal, writes=write_queue)
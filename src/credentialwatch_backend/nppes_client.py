@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from . import metrics
+
+NPPES_API_URL = os.getenv("NPPES_API_URL", "https://npiregistry.cms.hhs.gov/api/")
+NPPES_VERSION = "2.1"
+
+# Pool and timeout tuning. Defaults are sized for a single Modal container
+# fanning out syncs; override via env without a redeploy of the code.
+NPPES_MAX_CONNECTIONS = int(os.getenv("NPPES_MAX_CONNECTIONS", "20"))
+NPPES_MAX_KEEPALIVE = int(os.getenv("NPPES_MAX_KEEPALIVE", "20"))
+NPPES_KEEPALIVE_EXPIRY = float(os.getenv("NPPES_KEEPALIVE_EXPIRY", "30"))
+NPPES_TIMEOUT = float(os.getenv("NPPES_TIMEOUT", "10"))
+NPPES_CONNECT_TIMEOUT = float(os.getenv("NPPES_CONNECT_TIMEOUT", "5"))
+
+
+def _request_key(params: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in params.items()))
+
+
+class NPPESClient:
+    """
+    Long-lived NPPES registry client.
+
+    Keeps one pooled ``httpx.AsyncClient`` alive between requests and
+    coalesces identical in-flight lookups ("single-flight"): concurrent
+    callers asking for the same params share one upstream request.
+    """
+
+    def __init__(
+        self,
+        base_url: str = NPPES_API_URL,
+        max_connections: int = NPPES_MAX_CONNECTIONS,
+        max_keepalive_connections: int = NPPES_MAX_KEEPALIVE,
+        keepalive_expiry: float = NPPES_KEEPALIVE_EXPIRY,
+        timeout: float = NPPES_TIMEOUT,
+        connect_timeout: float = NPPES_CONNECT_TIMEOUT,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[Tuple[Tuple[str, str], ...], asyncio.Task] = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the loop that opened them, so a client
+        # is (re)created lazily for the running loop. In production that is
+        # once per container; test clients may spin up several loops.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self._transport,
+            )
+            self._loop = loop
+            self._inflight = {}
+        return self._client
+
+    async def _get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.upstream_calls += 1
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.client.get(self.base_url, params=params)
+            outcome = f"{response.status_code // 100}xx"
+            response.raise_for_status()
+            return response.json()
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise
+        finally:
+            metrics.observe_upstream("nppes", time.perf_counter() - start, outcome)
+
+    async def fetch(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        GET the registry with ``params`` and return the decoded JSON body.
+        Raises ``httpx.HTTPError`` on transport or HTTP status errors.
+        """
+        self.client  # bind to the running loop before touching _inflight
+        key = _request_key(params)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._get(params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._done(key, t))
+        else:
+            self.coalesced_calls += 1
+        # Shield so one cancelled caller doesn't cancel the shared request.
+        with metrics.upstream_wait():
+            return await asyncio.shield(task)
+
+    def _done(self, key, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved if every waiter went away
+
+    async def warm_up(self) -> None:
+        """Open a pooled connection (DNS, TCP, TLS) ahead of the first lookup."""
+        await self.client.head(self.base_url)
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+        self._inflight = {}
+
+
+nppes_client = NPPESClient()
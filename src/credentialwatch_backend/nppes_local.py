@@ -0,0 +1,275 @@
+"""
+Local NPPES index built from the CMS dissemination files.
+
+The monthly full file and the weekly incremental files share one CSV layout,
+so both are loaded the same way: streamed row by row and upserted by NPI in
+bulk batches. Memory use depends on the batch size, not the file size.
+
+    python -m credentialwatch_backend.nppes_local npidata_pfile_20240101-20240131.csv
+    python -m credentialwatch_backend.nppes_local NPPES_Data_Dissemination_Weekly.zip
+"""
+import argparse
+import csv
+import io
+import sys
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import Engine, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .db import engine as default_engine
+from .models import NPPESRecord
+
+IMPORT_BATCH_SIZE = 5000
+# Rows per transaction; keeps the journal bounded on multi-GB loads.
+IMPORT_COMMIT_EVERY = 100_000
+MAX_TAXONOMIES = 15
+
+_ADDRESS_COLUMNS = {
+    "LOCATION": "Business Practice Location Address",
+    "MAILING": "Business Mailing Address",
+}
+
+
+def _address_fields(purpose: str) -> Dict[str, str]:
+    kind = _ADDRESS_COLUMNS[purpose]
+    return {
+        "address_1": f"Provider First Line {kind}",
+        "address_2": f"Provider Second Line {kind}",
+        "city": f"Provider {kind} City Name",
+        "state": f"Provider {kind} State Name",
+        "postal_code": f"Provider {kind} Postal Code",
+        "country_code": f"Provider {kind} Country Code (If outside U.S.)",
+        "telephone_number": f"Provider {kind} Telephone Number",
+    }
+
+
+def _parse_date(value: str) -> Optional[date]:
+    return datetime.strptime(value, "%m/%d/%Y").date() if value else None
+
+
+class _RowMapper:
+    """Maps a dissemination-file row (by header name) to an NPPESRecord dict."""
+
+    def __init__(self, header: List[str]):
+        index = {name: i for i, name in enumerate(header)}
+
+        def col(name: str) -> Optional[int]:
+            return index.get(name)
+
+        self.npi = index["NPI"]
+        self.entity_type = col("Entity Type Code")
+        self.first_name = col("Provider First Name")
+        self.last_name = col("Provider Last Name (Legal Name)")
+        self.organization_name = col("Provider Organization Name (Legal Business Name)")
+        self.last_update = col("Last Update Date")
+        self.deactivation = col("NPI Deactivation Date")
+        self.reactivation = col("NPI Reactivation Date")
+        self.addresses = {
+            purpose: {field: col(name) for field, name in _address_fields(purpose).items()}
+            for purpose in _ADDRESS_COLUMNS
+        }
+        self.taxonomies = [
+            (
+                col(f"Healthcare Provider Taxonomy Code_{n}"),
+                col(f"Provider License Number_{n}"),
+                col(f"Provider License Number State Code_{n}"),
+                col(f"Healthcare Provider Primary Taxonomy Switch_{n}"),
+            )
+            for n in range(1, MAX_TAXONOMIES + 1)
+        ]
+
+    @staticmethod
+    def _get(row: List[str], i: Optional[int]) -> str:
+        return row[i].strip() if i is not None and i < len(row) else ""
+
+    def __call__(self, row: List[str]) -> Dict[str, Any]:
+        get = self._get
+        addresses = []
+        for purpose, fields in self.addresses.items():
+            addr = {"address_purpose": purpose}
+            addr.update({field: get(row, i) for field, i in fields.items()})
+            if addr["address_1"] or addr["city"]:
+                addresses.append(addr)
+
+        taxonomies = []
+        for code_i, license_i, state_i, primary_i in self.taxonomies:
+            code = get(row, code_i)
+            if code:
+                taxonomies.append({
+                    "code": code,
+                    "desc": None,  # descriptions are not part of the dissemination file
+                    "primary": get(row, primary_i) == "Y",
+                    "state": get(row, state_i) or None,
+                    "license": get(row, license_i) or None,
+                })
+
+        deactivated = _parse_date(get(row, self.deactivation))
+        reactivated = _parse_date(get(row, self.reactivation))
+        if deactivated and reactivated and reactivated >= deactivated:
+            deactivated = None
+
+        location = addresses[0] if addresses else {}
+        return {
+            "npi": get(row, self.npi),
+            "enumeration_type": "NPI-2" if get(row, self.entity_type) == "2" else "NPI-1",
+            "first_name": get(row, self.first_name).upper() or None,
+            "last_name": get(row, self.last_name).upper() or None,
+            "organization_name": get(row, self.organization_name).upper() or None,
+            "city": location.get("city") or None,
+            "state": location.get("state") or None,
+            "postal_code": location.get("postal_code") or None,
+            "addresses": addresses,
+            "taxonomies": taxonomies,
+            "last_update_date": _parse_date(get(row, self.last_update)),
+            "deactivation_date": deactivated,
+        }
+
+
+@contextmanager
+def _open_text(path: str) -> Iterator[io.TextIOBase]:
+    if not zipfile.is_zipfile(path):
+        with open(path, encoding="utf-8", newline="") as f:
+            yield f
+        return
+    with zipfile.ZipFile(path) as archive:
+        # The main data file; skip the *_fileheader.csv and endpoint/othername files.
+        name = next(
+            n for n in archive.namelist()
+            if n.lower().startswith("npidata_pfile") and not n.lower().endswith("fileheader.csv")
+        )
+        with io.TextIOWrapper(archive.open(name), encoding="utf-8", newline="") as f:
+            yield f
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    with _open_text(path) as f:
+        reader = csv.reader(f)
+        mapper = _RowMapper(next(reader))
+        for row in reader:
+            if row:
+                yield mapper(row)
+
+
+def _upsert_statement():
+    stmt = sqlite_insert(NPPESRecord)
+    columns = [c.name for c in NPPESRecord.__table__.columns if c.name != "npi"]
+    return stmt.on_conflict_do_update(
+        index_elements=[NPPESRecord.npi],
+        set_={name: stmt.excluded[name] for name in columns},
+    )
+
+
+def import_file(
+    path: str,
+    engine: Engine = default_engine,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    commit_every: int = IMPORT_COMMIT_EVERY,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Stream a full or weekly dissemination file into ``nppes_providers``.
+    Existing NPIs are updated in place, so deltas apply incrementally.
+    """
+    NPPESRecord.__table__.create(bind=engine, checkfirst=True)
+    stmt = _upsert_statement()
+    start = time.perf_counter()
+    rows = deactivated = 0
+    batch: List[Dict[str, Any]] = []
+
+    conn = engine.connect()
+    try:
+        trans = conn.begin()
+        since_commit = 0
+        for record in iter_records(path):
+            batch.append(record)
+            if record["deactivation_date"]:
+                deactivated += 1
+            if len(batch) >= batch_size:
+                conn.execute(stmt, batch)
+                rows += len(batch)
+                since_commit += len(batch)
+                batch = []
+                if since_commit >= commit_every:
+                    trans.commit()
+                    trans = conn.begin()
+                    since_commit = 0
+                if progress:
+                    progress(rows)
+        if batch:
+            conn.execute(stmt, batch)
+            rows += len(batch)
+        trans.commit()
+    finally:
+        conn.close()
+
+    return {"rows": rows, "deactivated": deactivated, "seconds": round(time.perf_counter() - start, 3)}
+
+
+# --- Lookups -------------------------------------------------------------
+
+def _name_filter(column, value: str):
+    value = value.upper()
+    # NPPES allows a trailing wildcard on name fields
+    if value.endswith("*"):
+        return column.like(value[:-1] + "%")
+    return column == value
+
+
+def _to_api_result(record: NPPESRecord) -> Dict[str, Any]:
+    basic = {}
+    if record.enumeration_type == "NPI-2":
+        basic["organization_name"] = record.organization_name or ""
+    else:
+        basic["first_name"] = record.first_name or ""
+        basic["last_name"] = record.last_name or ""
+    return {
+        "number": record.npi,
+        "enumeration_type": record.enumeration_type,
+        "basic": basic,
+        "addresses": record.addresses,
+        "taxonomies": record.taxonomies,
+    }
+
+
+def lookup(db, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answer an NPPES API query from the local index. Returns the same JSON
+    shape as the registry so callers map it identically.
+
+    ``taxonomy_description`` is not supported locally (the file only carries
+    taxonomy codes) and is ignored.
+    """
+    stmt = select(NPPESRecord).where(NPPESRecord.deactivation_date.is_(None))
+    if params.get("number"):
+        stmt = stmt.where(NPPESRecord.npi == params["number"])
+    if params.get("first_name"):
+        stmt = stmt.where(_name_filter(NPPESRecord.first_name, params["first_name"]))
+    if params.get("last_name"):
+        stmt = stmt.where(_name_filter(NPPESRecord.last_name, params["last_name"]))
+    if params.get("organization_name"):
+        stmt = stmt.where(_name_filter(NPPESRecord.organization_name, params["organization_name"]))
+    if params.get("state"):
+        stmt = stmt.where(NPPESRecord.state == params["state"].upper())
+    stmt = stmt.order_by(NPPESRecord.npi).limit(int(params.get("limit", 10)))
+
+    results = [_to_api_result(r) for r in db.execute(stmt).scalars()]
+    return {"result_count": len(results), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Dissemination CSV, or the CMS .zip that contains it")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    def report(rows: int) -> None:
+        if rows % IMPORT_COMMIT_EVERY == 0:
+            print(f"  {rows:,} rows", file=sys.stderr)
+
+    stats = import_file(args.path, batch_size=args.batch_size, progress=report)
+    print(f"Imported {stats['rows']:,} rows ({stats['deactivated']:,} deactivated) in {stats['seconds']}s")
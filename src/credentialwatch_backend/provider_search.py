@@ -0,0 +1,93 @@
+"""
+Full-text index over our own providers.
+
+``providers_fts`` is an external-content FTS5 table on ``providers``: the
+index stores only tokens, and the rows stay in ``providers``. Triggers keep it
+in sync on insert, delete and on updates to the indexed columns. It is created
+with the ``providers`` table (DDL events) and ``ensure_index`` adds it to
+existing databases.
+"""
+import re
+from typing import Optional
+
+from sqlalchemy import Table, column, event, literal_column, select, table, text
+
+FTS_TABLE = "providers_fts"
+FTS_COLUMNS = ("full_name", "location", "dept", "primary_specialty")
+
+_cols = ", ".join(FTS_COLUMNS)
+_new = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+_old = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+
+_CREATE = [
+    # remove_diacritics: "Zoe" finds "Zoë"
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_cols}, content='providers', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_ai AFTER INSERT ON providers BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_ad AFTER DELETE ON providers BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_au AFTER UPDATE OF {_cols} ON providers BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+        INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+]
+
+providers_fts = table(FTS_TABLE, column("rowid"))
+
+
+def ensure_index(conn) -> None:
+    """Create the FTS table and triggers if missing, indexing existing providers."""
+    if conn.dialect.name != "sqlite":
+        return
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {"name": FTS_TABLE}).first()
+    for ddl in _CREATE:
+        conn.execute(text(ddl))
+    if not exists:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def _drop_index(target, conn, **kw) -> None:
+    # The triggers go with the providers table; the FTS table would be left behind
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def attach(providers: Table) -> None:
+    event.listen(providers, "after_create", lambda target, conn, **kw: ensure_index(conn))
+    event.listen(providers, "before_drop", _drop_index)
+
+
+def match_expression(query: str, fts_column: Optional[str] = None) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query: every word must match as a prefix,
+    optionally within one column. Returns None when there are no words.
+    User input never reaches FTS5 syntax unquoted.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    expr = " ".join(f'"{w}"*' for w in words)
+    return f"{fts_column} : ({expr})" if fts_column else expr
+
+
+def matches(expression: str):
+    return literal_column(FTS_TABLE).op("MATCH")(expression)
+
+
+def rank():
+    # bm25 is lower-is-better
+    return literal_column(f"bm25({FTS_TABLE})")
+
+
+def matching_ids(query: str, fts_column: Optional[str] = None):
+    """Subquery of provider ids matching ``query``, or None when it has no words."""
+    expression = match_expression(query, fts_column)
+    if expression is None:
+        return None
+    return select(providers_fts.c.rowid).where(matches(expression))
@@ -0,0 +1,235 @@
+"""
+Credential risk scores.
+
+Every credential has a ``risk_score`` in [0, 1], stored in the indexed
+``credentials.risk_score`` column so reads can sort and filter on it
+without computing anything. The score is a weighted mean of three parts:
+- expiry: 1 once expired, falling linearly to 0 at RISK_EXPIRY_HORIZON_DAYS
+  out. No expiry date counts as 0.
+- verification: age of ``last_verified_at`` over RISK_VERIFICATION_MAX_AGE_DAYS,
+  capped at 1. Never verified counts as 1.
+- alerts: the provider's open alerts, 1 - exp(-n / RISK_ALERT_SATURATION).
+The mean is then multiplied by the credential type's and the issuer's
+weight (default 1) and clipped to [0, 1].
+
+Scores are computed with NumPy over chunks of rows, and only changed scores
+are written back. Writes re-score what they touched in their own transaction.
+``rescore`` takes criteria; credential writes pass their ids, alert writes
+their provider. Expiry and verification age move with the date, so the
+daily sweep re-scores the whole table:
+
+    python -m credentialwatch_backend.risk
+"""
+import argparse
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from sqlalchemy import case, func, literal, select
+from sqlalchemy.orm import Session
+
+from .db import SQL_IN_CHUNK
+from .models import AlertCounter, Credential
+
+# Rows per NumPy batch and per executemany
+RISK_CHUNK_ROWS = int(os.getenv("RISK_CHUNK_ROWS", "200000"))
+# A re-score changing at least this many scores rebuilds the risk index
+# instead of updating it row by row
+RISK_REINDEX_ROWS = int(os.getenv("RISK_REINDEX_ROWS", "100000"))
+RISK_INDEX = "ix_credentials_status_risk"
+# Stored precision; also what counts as "changed"
+SCORE_DECIMALS = 4
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    """``"dea=1.2,board_cert=0.8"`` -> ``{"dea": 1.2, "board_cert": 0.8}``."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.rpartition("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+@dataclass(frozen=True)
+class RiskModel:
+    expiry_weight: float = 0.6
+    verification_weight: float = 0.25
+    alerts_weight: float = 0.15
+    expiry_horizon_days: float = 180.0
+    verification_max_age_days: float = 365.0
+    alert_saturation: float = 3.0
+    type_weights: Dict[str, float] = field(default_factory=dict)
+    issuer_weights: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> "RiskModel":
+        parts = _parse_weights(os.getenv("RISK_WEIGHTS", "expiry=0.6,verification=0.25,alerts=0.15"))
+        return cls(
+            expiry_weight=parts.get("expiry", 0.0),
+            verification_weight=parts.get("verification", 0.0),
+            alerts_weight=parts.get("alerts", 0.0),
+            expiry_horizon_days=float(os.getenv("RISK_EXPIRY_HORIZON_DAYS", "180")),
+            verification_max_age_days=float(os.getenv("RISK_VERIFICATION_MAX_AGE_DAYS", "365")),
+            alert_saturation=float(os.getenv("RISK_ALERT_SATURATION", "3")),
+            type_weights=_parse_weights(
+                os.getenv("RISK_TYPE_WEIGHTS", "dea=1.2,state_license=1.1,malpractice=1.1,board_cert=0.9,bls=0.8")
+            ),
+            issuer_weights=_parse_weights(os.getenv("RISK_ISSUER_WEIGHTS", "")),
+        )
+
+    def multiplier_column(self):
+        """Type weight x issuer weight, looked up by SQLite while it reads the rows."""
+        multiplier = literal(1.0)
+        for column, weights in ((Credential.type, self.type_weights), (Credential.issuer, self.issuer_weights)):
+            if weights:
+                multiplier = multiplier * case(weights, value=column, else_=1.0)
+        return multiplier
+
+    def score(
+        self,
+        today: float,
+        expiry: np.ndarray,
+        verified: np.ndarray,
+        open_alerts: np.ndarray,
+        multiplier: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Vectorized scores. ``today``, ``expiry`` and ``verified`` are Julian
+        day numbers, NaN where the date is missing.
+        """
+        with np.errstate(invalid="ignore"):
+            expiry_risk = np.nan_to_num(np.clip(1 - (expiry - today) / self.expiry_horizon_days, 0, 1), nan=0.0)
+            verification_risk = np.nan_to_num(
+                np.clip((today - verified) / self.verification_max_age_days, 0, 1), nan=1.0
+            )
+        alerts_risk = 1 - np.exp(-open_alerts / self.alert_saturation)
+        total = self.expiry_weight + self.verification_weight + self.alerts_weight
+        mean = (
+            self.expiry_weight * expiry_risk
+            + self.verification_weight * verification_risk
+            + self.alerts_weight * alerts_risk
+        ) / (total or 1.0)
+        return np.clip(mean * multiplier, 0, 1).round(SCORE_DECIMALS)
+
+
+RISK_MODEL = RiskModel.from_env()
+
+
+def _julian_day(d: date) -> float:
+    # Same scale as SQLite's julianday(); 1721424.5 is the day before 0001-01-01
+    return d.toordinal() + 1721424.5
+
+
+def _open_alerts(db: Session, provider_ids: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Open alerts indexed by provider id, from the alert counters: at least
+    for the providers in ``provider_ids``, or for every provider.
+    """
+    stmt = select(AlertCounter.provider_id, func.sum(AlertCounter.open_count)).where(AlertCounter.provider_id != 0)
+    if provider_ids is not None:
+        wanted = np.unique(provider_ids).tolist()
+        # Past one IN list, a single pass over the counters is cheaper
+        if len(wanted) <= SQL_IN_CHUNK:
+            stmt = stmt.where(AlertCounter.provider_id.in_(wanted))
+    counts = db.execute(stmt.group_by(AlertCounter.provider_id)).all()
+    lookup = np.zeros(max([pid for pid, _ in counts] + [0]) + 1)
+    for provider_id, count in counts:
+        lookup[provider_id] = count or 0
+    return lookup
+
+
+def _write_scores(db: Session, ids: np.ndarray, scores: np.ndarray, reindex: bool) -> None:
+    conn = db.connection()
+    risk_index = next(i for i in Credential.__table__.indexes if i.name == RISK_INDEX)
+    if reindex:
+        # Updating an indexed column in place costs ~4x more than a fresh index
+        # build once most rows change. DDL is transactional in SQLite.
+        risk_index.drop(conn)
+    update = "UPDATE credentials SET risk_score = ? WHERE id = ?"
+    for i in range(0, len(ids), RISK_CHUNK_ROWS):
+        conn.exec_driver_sql(
+            update, list(zip(scores[i:i + RISK_CHUNK_ROWS].tolist(), ids[i:i + RISK_CHUNK_ROWS].tolist()))
+        )
+    if reindex:
+        risk_index.create(conn)
+
+
+def rescore(db: Session, *criteria, today: Optional[date] = None, model: Optional[RiskModel] = None) -> int:
+    """
+    Re-score the credentials matching ``criteria`` (all of them if none are
+    given). Returns how many scores changed. Does not commit; callers commit
+    with their writes.
+    """
+    model = model or RISK_MODEL
+    today_jd = _julian_day(today or date.today())
+    stmt = select(
+        Credential.id,
+        Credential.provider_id,
+        func.julianday(Credential.expiry_date),
+        func.julianday(Credential.last_verified_at),
+        model.multiplier_column(),
+        Credential.risk_score,
+    ).where(*criteria)
+    # Reading from the connection skips autoflush; the caller's pending rows count
+    db.flush()
+    # Executed through SQLAlchemy (so events and query counts see it), but
+    # fetched from the DB-API cursor straight into NumPy: Row objects would
+    # cost more than the scoring. Writes wait until the read is done.
+    result = db.connection().execute(stmt)
+    alerts = _open_alerts(db) if not criteria else None
+    changed_ids, changed_scores = [], []
+    try:
+        while True:
+            rows = result.cursor.fetchmany(RISK_CHUNK_ROWS)
+            if not rows:
+                break
+            # None (missing dates, never scored) becomes NaN
+            ids, provider_ids, expiry, verified, multiplier, current = np.array(rows, dtype=float).T
+            provider_ids = provider_ids.astype(np.int64)
+            lookup = alerts if alerts is not None else _open_alerts(db, provider_ids)
+            # Providers without counters (e.g. added since ``alerts`` was read) have none open
+            open_alerts = np.where(provider_ids < len(lookup), lookup[np.minimum(provider_ids, len(lookup) - 1)], 0.0)
+            scores = model.score(today_jd, expiry, verified, open_alerts, multiplier)
+            changed = current != scores  # NaN (never scored) is never equal
+            changed_ids.append(ids[changed].astype(np.int64))
+            changed_scores.append(scores[changed])
+    finally:
+        result.close()
+    if not changed_ids:
+        return 0
+    ids, scores = np.concatenate(changed_ids), np.concatenate(changed_scores)
+    if len(ids):
+        _write_scores(db, ids, scores, reindex=len(ids) >= RISK_REINDEX_ROWS)
+    return len(ids)
+
+
+def rescore_credentials(db: Session, credential_ids: Iterable[int], **kwargs) -> int:
+    ids = list(credential_ids)
+    return sum(rescore(db, Credential.id.in_(ids[i:i + SQL_IN_CHUNK]), **kwargs) for i in range(0, len(ids), SQL_IN_CHUNK))
+
+
+def rescore_providers(db: Session, provider_ids: Iterable[int], **kwargs) -> int:
+    ids = list(provider_ids)
+    return sum(
+        rescore(db, Credential.provider_id.in_(ids[i:i + SQL_IN_CHUNK]), **kwargs) for i in range(0, len(ids), SQL_IN_CHUNK)
+    )
+
+
+if __name__ == "__main__":
+    from . import change_versions
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Score as of this date (default: today)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        changed = rescore(db, today=args.date)
+        if changed:
+            change_versions.bump(db, change_versions.CREDENTIALS)
+        db.commit()
+    print(f"Re-scored credentials in {time.perf_counter() - start:.2f}s: {changed:,} scores changed")
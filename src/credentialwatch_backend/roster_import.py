@@ -0,0 +1,279 @@
+"""
+Streaming roster import: providers and their credentials from CSV or JSONL.
+
+Rows are parsed one at a time and processed in batches. For each batch:
+- rows are validated
+- providers are resolved by NPI in one IN query
+- unknown NPIs are created and known ones updated
+- credentials are upserted on their natural key
+- everything commits in one transaction
+Memory depends on the batch size, not the file size. Rows that fail are
+reported by line number and don't stop the import. That includes rows that
+aren't valid UTF-8 (a Latin-1 export from Excel, say) or can't be parsed.
+
+Columns / keys: npi, full_name, dept, location, primary_specialty, type,
+issuer, number, expiry_date. A row without type/issuer/number only
+upserts the provider.
+
+    python -m credentialwatch_backend.roster_import roster.csv
+    python -m credentialwatch_backend.roster_import roster.jsonl --batch-size 10000
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import change_versions, risk
+from .db import SQL_IN_CHUNK, SessionLocal
+from .models import Provider
+from .schemas_cred import RosterImportError, RosterImportResponse, RosterRow
+from .snapshot_cache import snapshot_cache
+from .upserts import credential_upsert_statement
+
+ROSTER_BATCH_SIZE = int(os.getenv("ROSTER_BATCH_SIZE", "5000"))
+# Error rows kept in the report; the failed count covers all of them
+ROSTER_MAX_ERRORS = 1000
+
+PROVIDER_FIELDS = ("full_name", "dept", "location", "primary_specialty")
+
+
+def detect_format(hint: str) -> Optional[str]:
+    """'csv' or 'jsonl' from a Content-Type or file name, else None."""
+    hint = hint.lower()
+    if "csv" in hint:
+        return "csv"
+    if any(kind in hint for kind in ("ndjson", "jsonl", "json-lines", "x-json-stream")):
+        return "jsonl"
+    return None
+
+
+def _text_error(text: str) -> Optional[str]:
+    # Undecodable bytes were replaced with U+FFFD on reading
+    if "\ufffd" in text:
+        return "Not valid UTF-8; export the roster as UTF-8 (\"CSV UTF-8\" in Excel)"
+    if "\x00" in text:
+        return "Contains NUL bytes"
+    return None
+
+
+def iter_rows(f: IO[bytes], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, raw dict) pairs, or (line number, error message) for unparseable lines."""
+    # errors="replace": a stray Latin-1 / cp1252 byte fails its row, not the import
+    text = io.TextIOWrapper(f, encoding="utf-8-sig", errors="replace", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        while True:
+            # The failing record starts on the line after the last one read
+            # (line_num isn't advanced past a bad line on every Python version)
+            next_line = reader.line_num + 1
+            try:
+                raw = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield next_line, f"Invalid CSV: {e}"
+                continue
+            # Blank cells mean "not given"; extra cells (key None) are ignored
+            row = {k: (v.strip() or None) for k, v in raw.items() if k and isinstance(v, str)}
+            error = _text_error("".join(v for v in row.values() if v))
+            yield reader.line_num, error or row
+        return
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        error = _text_error(line)
+        if error:
+            yield line_no, error
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"Invalid JSON: {e}"
+            continue
+        yield line_no, obj if isinstance(obj, dict) else "Expected a JSON object"
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in e.errors()
+    )
+
+
+class _Report:
+    def __init__(self):
+        self.rows = self.providers_created = self.providers_updated = self.credentials_upserted = 0
+        self.failed = 0
+        self.errors: List[RosterImportError] = []
+
+    def fail(self, line: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < ROSTER_MAX_ERRORS:
+            self.errors.append(RosterImportError(line=line, error=error))
+
+
+def _resolve_providers(db: Session, npis: List[str]) -> Dict[str, int]:
+    found: Dict[str, int] = {}
+    for i in range(0, len(npis), SQL_IN_CHUNK):
+        # NPI isn't unique in providers; attach to the oldest row, as sync_from_npi does
+        stmt = (
+            select(Provider.npi, func.min(Provider.id))
+            .where(Provider.npi.in_(npis[i:i + SQL_IN_CHUNK]))
+            .group_by(Provider.npi)
+        )
+        found.update(db.execute(stmt).all())
+    return found
+
+
+def _apply_batch(db: Session, batch: List[Tuple[int, RosterRow]], report: _Report) -> None:
+    now = datetime.utcnow()
+    # Core statements throughout: the ORM forms route parameter lists through
+    # bulk persistence (and update() would expect primary keys in them)
+    providers = Provider.__table__
+
+    # Provider fields per NPI; later rows in the batch win
+    fields: Dict[str, Dict[str, Any]] = {}
+    for _, row in batch:
+        merged = fields.setdefault(row.npi, {})
+        merged.update({name: getattr(row, name) for name in PROVIDER_FIELDS if getattr(row, name) is not None})
+
+    provider_ids = _resolve_providers(db, list(fields))
+
+    updates = [
+        {"pid": provider_ids[npi], **{name: values.get(name) for name in PROVIDER_FIELDS}}
+        for npi, values in fields.items() if npi in provider_ids and values
+    ]
+    if updates:
+        db.execute(
+            update(providers).where(providers.c.id == bindparam("pid")).values(
+                **{name: func.coalesce(bindparam(name), providers.c[name]) for name in PROVIDER_FIELDS},
+                updated_at=now,
+            ),
+            updates,
+        )
+
+    creates = [
+        {"npi": npi, "is_active": True, "created_at": now, "updated_at": now,
+         **{name: values.get(name) for name in PROVIDER_FIELDS}}
+        for npi, values in fields.items() if npi not in provider_ids and values.get("full_name")
+    ]
+    if creates:
+        # executemany, then look the ids up: RETURNING would run row by row here
+        db.execute(insert(providers), creates)
+        provider_ids.update(_resolve_providers(db, [row["npi"] for row in creates]))
+
+    credentials, unknown = [], []
+    for line, row in batch:
+        if row.npi not in provider_ids:
+            unknown.append(line)
+        elif row.type:
+            credentials.append({
+                "provider_id": provider_ids[row.npi], "type": row.type, "issuer": row.issuer,
+                "number": row.number, "expiry_date": row.expiry_date,
+            })
+    if credentials:
+        db.execute(credential_upsert_statement(), credentials)
+
+    if updates or creates:
+        change_versions.bump(db, change_versions.PROVIDERS)
+    if credentials:
+        risk.rescore_providers(db, {row["provider_id"] for row in credentials})
+        change_versions.bump(db, change_versions.CREDENTIALS)
+    db.commit()
+    snapshot_cache.invalidate(provider_ids.values())
+
+    # Only once the batch is in: a failed batch reports each of its rows once
+    for line in unknown:
+        report.fail(line, "Unknown NPI; full_name is required to create the provider")
+
+    report.providers_updated += len(updates)
+    report.providers_created += len(creates)
+    report.credentials_upserted += len(credentials)
+
+
+def import_roster(
+    db: Session,
+    f: IO[bytes],
+    fmt: str,
+    batch_size: int = ROSTER_BATCH_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+) -> RosterImportResponse:
+    """Import a CSV or JSONL roster from the binary stream ``f``; one transaction per batch."""
+    start = time.perf_counter()
+    report = _Report()
+    batch: List[Tuple[int, RosterRow]] = []
+
+    def flush() -> None:
+        try:
+            _apply_batch(db, batch, report)
+        except SQLAlchemyError as e:
+            db.rollback()
+            for line, _ in batch:
+                report.fail(line, f"Batch not imported: {e.__class__.__name__}: {e.orig if hasattr(e, 'orig') else e}")
+        if progress:
+            progress(report.rows)
+        batch.clear()
+
+    for line, raw in iter_rows(f, fmt):
+        report.rows += 1
+        if isinstance(raw, str):
+            report.fail(line, raw)
+            continue
+        try:
+            batch.append((line, RosterRow.model_validate(raw)))
+        except ValidationError as e:
+            report.fail(line, _validation_message(e))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    return RosterImportResponse(
+        rows=report.rows,
+        providers_created=report.providers_created,
+        providers_updated=report.providers_updated,
+        credentials_upserted=report.credentials_upserted,
+        failed=report.failed,
+        errors=report.errors,
+        errors_truncated=report.failed > len(report.errors),
+        seconds=round(time.perf_counter() - start, 3),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Roster file (.csv, .jsonl or .ndjson)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Override detection from the file extension")
+    parser.add_argument("--batch-size", type=int, default=ROSTER_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error("can't tell the format from the file name; pass --format")
+
+    def report_progress(rows: int) -> None:
+        print(f"  {rows:,} rows", file=sys.stderr)
+
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as f:
+            result = import_roster(db, f, fmt, batch_size=args.batch_size, progress=report_progress)
+    finally:
+        db.close()
+    for error in result.errors:
+        print(f"line {error.line}: {error.error}", file=sys.stderr)
+    print(
+        f"Imported {result.rows:,} rows in {result.seconds}s: {result.providers_created:,} providers created, "
+        f"{result.providers_updated:,} updated, {result.credentials_upserted:,} credentials upserted, "
+        f"{result.failed:,} failed"
+    )
@@ -1,10 +1,17 @@
 from datetime import date, datetime
-from typing import Optional, List, Any, Dict
-from pydantic import BaseModel
+from typing import Optional, List, Any, Dict, Literal
+from pydantic import BaseModel, field_validator, model_validator
+
+from .schemas_alert import AlertResponse
 
 class ProviderSyncRequest(BaseModel):
     npi: str
 
+class ProviderBatchSyncRequest(BaseModel):
+    npis: List[str]
+    # Max concurrent NPPES fetches; defaults to NPI_SYNC_CONCURRENCY
+    concurrency: Optional[int] = None
+
 class ProviderBase(BaseModel):
     npi: Optional[str] = None
     full_name: str
@@ -24,6 +31,17 @@ class ProviderResponse(ProviderBase):
     class Config:
         from_attributes = True
 
+class ProviderSyncResult(BaseModel):
+    npi: str
+    ok: bool
+    provider: Optional[ProviderResponse] = None
+    error: Optional[str] = None
+
+class ProviderBatchSyncResponse(BaseModel):
+    synced: int
+    failed: int
+    results: List[ProviderSyncResult]
+
 class CredentialBase(BaseModel):
     type: str
     issuer: str
@@ -42,6 +60,18 @@ class CredentialCreateOrUpdate(BaseModel):
     expiry_date: Optional[date] = None
     # Assuming other fields are optional or have defaults for update logic
 
+class CredentialBulkUpsertRequest(BaseModel):
+    credentials: List[CredentialCreateOrUpdate]
+
+class CredentialBulkUpsertError(BaseModel):
+    index: int  # position in the request's credentials list
+    error: str
+
+class CredentialBulkUpsertResponse(BaseModel):
+    upserted: int
+    failed: int
+    errors: List[CredentialBulkUpsertError]
+
 class CredentialResponse(CredentialBase):
     id: int
     provider_id: int
@@ -55,12 +85,57 @@ class ExpiringCredentialsRequest(BaseModel):
     window_days: int
     dept: Optional[str] = None
     location: Optional[str] = None
+    # "expiry": soonest first; "risk": highest risk_score first
+    sort: Literal["expiry", "risk"] = "expiry"
+    min_risk: Optional[float] = None
+    # Keyset pagination: pass the X-Next-Cursor header of the previous page
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
 
 class ExpiringCredentialResult(BaseModel):
     provider: ProviderResponse
     credential: CredentialResponse
     days_to_expiry: int
-    risk_score: float # calculated somehow?
+    # Precomputed; see risk.py. 0 until the credential is first scored.
+    risk_score: float
+
+class ExpiryHistogramGroup(BaseModel):
+    key: Optional[str]
+    count: int
+
+class ExpiryHistogramBucket(BaseModel):
+    # First day of the day / week (Monday) / month
+    start: date
+    total: int
+    # Largest first; empty unless group_by is given
+    groups: List[ExpiryHistogramGroup]
+
+class ExpiryHistogramResponse(BaseModel):
+    bucket: str
+    group_by: Optional[str]
+    start: date
+    end: date
+    total: int
+    # Every bucket from start to end, empty ones included
+    buckets: List[ExpiryHistogramBucket]
+
+class ChangeEntry(BaseModel):
+    seq: int
+    entity: str  # "provider", "credential", "alert"
+    id: int
+    provider_id: Optional[int] = None
+    op: str  # "insert", "update", "delete", "resolve"
+    changed_at: datetime
+    # The row as it is now, shaped like its *Response model; None once deleted
+    data: Optional[Dict[str, Any]] = None
+
+class ChangeFeedResponse(BaseModel):
+    changes: List[ChangeEntry]
+    # Pass back as since for the next page / poll
+    next_since: int
+    # Newest seq at the time of the request
+    head: int
+    has_more: bool
 
 class ProviderSnapshotRequest(BaseModel):
     provider_id: Optional[int] = None
@@ -69,3 +144,57 @@ class ProviderSnapshotRequest(BaseModel):
 class ProviderSnapshotResponse(BaseModel):
     provider: ProviderResponse
     credentials: List[CredentialResponse]
+
+class ProviderSnapshotBatchRequest(BaseModel):
+    provider_ids: List[int] = []
+    npis: List[str] = []
+    include_alerts: bool = False
+
+class ProviderSnapshotBatchItem(ProviderSnapshotResponse):
+    open_alerts: Optional[List[AlertResponse]] = None  # only with include_alerts
+
+class ProviderSnapshotBatchResponse(BaseModel):
+    snapshots: Dict[int, ProviderSnapshotBatchItem]  # keyed by provider id
+    missing_ids: List[int]
+    missing_npis: List[str]
+
+class RosterRow(BaseModel):
+    """One roster line: a provider (by NPI) and, optionally, one of their credentials."""
+    npi: str
+    full_name: Optional[str] = None  # required when the NPI isn't known yet
+    dept: Optional[str] = None
+    location: Optional[str] = None
+    primary_specialty: Optional[str] = None
+    type: Optional[str] = None
+    issuer: Optional[str] = None
+    number: Optional[str] = None
+    expiry_date: Optional[date] = None
+
+    @field_validator("npi")
+    @classmethod
+    def npi_is_ten_digits(cls, v: str) -> str:
+        v = v.strip()
+        if not (v.isdigit() and len(v) == 10):
+            raise ValueError("npi must be 10 digits")
+        return v
+
+    @model_validator(mode="after")
+    def credential_is_complete(self):
+        given = [self.type, self.issuer, self.number]
+        if any(given) and not all(given):
+            raise ValueError("type, issuer and number are required together")
+        return self
+
+class RosterImportError(BaseModel):
+    line: int  # 1-based line in the file (CSV header is line 1)
+    error: str
+
+class RosterImportResponse(BaseModel):
+    rows: int
+    providers_created: int
+    providers_updated: int
+    credentials_upserted: int
+    failed: int
+    errors: List[RosterImportError]
+    errors_truncated: bool  # more than ROSTER_MAX_ERRORS rows failed
+    seconds: float
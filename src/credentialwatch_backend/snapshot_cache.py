@@ -0,0 +1,209 @@
+"""
+In-process cache of serialized provider snapshots.
+
+Agents ask for the same few hundred providers over and over. Each entry
+holds one provider's response pieces, already encoded the way the response
+models encode them:
+- the provider
+- its credentials
+- its open alerts, once a batch snapshot has asked for them
+Hits are assembled from those bytes without touching the database, and
+answer ``If-None-Match`` from a hash of the body.
+
+Entries are found by provider id or NPI. Write paths invalidate the
+providers they touched, after their commit. Provider and credential writes
+drop the whole entry; alert writes drop only its alerts. A read that
+overlapped an invalidation doesn't store what it read. Writes made by other
+processes (the scheduled sweeper, CLI imports, other containers) aren't
+seen here, so no entry is served for longer than SNAPSHOT_CACHE_TTL.
+
+Memory is bounded by SNAPSHOT_CACHE_MAX_BYTES of encoded JSON, evicting the
+least recently used providers first.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import Request, Response
+
+from . import change_versions, metrics
+from .schemas_alert import AlertResponse
+from .schemas_cred import CredentialResponse, ProviderResponse
+
+SNAPSHOT_CACHE_MAX_BYTES = int(os.getenv("SNAPSHOT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SNAPSHOT_CACHE_TTL = float(os.getenv("SNAPSHOT_CACHE_TTL", "60"))
+
+# Rough per-entry cost of the entry object, the dict slots and the NPI index
+ENTRY_OVERHEAD_BYTES = 400
+
+
+@dataclass(frozen=True)
+class _Entry:
+    provider_id: int
+    npi: Optional[str]
+    provider: bytes
+    credentials: bytes
+    open_alerts: Optional[bytes]
+    stored_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.provider) + len(self.credentials) + len(self.open_alerts or b"") + ENTRY_OVERHEAD_BYTES
+
+    def snapshot_body(self) -> bytes:
+        """``ProviderSnapshotResponse`` JSON."""
+        return b'{"provider":%s,"credentials":%s}' % (self.provider, self.credentials)
+
+    def batch_item_body(self, include_alerts: bool) -> bytes:
+        """``ProviderSnapshotBatchItem`` JSON."""
+        alerts = self.open_alerts if include_alerts else b"null"
+        return b'{"provider":%s,"credentials":%s,"open_alerts":%s}' % (self.provider, self.credentials, alerts)
+
+
+def _encode_list(schema, objects: Iterable[Any]) -> bytes:
+    return b"[" + b",".join(schema.model_validate(o).model_dump_json().encode() for o in objects) + b"]"
+
+
+class SnapshotCache:
+    def __init__(self, max_bytes: int = SNAPSHOT_CACHE_MAX_BYTES, ttl: float = SNAPSHOT_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_npi: Dict[str, int] = {}
+        self._bytes = 0
+        # Bumped by every invalidation; reads started before one don't store
+        self._generation = 0
+        # Sync handlers run in the threadpool
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_npi.clear()
+            self._bytes = 0
+            self._publish()
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    @staticmethod
+    def respond(request: Request, body: bytes) -> Response:
+        """JSON response for an assembled body, with an ETag derived from the bytes."""
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        return change_versions.if_none_match(request, etag) or Response(
+            body, media_type="application/json", headers={"ETag": etag}
+        )
+
+    @property
+    def generation(self) -> int:
+        """Take before reading the database; pass to ``put``."""
+        return self._generation
+
+    def _publish(self) -> None:
+        metrics.SNAPSHOT_CACHE_BYTES.set(self._bytes)
+        metrics.SNAPSHOT_CACHE_ENTRIES.set(len(self._entries))
+
+    def _drop(self, provider_id: int) -> None:
+        entry = self._entries.pop(provider_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            if entry.npi is not None and self._by_npi.get(entry.npi) == provider_id:
+                del self._by_npi[entry.npi]
+
+    def get(self, provider_id: Optional[int] = None, npi: Optional[str] = None, with_alerts: bool = False) -> Optional[_Entry]:
+        """The entry for ``provider_id``, or else ``npi``; None (a miss) if absent, expired or lacking alerts."""
+        with self._lock:
+            key = provider_id if provider_id is not None else self._by_npi.get(npi)
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.stored_at >= self.ttl:
+                self._drop(key)
+                self._publish()
+                self.stats["expirations"] += 1
+                entry = None
+            if entry is None or (with_alerts and entry.open_alerts is None):
+                self.stats["misses"] += 1
+                metrics.SNAPSHOT_CACHE_LOOKUPS.inc(1.0, "miss")
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            metrics.SNAPSHOT_CACHE_LOOKUPS.inc(1.0, "hit")
+            return entry
+
+    def put(
+        self,
+        generation: int,
+        provider,
+        credentials: Iterable[Any],
+        open_alerts: Optional[Iterable[Any]] = None,
+        by_npi: bool = False,
+    ) -> _Entry:
+        """
+        Encode a provider's snapshot (ORM objects) and, unless an invalidation
+        happened since ``generation``, keep it. Returns the entry either way.
+        ``by_npi``: the provider is what a lookup of its NPI resolves to
+        (NPIs aren't unique), so later lookups of that NPI may use it.
+        """
+        entry = _Entry(
+            provider_id=provider.id,
+            npi=provider.npi,
+            provider=ProviderResponse.model_validate(provider).model_dump_json().encode(),
+            credentials=_encode_list(CredentialResponse, credentials),
+            open_alerts=None if open_alerts is None else _encode_list(AlertResponse, open_alerts),
+            stored_at=time.monotonic(),
+        )
+        if entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            if generation != self._generation:
+                return entry
+            self._drop(entry.provider_id)
+            self._entries[entry.provider_id] = entry
+            self._bytes += entry.size
+            if by_npi and entry.npi is not None:
+                self._by_npi[entry.npi] = entry.provider_id
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+            self._publish()
+        return entry
+
+    def invalidate(self, provider_ids: Iterable[int] = (), npis: Iterable[str] = (), alerts_only: bool = False) -> None:
+        """
+        Forget what's cached for these providers; call after the write commits.
+        ``alerts_only`` keeps the provider and credentials and drops the open alerts.
+        """
+        with self._lock:
+            self._generation += 1
+            ids = set(provider_ids)
+            ids.update(self._by_npi[npi] for npi in npis if npi in self._by_npi)
+            for provider_id in ids:
+                entry = self._entries.get(provider_id)
+                if entry is None:
+                    continue
+                self.stats["invalidations"] += 1
+                if alerts_only:
+                    if entry.open_alerts is not None:
+                        self._entries[provider_id] = replace(entry, open_alerts=None)
+                        self._bytes -= len(entry.open_alerts)
+                else:
+                    self._drop(provider_id)
+            self._publish()
+
+
+snapshot_cache = SnapshotCache()
@@ -0,0 +1,121 @@
+"""
+Cold-start helpers for the combined app.
+
+Importing a sub-app pulls in its models, schemas, routes and their Pydantic
+validators. That is most of a cold container's start-up time. ``LazyApp``
+stands in for a sub-app and imports it on the first request under its
+prefix, off the event loop. ``warm_up`` then runs in the background after
+start-up, unless WARMUP_ON_START=0. It imports the sub-apps, opens the
+database pools and an NPPES connection, and loads the NPI cache's recent
+entries into memory. Whether the first request arrives before or after
+warm-up finishes, it does not pay for anything twice.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"
+
+
+class LazyApp:
+    """ASGI app that imports the real one, given as ``"module:attribute"``, on first use."""
+
+    def __init__(self, target: str, package: Optional[str] = None):
+        self.target = target
+        self.package = package
+        self._app = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._app is not None
+
+    def load(self) -> Any:
+        # Concurrent first requests are safe: the import system locks per module
+        if self._app is None:
+            module_name, attribute = self.target.split(":")
+            self._app = getattr(importlib.import_module(module_name, self.package), attribute)
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        app = self._app
+        if app is None:
+            # Importing takes a few hundred ms; don't stall other requests meanwhile
+            app = await run_in_threadpool(self.load)
+        await app(scope, receive, send)
+
+
+def _open_pool(engine, connections: int) -> None:
+    # Check out several at once so the pool really opens (and PRAGMA-configures) them
+    opened = [engine.connect() for _ in range(connections)]
+    for conn in opened:
+        conn.exec_driver_sql("SELECT 1")
+        conn.close()
+
+
+def _warm_database() -> None:
+    from sqlalchemy.orm import configure_mappers
+
+    from .db import SQLITE_READ_POOL_SIZE, engine, read_engine
+
+    configure_mappers()
+    _open_pool(engine, 1)
+    if read_engine is not engine:
+        _open_pool(read_engine, SQLITE_READ_POOL_SIZE)
+
+
+async def warm_up(apps: Iterable[LazyApp] = ()) -> Dict[str, Any]:
+    """Pay the cold-start costs ahead of the first requests. Failures are logged, not raised."""
+    start = time.perf_counter()
+    stats: Dict[str, Any] = {}
+    for app in apps:
+        await run_in_threadpool(app.load)
+
+    try:
+        await run_in_threadpool(_warm_database)
+        stats["database"] = "ok"
+    except Exception as e:
+        logger.warning("Warm-up: database not ready: %s", e)
+        stats["database"] = "error"
+
+    from .app_npi import NPI_BACKEND
+    from .npi_cache import npi_cache
+    from .nppes_client import nppes_client
+
+    stats["npi_cache_primed"] = await npi_cache.prime()
+    if NPI_BACKEND == "remote":
+        try:
+            await nppes_client.warm_up()
+            stats["nppes"] = "ok"
+        except Exception as e:
+            logger.warning("Warm-up: NPPES not reachable: %s", e)
+            stats["nppes"] = "error"
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info("Warm-up done: %s", stats)
+    return stats
+
+
+def lifespan(apps: Iterable[LazyApp] = (), warmup: bool = WARMUP_ON_START):
+    """Lifespan for the combined app: background warm-up, then closing the shared NPPES client."""
+    apps = list(apps)
+
+    @asynccontextmanager
+    async def run(app):
+        task = asyncio.ensure_future(warm_up(apps)) if warmup else None
+        yield
+        if task is not None:
+            task.cancel()
+        # Mounted sub-apps don't get their own lifespan events
+        from .nppes_client import nppes_client
+
+        await nppes_client.aclose()
+
+    return run
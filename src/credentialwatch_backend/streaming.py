@@ -0,0 +1,108 @@
+import csv
+import io
+from datetime import date
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+
+# Rows fetched from SQLite per round (yield_per) and written per chunk.
+STREAM_CHUNK_ROWS = 500
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    ranges = []
+    for part in accept.split(","):
+        media_range, *params = (p.strip() for p in part.split(";"))
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media_range.lower(), q))
+    return ranges
+
+
+def _quality(ranges: Sequence[Tuple[str, float]], media_type: str) -> float:
+    # The most specific matching range decides: type/subtype, then type/*, then */*
+    main = media_type.split("/")[0]
+    for candidate in (media_type, f"{main}/*", "*/*"):
+        qs = [q for media_range, q in ranges if media_range == candidate]
+        if qs:
+            return max(qs)
+    return 0.0
+
+
+def negotiate_stream(request: Request) -> Optional[str]:
+    """
+    Return the streaming media type to answer with, if any: NDJSON or CSV
+    when the Accept header allows it (q > 0) and prefers it over JSON.
+    On a tie, or with no Accept header, the answer stays JSON.
+    """
+    ranges = _parse_accept(request.headers.get("accept", ""))
+    if not ranges:
+        return None
+    json_q = _quality(ranges, JSON)
+    best, best_q = None, json_q
+    for media_type in (NDJSON, CSV):
+        q = _quality(ranges, media_type)
+        if q > 0 and q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def _ndjson_chunks(rows: Iterable[Any], to_json: Callable[[Any], str]) -> Iterator[bytes]:
+    lines: List[str] = []
+    for row in rows:
+        lines.append(to_json(row))
+        if len(lines) >= STREAM_CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def _csv_value(value: Any) -> Any:
+    # Match the JSON encoding of dates/datetimes rather than str()'s
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def _csv_chunks(rows: Iterable[Any], header: Sequence[str], to_csv: Callable[[Any], Sequence[Any]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_csv_value(v) for v in to_csv(row)])
+        if i % STREAM_CHUNK_ROWS == 0:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode()
+
+
+def stream_rows(
+    media_type: str,
+    rows: Iterable[Any],
+    to_json: Callable[[Any], str],
+    csv_header: Sequence[str],
+    to_csv: Callable[[Any], Sequence[Any]],
+) -> StreamingResponse:
+    """
+    Stream ``rows`` as NDJSON (one ``to_json`` document per line) or CSV.
+    ``rows`` should be a lazily fetched result (``yield_per``) so only one
+    chunk is held in memory at a time.
+    """
+    if media_type == CSV:
+        body = _csv_chunks(rows, csv_header, to_csv)
+    else:
+        body = _ndjson_chunks(rows, to_json)
+    return StreamingResponse(body, media_type=media_type)
@@ -0,0 +1,138 @@
+"""
+Expiry sweeper: keeps Credential.status current and raises expiry alerts.
+
+Each run is a handful of set-based statements, independent of table size
+in Python terms, and idempotent: alerts carry a dedup_key, so re-running
+the sweep (or running it twice in a day) inserts nothing new.
+
+    python -m credentialwatch_backend.sweeper
+    python -m credentialwatch_backend.sweeper --date 2025-01-31
+"""
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Sequence
+
+from sqlalchemy import Integer, String, cast, func, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import alert_counters, change_log, change_versions, risk
+from .db import SessionLocal
+from .models import Alert, Credential
+
+# Alert thresholds in days before expiry, e.g. "90,30,7".
+ALERT_WINDOWS = sorted((int(w) for w in os.getenv("ALERT_WINDOWS", "90,30,7").split(",")), reverse=True)
+
+
+def severity_for(window_days: int) -> str:
+    if window_days <= 7:
+        return "critical"
+    if window_days <= 30:
+        return "warning"
+    return "info"
+
+
+def _dedup_key(prefix: str, window_days: int):
+    # One alert per credential, expiry date and window: renewing a credential
+    # (new expiry_date) re-arms its alerts.
+    return (
+        literal(prefix) + cast(Credential.id, String) + ":" + cast(Credential.expiry_date, String)
+        + ":" + literal(str(window_days))
+    )
+
+
+def _insert_alerts(db: Session, source) -> int:
+    columns = ["provider_id", "credential_id", "severity", "window_days", "message", "channel", "created_at", "dedup_key"]
+    stmt = sqlite_insert(Alert).from_select(columns, source)
+    stmt = stmt.on_conflict_do_nothing(index_elements=[Alert.dedup_key])
+    # RETURNING only yields the rows actually inserted, i.e. the counter deltas
+    created = db.execute(stmt.returning(Alert.severity, Alert.provider_id)).all()
+    alert_counters.bump(db, [(severity, provider_id, 1) for severity, provider_id in created])
+    return len(created)
+
+
+def run_sweep(db: Session, today: Optional[date] = None, windows: Sequence[int] = ALERT_WINDOWS) -> Dict[str, int]:
+    """
+    1. Alert on active credentials that have passed their expiry date.
+    2. Flip those credentials to "expired".
+    3. For each window, alert on active credentials whose days to expiry
+       fall in (next smaller window, window]. Each credential gets the
+       tightest window it has crossed.
+    4. Re-score every credential: expiry and verification risk move with
+       the date, and the new alerts count against their providers.
+    5. Prune change-log entries older than CHANGE_LOG_RETENTION_DAYS.
+    Everything commits in one transaction.
+    """
+    today = today or date.today()
+    now = datetime.utcnow()
+    days_left = cast(func.julianday(Credential.expiry_date) - func.julianday(today.isoformat()), Integer)
+    stats = {"expired_alerts": 0, "expired": 0, "window_alerts": 0, "rescored": 0, "pruned_changes": 0}
+
+    newly_expired = select(
+        Credential.provider_id,
+        Credential.id,
+        literal("critical"),
+        literal(0),
+        literal("Credential ") + Credential.type + " " + Credential.number + " has expired",
+        literal("ui"),
+        literal(now),
+        _dedup_key("expired:", 0),
+    ).where(Credential.status == "active", Credential.expiry_date < today)
+    stats["expired_alerts"] = _insert_alerts(db, newly_expired)
+
+    stats["expired"] = db.execute(
+        update(Credential)
+        .where(Credential.status == "active", Credential.expiry_date < today)
+        .values(status="expired", updated_at=now)
+    ).rowcount
+
+    windows = sorted(set(windows), reverse=True)
+    for i, window in enumerate(windows):
+        lower = windows[i + 1] if i + 1 < len(windows) else -1
+        crossing = select(
+            Credential.provider_id,
+            Credential.id,
+            literal(severity_for(window)),
+            literal(window),
+            literal("Credential ") + Credential.type + " " + Credential.number
+            + " expires in " + cast(days_left, String) + " days",
+            literal("ui"),
+            literal(now),
+            _dedup_key("expiry:", window),
+        ).where(
+            Credential.status == "active",
+            Credential.expiry_date <= date.fromordinal(today.toordinal() + window),
+            Credential.expiry_date > date.fromordinal(today.toordinal() + lower),
+        )
+        stats["window_alerts"] += _insert_alerts(db, crossing)
+
+    stats["rescored"] = risk.rescore(db, today=today)
+    stats["pruned_changes"] = change_log.prune(db, now - timedelta(days=change_log.CHANGE_LOG_RETENTION_DAYS))
+
+    if stats["expired"] or stats["rescored"]:
+        change_versions.bump(db, change_versions.CREDENTIALS)
+    if stats["expired_alerts"] or stats["window_alerts"]:
+        change_versions.bump(db, change_versions.ALERTS)
+    db.commit()
+    return stats
+
+
+def main(today: Optional[date] = None) -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return run_sweep(db, today=today)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Sweep as of this date (default: today)")
+    args = parser.parse_args()
+    stats = main(args.date)
+    print(
+        f"Expired {stats['expired']} credentials; "
+        f"created {stats['expired_alerts']} expiry and {stats['window_alerts']} window alerts; "
+        f"{stats['rescored']} risk scores changed."
+    )
@@ -0,0 +1,46 @@
+"""
+Upsert statements shared by the write paths.
+
+``POST /cred/credentials/add_or_update``, the bulk upsert endpoint and the
+roster import all write credentials on the same natural key, so they build
+the statement here rather than from each other.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import Date, bindparam, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .models import Credential
+
+
+def credential_upsert_statement():
+    """
+    INSERT ... ON CONFLICT DO UPDATE keyed on uq_credentials_provider_type_number.
+    Status is derived by SQLite from the row's expiry_date, so the same
+    statement can be executed once or executemany'd over thousands of rows.
+    """
+    now = datetime.utcnow()
+    expiry_date = bindparam("expiry_date", type_=Date)
+    # On the table, not the entity: a parameter list then goes straight to executemany
+    # instead of through the ORM's bulk-insert layer
+    credentials = Credential.__table__
+    stmt = sqlite_insert(credentials).values(
+        provider_id=bindparam("provider_id"),
+        type=bindparam("type"),
+        issuer=bindparam("issuer"),
+        number=bindparam("number"),
+        expiry_date=expiry_date,
+        # simplistic status logic based on expiry
+        status=case((expiry_date < date.today(), "expired"), else_="active"),
+        created_at=now,
+        updated_at=now,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[credentials.c.provider_id, credentials.c.type, credentials.c.number],
+        set_={
+            "issuer": stmt.excluded.issuer,
+            "expiry_date": stmt.excluded.expiry_date,
+            "status": stmt.excluded.status,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
@@ -0,0 +1,133 @@
+"""
+Single-writer queue with group commit.
+
+SQLite runs one write transaction at a time, and each commit is a sync of the
+journal. With every write endpoint committing on its own, a burst of writes
+turns into lock waits and one commit per request. Instead, handlers hand
+their write to ``write_queue.submit(op)``. ``op`` is a plain function of a
+sync ``Session``. One writer task collects everything submitted within
+WRITE_BATCH_WINDOW_MS, plus whatever arrives while the previous batch is
+committing, up to WRITE_BATCH_MAX ops. It runs them in a single transaction
+and commits once.
+
+Each op runs in its own SAVEPOINT. An op that raises (including an
+``HTTPException`` such as a 404) is rolled back on its own, and its caller
+gets the exception. The rest of the batch still commits. If the commit itself
+fails, every op in the batch gets that error. Ops should return plain data
+(e.g. a response model built after ``db.flush()``): the session is closed
+once the batch is done.
+
+    alert = await write_queue.submit(lambda db: _create_alert(db, alert_in))
+"""
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2"))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "256"))
+
+T = TypeVar("T")
+WriteOp = Callable[[Session], Any]
+
+
+def _begin(db: Session) -> None:
+    conn = db.connection()
+    # pysqlite doesn't BEGIN before a SAVEPOINT, so releasing the first op's
+    # savepoint would commit it on its own. IMMEDIATE also takes the write
+    # lock up front rather than upgrading to it mid-batch.
+    if conn.dialect.name == "sqlite" and not conn.connection.dbapi_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+class WriteCoordinator:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        window_ms: float = WRITE_BATCH_WINDOW_MS,
+        max_batch: int = WRITE_BATCH_MAX,
+    ):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[WriteOp, asyncio.Future]] = []
+        self._writer: Optional[asyncio.Task] = None
+
+    async def submit(self, op: Callable[[Session], T]) -> T:
+        """Run ``op(db)`` in the next group commit; returns its result or raises its error."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Futures and tasks belong to one loop. In production that is
+            # once per container; test clients may spin up several loops.
+            self._loop = loop
+            self._pending = []
+            self._writer = None
+        future = loop.create_future()
+        self._pending.append((op, future))
+        if self._writer is None:
+            # A fresh context: the writer works for every caller, so its
+            # queries mustn't be timed as the first caller's. (Tasks copy the
+            # current context; create_task(context=...) is 3.11+.)
+            self._writer = contextvars.Context().run(loop.create_task, self._run())
+        return await future
+
+    async def _run(self) -> None:
+        # Lives only while there are writes, so no task outlives its loop
+        try:
+            while self._pending:
+                if self.window > 0 and len(self._pending) < self.max_batch:
+                    await asyncio.sleep(self.window)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                try:
+                    outcomes = await run_in_threadpool(self._apply, [op for op, _ in batch])
+                except asyncio.CancelledError:
+                    for _, future in batch + self._pending:
+                        future.cancel()
+                    raise
+                except Exception as e:
+                    outcomes = [(False, e)] * len(batch)
+                for (_, future), (ok, value) in zip(batch, outcomes):
+                    if future.done():  # the caller went away
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self._writer = None
+
+    def _apply(self, ops: List[WriteOp]) -> List[Tuple[bool, Any]]:
+        metrics.WRITE_BATCH_SIZE.observe(len(ops))
+        outcomes: List[Tuple[bool, Any]] = []
+        with self.session_factory() as db:
+            _begin(db)
+            for op in ops:
+                try:
+                    with db.begin_nested():
+                        outcomes.append((True, op(db)))
+                except Exception as e:
+                    outcomes.append((False, e))
+            try:
+                db.commit()
+            except Exception as e:
+                logger.exception("Group commit of %d writes failed", len(ops))
+                db.rollback()
+                outcomes = [(False, e) if ok else (ok, value) for ok, value in outcomes]
+        return outcomes
+
+
+write_queue = WriteCoordinator()
+
+
+def get_write_queue() -> WriteCoordinator:
+    return write_queue
@@ -1,19 +1,25 @@
+import asyncio
+from contextlib import nullcontext
+
 import pytest
 from sqlalchemy import create_engine, StaticPool
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 from datetime import date, timedelta
 
-from credentialwatch_backend.db import Base, get_db
+from credentialwatch_backend.db import Base, get_db, get_read_db
 from credentialwatch_backend.app_cred import app as app_cred
 from credentialwatch_backend.app_alert import app as app_alert
+from credentialwatch_backend import risk
+from credentialwatch_backend.snapshot_cache import snapshot_cache
+from credentialwatch_backend.histogram_cache import histogram_cache
+from credentialwatch_backend.write_queue import WriteCoordinator, get_write_queue
 from credentialwatch_backend.models import Provider, Credential, Alert
 
-# Use in-memory SQLite with StaticPool to share connection across threads/sessions
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-
+# In-memory SQLite: nothing to clean up on disk. StaticPool shares the one
+# connection (and so the one database) across threads.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
+    "sqlite://",
     connect_args={"check_same_thread": False},
     poolclass=StaticPool
 )
@@ -28,8 +34,11 @@ def db_session():
         yield db
     finally:
         db.close()
-        # Drop tables
+        # Drop tables, and what's cached from them
         Base.metadata.drop_all(bind=engine)
+        snapshot_cache.clear()
+        histogram_cache.clear()
+        histogram_cache.reset_stats()
 
 @pytest.fixture(scope="function")
 def client_cred(db_session):
@@ -39,6 +48,9 @@ def client_cred(db_session):
         finally:
             pass
     app_cred.dependency_overrides[get_db] = override_get_db
+    app_cred.dependency_overrides[get_read_db] = override_get_db
+    # Group commits go through the test's session too
+    app_cred.dependency_overrides[get_write_queue] = lambda: WriteCoordinator(lambda: nullcontext(db_session))
     return TestClient(app_cred)
 
 @pytest.fixture(scope="function")
@@ -49,6 +61,8 @@ def client_alert(db_session):
         finally:
             pass
     app_alert.dependency_overrides[get_db] = override_get_db
+    app_alert.dependency_overrides[get_read_db] = override_get_db
+    app_alert.dependency_overrides[get_write_queue] = lambda: WriteCoordinator(lambda: nullcontext(db_session))
     return TestClient(app_alert)
 
 def test_credential_crud_and_expiry(client_cred, db_session):
@@ -118,3 +132,923 @@ def test_alerts_lifecycle(client_alert, db_session):
     resp = client_alert.get("/alerts/open")
     assert resp.status_code == 200, resp.text
     assert len(resp.json()) == 0
+
+def test_batch_sync_from_npi(client_cred, db_session, monkeypatch):
+    from fastapi import HTTPException
+    from credentialwatch_backend import app_cred
+    from credentialwatch_backend.schemas_npi import ProviderDetail, ProviderAddress, ProviderTaxonomy
+
+    async def fake_fetch(npi):
+        if npi == "0000000000":
+            raise HTTPException(status_code=404, detail="Provider not found")
+        return ProviderDetail(
+            npi=npi, full_name=f"Dr. {npi}", enumeration_type="NPI-1",
+            taxonomies=[ProviderTaxonomy(code="207RC0000X", desc="Cardiology", primary=True)],
+            addresses=[ProviderAddress(address_1="1 Main", city="Boston", state="MA", postal_code="02110", country_code="US")],
+        )
+    monkeypatch.setattr(app_cred, "fetch_npi_data", fake_fetch)
+
+    existing = Provider(full_name="Old Name", npi="1111111111", is_active=True)
+    db_session.add(existing)
+    db_session.commit()
+
+    resp = client_cred.post("/providers/sync_from_npi/batch", json={
+        "npis": ["1111111111", "2222222222", "0000000000", "2222222222"],
+        "concurrency": 2,
+    })
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert data["synced"] == 2 and data["failed"] == 1
+    by_npi = {r["npi"]: r for r in data["results"]}
+    assert by_npi["1111111111"]["provider"]["id"] == existing.id
+    assert by_npi["1111111111"]["provider"]["full_name"] == "Dr. 1111111111"
+    assert by_npi["2222222222"]["provider"]["location"] == "Boston, MA"
+    assert by_npi["0000000000"] == {"npi": "0000000000", "ok": False, "provider": None, "error": "NPI not found in registry"}
+    assert db_session.query(Provider).count() == 2
+
+    resp = client_cred.post("/providers/sync_from_npi", json={"npi": "5555555555"})
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["primary_specialty"] == "Cardiology"
+    assert client_cred.post("/providers/sync_from_npi", json={"npi": "0000000000"}).status_code == 404
+
+def test_sync_from_local_nppes_keeps_specialty(client_cred, db_session, monkeypatch, tmp_path):
+    import csv
+    import zipfile
+    from credentialwatch_backend import app_npi, nppes_local
+
+    header = ["NPI", "Entity Type Code", "Provider First Name", "Provider Last Name (Legal Name)",
+              "Provider Business Practice Location Address City Name",
+              "Provider Business Practice Location Address State Name",
+              "Healthcare Provider Taxonomy Code_1", "Healthcare Provider Primary Taxonomy Switch_1"]
+    data = tmp_path / "npidata_pfile_test.csv"
+    with open(data, "w", newline="") as f:
+        csv.writer(f).writerows([header, ["7777777777", "1", "Ada", "Local", "Salem", "OR", "207RC0000X", "Y"]])
+    archive = tmp_path / "dissemination.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.write(data, data.name)
+    assert nppes_local.import_file(str(archive), engine=engine)["rows"] == 1
+
+    monkeypatch.setattr(app_npi, "NPI_BACKEND", "local")
+    monkeypatch.setattr(app_npi, "ReadSessionLocal", TestingSessionLocal)
+    provider = Provider(full_name="Old", npi="7777777777", primary_specialty="Cardiology", is_active=True)
+    db_session.add(provider)
+    db_session.commit()
+
+    resp = client_cred.post("/providers/sync_from_npi", json={"npi": "7777777777"})
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert (body["full_name"], body["location"], body["primary_specialty"]) == ("ADA LOCAL", "Salem, OR", "Cardiology")
+
+def test_expiring_credentials_keyset_pagination(client_cred, db_session):
+    p = Provider(full_name="Paged Prov", npi="3333333333", is_active=True, dept="ER")
+    db_session.add(p)
+    db_session.commit()
+    # Two credentials share an expiry date to exercise the id tie-breaker
+    for i, days in enumerate([5, 3, 3, 20, 40, 400]):
+        db_session.add(Credential(
+            provider_id=p.id, type="lic", issuer="State", number=f"N{i}", status="active",
+            expiry_date=date.today() + timedelta(days=days)
+        ))
+    db_session.commit()
+    risk.rescore(db_session)
+    db_session.commit()
+
+    seen, cursor = [], None
+    for _ in range(5):
+        body = {"window_days": 60, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        resp = client_cred.post("/credentials/expiring", json=body)
+        assert resp.status_code == 200, resp.text
+        seen.extend((r["days_to_expiry"], r["credential"]["number"], r["risk_score"]) for r in resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    # Never verified, no alerts: 0.6 * (1 - days / 180) + 0.25
+    assert seen == [(3, "N1", 0.84), (3, "N2", 0.84), (5, "N0", 0.8333), (20, "N3", 0.7833), (40, "N4", 0.7167)]
+
+    resp = client_cred.post("/credentials/expiring", json={"window_days": 60, "cursor": "not-a-cursor"})
+    assert resp.status_code == 400
+    # Valid base64 JSON of the wrong shape is rejected too, not a 500
+    import base64
+    import json
+    for key, sort in [({"a": 1, "b": 2}, "expiry"), ({"a": 1, "b": 2, "c": 3}, "risk"), ("ab", "expiry"), (7, "expiry")]:
+        cursor = base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+        resp = client_cred.post("/credentials/expiring", json={"window_days": 60, "sort": sort, "cursor": cursor})
+        assert resp.status_code == 400, (key, resp.text)
+
+def test_risk_scores_follow_writes_and_sort(client_cred, client_alert, db_session):
+    p = Provider(full_name="Risk Prov", npi="3434343434", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+
+    def scores():
+        db_session.expire_all()
+        return {c.number: c.risk_score for c in db_session.query(Credential).all()}
+
+    for number, kind, days in [("R0", "dea", 10), ("R1", "bls", 10), ("R2", "lic", 50), ("R3", "lic", 170)]:
+        resp = client_cred.post("/credentials/add_or_update", json={
+            "provider_id": p.id, "type": kind, "issuer": "State", "number": number,
+            "expiry_date": (date.today() + timedelta(days=days)).isoformat(),
+        })
+        assert resp.status_code == 200, resp.text
+    before = scores()
+    # Type weights: dea 1.2 and bls 0.8 around the same expiry; unweighted types in between
+    assert before["R0"] > before["R2"] > before["R1"] and before["R2"] > before["R3"] > 0
+
+    # An open alert raises every score of the provider; resolving it restores them
+    resp = client_alert.post("/alerts", json={"provider_id": p.id, "severity": "critical", "window_days": 7, "message": "x"})
+    assert resp.status_code == 200, resp.text
+    during = scores()
+    assert all(during[n] > before[n] for n in ("R1", "R2", "R3"))
+    assert client_alert.post(f"/alerts/{resp.json()['id']}/resolve", json={}).status_code == 200
+    assert scores() == before
+
+    # Highest risk first, paged by (risk_score, id); min_risk filters on the stored score
+    seen, cursor = [], None
+    for _ in range(5):
+        body = {"window_days": 365, "sort": "risk", "limit": 1, **({"cursor": cursor} if cursor else {})}
+        resp = client_cred.post("/credentials/expiring", json=body)
+        assert resp.status_code == 200, resp.text
+        seen.extend((r["credential"]["number"], r["risk_score"]) for r in resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == sorted(before.items(), key=lambda item: -item[1])
+
+    resp = client_cred.post("/credentials/expiring", json={"window_days": 365, "sort": "risk", "min_risk": before["R2"]})
+    assert [r["credential"]["number"] for r in resp.json()] == ["R0", "R2"]
+    # Cursors don't carry over between sort orders
+    expiry_cursor = client_cred.post("/credentials/expiring", json={"window_days": 365, "limit": 1}).headers["X-Next-Cursor"]
+    resp = client_cred.post("/credentials/expiring", json={"window_days": 365, "sort": "risk", "cursor": expiry_cursor})
+    assert resp.status_code == 400
+
+def test_expiry_histogram_buckets_groups_and_caches(client_cred, db_session):
+    from credentialwatch_backend.diagnostics import count_queries
+
+    cardio = Provider(full_name="Hist A", npi="5656565656", dept="Cardiology", is_active=True)
+    peds = Provider(full_name="Hist B", npi="5757575757", dept="Pediatrics", is_active=True)
+    db_session.add_all([cardio, peds])
+    db_session.commit()
+    today = date.today()
+    for i, (provider, kind, days) in enumerate([
+        (cardio, "dea", 0), (cardio, "lic", 1), (peds, "lic", 1), (peds, "lic", 40), (peds, "dea", 500), (cardio, "lic", -3),
+    ]):
+        db_session.add(Credential(
+            provider_id=provider.id, type=kind, issuer="State", number=f"H{i}",
+            status="expired" if days < 0 else "active", expiry_date=today + timedelta(days=days),
+        ))
+    db_session.commit()
+
+    resp = client_cred.get("/credentials/expiry_histogram", params={"bucket": "day", "group_by": "type", "window_days": 60})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()
+    assert (data["total"], len(data["buckets"])) == (4, 61)
+    assert data["buckets"][0] == {"start": today.isoformat(), "total": 1, "groups": [{"key": "dea", "count": 1}]}
+    assert data["buckets"][1]["groups"] == [{"key": "lic", "count": 2}]
+    assert data["buckets"][40]["total"] == 1 and data["buckets"][2] == {
+        "start": (today + timedelta(days=2)).isoformat(), "total": 0, "groups": []
+    }
+
+    resp = client_cred.get("/credentials/expiry_histogram", params={"bucket": "month", "group_by": "dept", "window_days": 60})
+    buckets = resp.json()["buckets"]
+    assert buckets[0]["start"] == today.replace(day=1).isoformat()
+    assert sum(b["total"] for b in buckets) == 4
+    by_dept = {}
+    for b in buckets:
+        for g in b["groups"]:
+            by_dept[g["key"]] = by_dept.get(g["key"], 0) + g["count"]
+    assert by_dept == {"Cardiology": 2, "Pediatrics": 2}
+
+    histogram_cache.reset_stats()
+    week = client_cred.get("/credentials/expiry_histogram")
+    assert all(date.fromisoformat(b["start"]).weekday() == 0 for b in week.json()["buckets"])
+    # Cached: only the change-versions lookup runs, and the ETag answers 304
+    with count_queries() as statements:
+        again = client_cred.get("/credentials/expiry_histogram")
+    assert again.content == week.content and len(statements) == 1
+    stats = client_cred.get("/cache/histogram_stats").json()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 3)
+    assert client_cred.get("/credentials/expiry_histogram", headers={"If-None-Match": week.headers["ETag"]}).status_code == 304
+
+    # A credential write moves the histogram on
+    resp = client_cred.post("/credentials/add_or_update", json={
+        "provider_id": peds.id, "type": "bls", "issuer": "AHA", "number": "H9",
+        "expiry_date": (today + timedelta(days=3)).isoformat(),
+    })
+    assert resp.status_code == 200, resp.text
+    assert client_cred.get("/credentials/expiry_histogram").json()["total"] == week.json()["total"] + 1
+
+def test_change_feed_logs_every_mutation_once(client_cred, client_alert, db_session):
+    from datetime import datetime
+    from credentialwatch_backend import change_log
+
+    p = Provider(full_name="Feed Prov", npi="6767676767", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+    head = client_cred.get("/changes", params={"limit": 0}).json()
+    assert (head["changes"], head["head"], head["has_more"]) == ([], 1, True)
+
+    cred = {"provider_id": p.id, "type": "lic", "issuer": "State", "number": "F1",
+            "expiry_date": (date.today() + timedelta(days=90)).isoformat()}
+    cred_id = client_cred.post("/credentials/add_or_update", json=cred).json()["id"]
+    # Unchanged upserts and risk re-scores aren't changes
+    client_cred.post("/credentials/add_or_update", json=cred)
+    risk.rescore(db_session, today=date.today() + timedelta(days=30))
+    db_session.commit()
+    client_cred.post("/credentials/add_or_update", json={**cred, "issuer": "Board"})
+    alert_id = client_alert.post("/alerts", json={
+        "provider_id": p.id, "credential_id": cred_id, "severity": "info", "window_days": 90, "message": "m"
+    }).json()["id"]
+    client_alert.post(f"/alerts/{alert_id}/resolve", json={"resolution_note": "renewed"})
+    db_session.query(Alert).filter_by(id=alert_id).delete()
+    db_session.commit()
+
+    seen, since = [], head["head"]
+    while True:
+        page = client_cred.get("/changes", params={"since": since, "limit": 2}).json()
+        seen += page["changes"]
+        since = page["next_since"]
+        if not page["has_more"]:
+            break
+    assert [(c["entity"], c["id"], c["op"]) for c in seen] == [
+        ("credential", cred_id, "insert"), ("credential", cred_id, "update"),
+        ("alert", alert_id, "insert"), ("alert", alert_id, "resolve"), ("alert", alert_id, "delete"),
+    ]
+    assert [c["seq"] for c in seen] == list(range(2, 7)) and since == page["head"] == 6
+    assert all(c["provider_id"] == p.id for c in seen)
+    # data is the row as it is now
+    assert seen[0]["data"]["issuer"] == "Board" and seen[2]["data"] is None
+    assert client_cred.get("/changes", params={"since": 6}).json()["changes"] == []
+
+    # Pruned history can't be replayed; the newest entry is always kept
+    assert change_log.prune(db_session, datetime.utcnow() + timedelta(days=1)) == 5
+    db_session.commit()
+    assert client_cred.get("/changes", params={"since": 4}).status_code == 410
+    assert client_cred.get("/changes", params={"since": 5}).json()["changes"][0]["seq"] == 6
+
+def test_streaming_ndjson_and_csv(client_cred, client_alert, db_session):
+    import csv
+    import io
+    import json
+
+    p = Provider(full_name="Stream Prov", npi="4444444444", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+    for i in range(3):
+        db_session.add(Credential(
+            provider_id=p.id, type="lic", issuer="State", number=f"S{i}", status="active",
+            expiry_date=date.today() + timedelta(days=i + 1)
+        ))
+        db_session.add(Alert(provider_id=p.id, severity="info", window_days=30, message=f"alert {i}"))
+    db_session.commit()
+
+    resp = client_cred.post(
+        "/credentials/expiring", json={"window_days": 30}, headers={"Accept": "application/x-ndjson"}
+    )
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    paged = client_cred.post("/credentials/expiring", json={"window_days": 30}).json()
+    assert lines == paged
+
+    resp = client_alert.get("/alerts/open", headers={"Accept": "text/csv"})
+    assert resp.status_code == 200, resp.text
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert [r["message"] for r in rows] == ["alert 0", "alert 1", "alert 2"]
+    assert rows[0]["resolved_at"] == "" and "T" in rows[0]["created_at"]
+
+def test_stream_negotiation_honors_q_values(client_alert, db_session):
+    def content_type(accept):
+        resp = client_alert.get("/alerts/open", headers={"Accept": accept})
+        assert resp.status_code == 200, resp.text
+        return resp.headers["content-type"].split(";")[0]
+
+    assert content_type("text/csv") == "text/csv"
+    assert content_type("application/json, text/csv;q=0.9") == "application/json"
+    assert content_type("application/json, text/csv;q=0") == "application/json"
+    assert content_type("application/json;q=1, text/csv;q=0.1") == "application/json"
+    assert content_type("application/json;q=0.5, application/x-ndjson") == "application/x-ndjson"
+    assert content_type("*/*") == "application/json"
+    assert content_type("text/*, application/json;q=0.2") == "text/csv"
+    assert content_type("text/csv;q=0, */*") == "application/json"
+
+def test_credential_upserts_share_natural_key(client_cred, db_session):
+    from sqlalchemy.exc import IntegrityError
+
+    p = Provider(full_name="Bulk Prov", npi="6666666666", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+
+    past = (date.today() - timedelta(days=1)).isoformat()
+    future = (date.today() + timedelta(days=90)).isoformat()
+    resp = client_cred.post("/credentials/bulk_upsert", json={"credentials": [
+        {"provider_id": p.id, "type": "lic", "issuer": "State", "number": "A", "expiry_date": past},
+        {"provider_id": p.id, "type": "lic", "issuer": "State", "number": "B"},
+        {"provider_id": 9999, "type": "lic", "issuer": "State", "number": "C"},
+        {"provider_id": p.id, "type": "lic", "issuer": "Renewed", "number": "A", "expiry_date": future},
+    ]})
+    assert resp.status_code == 200, resp.text
+    assert resp.json() == {"upserted": 3, "failed": 1, "errors": [{"index": 2, "error": "Provider not found"}]}
+
+    creds = {c.number: c for c in db_session.query(Credential).all()}
+    assert sorted(creds) == ["A", "B"]
+    assert (creds["A"].issuer, creds["A"].status) == ("Renewed", "active")
+    assert creds["B"].status == "active"
+
+    # The single-row endpoint updates the same row in place
+    resp = client_cred.post("/credentials/add_or_update", json={
+        "provider_id": p.id, "type": "lic", "issuer": "State", "number": "A", "expiry_date": past
+    })
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["id"] == creds["A"].id and resp.json()["status"] == "expired"
+
+    db_session.add(Credential(provider_id=p.id, type="lic", issuer="X", number="B", status="active"))
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+    db_session.rollback()
+
+def test_expiry_sweep_is_set_based_and_idempotent(db_session):
+    from credentialwatch_backend.sweeper import run_sweep
+
+    p = Provider(full_name="Sweep Prov", npi="7777777777", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+    for number, days in [("gone", -3), ("d5", 5), ("d20", 20), ("d60", 60), ("d200", 200), ("none", None)]:
+        db_session.add(Credential(
+            provider_id=p.id, type="lic", issuer="State", number=number, status="active",
+            expiry_date=date.today() + timedelta(days=days) if days is not None else None
+        ))
+    db_session.commit()
+
+    stats = run_sweep(db_session, windows=[90, 30, 7])
+    assert stats == {"expired_alerts": 1, "expired": 1, "window_alerts": 3, "rescored": 6, "pruned_changes": 0}
+    alerts = {a.credential.number: a for a in db_session.query(Alert).all()}
+    assert {n: (a.severity, a.window_days) for n, a in alerts.items()} == {
+        "gone": ("critical", 0), "d5": ("critical", 7), "d20": ("warning", 30), "d60": ("info", 90)
+    }
+    assert alerts["d20"].message == "Credential lic d20 expires in 20 days"
+    assert db_session.query(Credential).filter_by(number="gone").one().status == "expired"
+
+    # Re-running changes nothing
+    assert run_sweep(db_session, windows=[90, 30, 7]) == {"expired_alerts": 0, "expired": 0, "window_alerts": 0, "rescored": 0, "pruned_changes": 0}
+    # Fifteen days on, d20 crosses the 7-day window and d5 expires
+    later = run_sweep(db_session, today=date.today() + timedelta(days=15), windows=[90, 30, 7])
+    assert later == {"expired_alerts": 1, "expired": 1, "window_alerts": 1, "rescored": 6, "pruned_changes": 0}
+
+def test_alert_summary_counters(client_alert, db_session):
+    from credentialwatch_backend import alert_counters
+    from credentialwatch_backend.sweeper import run_sweep
+
+    p1 = Provider(full_name="Count Prov 1", is_active=True)
+    p2 = Provider(full_name="Count Prov 2", is_active=True)
+    db_session.add_all([p1, p2])
+    db_session.commit()
+    ids = []
+    for provider, severity in [(p1, "critical"), (p1, "warning"), (p2, "critical")]:
+        resp = client_alert.post("/alerts", json={
+            "provider_id": provider.id, "severity": severity, "window_days": 7, "message": "m"
+        })
+        ids.append(resp.json()["id"])
+    client_alert.post(f"/alerts/{ids[1]}/resolve", json={})
+    # Resolving twice must not decrement again
+    client_alert.post(f"/alerts/{ids[1]}/resolve", json={})
+
+    assert client_alert.post("/alerts/summary", json={}).json() == {"critical": 2}
+    assert client_alert.post("/alerts/summary", json={"window_days": 1}).json() == {"critical": 2}
+    assert alert_counters.open_counts(db_session, p1.id) == {"critical": 1}
+
+    # Sweeper-created alerts are counted too
+    db_session.add(Credential(
+        provider_id=p2.id, type="lic", issuer="State", number="S1", status="active",
+        expiry_date=date.today() + timedelta(days=20)
+    ))
+    db_session.commit()
+    run_sweep(db_session, windows=[30])
+    assert client_alert.post("/alerts/summary", json={}).json() == {"critical": 2, "warning": 1}
+
+    # Drift is repaired by a rebuild
+    db_session.query(Alert).filter(Alert.id == ids[0]).delete()
+    db_session.commit()
+    assert alert_counters.rebuild(db_session) == {"rows": 4, "drift": 2}
+    assert client_alert.post("/alerts/summary", json={}).json() == {"critical": 1, "warning": 1}
+    assert alert_counters.rebuild(db_session)["drift"] == 0
+
+def test_provider_snapshot_batch_uses_fixed_queries(client_cred, db_session):
+    from sqlalchemy import event
+
+    providers = [Provider(full_name=f"Snap {i}", npi=f"50000000{i:02d}", is_active=True) for i in range(20)]
+    db_session.add_all(providers)
+    db_session.commit()
+    for p in providers:
+        db_session.add_all([
+            Credential(provider_id=p.id, type="lic", issuer="State", number=f"L{p.id}", status="active",
+                       expiry_date=date.today() + timedelta(days=30)),
+            Credential(provider_id=p.id, type="dea", issuer="DEA", number=f"D{p.id}", status="active"),
+            Alert(provider_id=p.id, severity="info", window_days=30, message="open"),
+            Alert(provider_id=p.id, severity="info", window_days=30, message="done", resolved_at=date.today()),
+        ])
+    db_session.commit()
+    ids = [p.id for p in providers]
+    db_session.expire_all()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        resp = client_cred.post("/providers/snapshot/batch", json={
+            "provider_ids": ids[:15] + [9999],
+            "npis": ["5000000019", "5000000000", "0000000000"],
+            "include_alerts": True,
+        })
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert resp.status_code == 200, resp.text
+    # providers, credentials, open alerts
+    assert len(statements) == 3
+
+    data = resp.json()
+    assert len(data["snapshots"]) == 16
+    assert data["missing_ids"] == [9999]
+    assert data["missing_npis"] == ["0000000000"]
+    snap = data["snapshots"][str(ids[19])]
+    assert snap["provider"]["npi"] == "5000000019"
+    assert len(snap["credentials"]) == 2
+    assert [a["message"] for a in snap["open_alerts"]] == ["open"]
+
+def test_conditional_reads_follow_change_versions(client_cred, client_alert, db_session):
+    p = Provider(full_name="ETag Prov", npi="8888888888", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+
+    def alert():
+        return client_alert.post("/alerts", json={
+            "provider_id": p.id, "severity": "info", "window_days": 30, "message": "m"
+        })
+
+    alert()
+    first = client_alert.get("/alerts/open")
+    etag = first.headers["ETag"]
+    again = client_alert.get("/alerts/open", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    # Different parameters or representation get their own tag
+    assert client_alert.get("/alerts/open?severity=info", headers={"If-None-Match": etag}).status_code == 200
+    assert client_alert.get("/alerts/open", headers={"If-None-Match": etag, "Accept": "text/csv"}).status_code == 200
+
+    alert()
+    changed = client_alert.get("/alerts/open", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+    assert changed.headers["ETag"] != etag
+
+    # Alert writes don't invalidate credential reads, credential writes do
+    body = {"window_days": 60}
+    etag = client_cred.post("/credentials/expiring", json=body).headers["ETag"]
+    alert()
+    assert client_cred.post("/credentials/expiring", json=body, headers={"If-None-Match": etag}).status_code == 304
+    client_cred.post("/credentials/add_or_update", json={
+        "provider_id": p.id, "type": "lic", "issuer": "State", "number": "E1",
+        "expiry_date": str(date.today() + timedelta(days=10)),
+    })
+    resp = client_cred.post("/credentials/expiring", json=body, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert len(resp.json()) == 1
+
+def test_fast_json_path_is_byte_compatible(client_cred, client_alert, db_session):
+    from datetime import datetime
+    from typing import List
+    from pydantic import TypeAdapter
+    from credentialwatch_backend.schemas_alert import AlertResponse
+    from credentialwatch_backend.schemas_cred import ExpiringCredentialResult
+
+    p = Provider(full_name="Dr. Zoë Ñúñez", npi="9090909090", dept="Cardiología", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+    for i, days in enumerate([3, 45]):
+        db_session.add(Credential(
+            provider_id=p.id, type="lic", issuer="État", number=f"F{i}", status="active",
+            issue_date=date(2020, 1, 1), expiry_date=date.today() + timedelta(days=days),
+            last_verified_at=datetime(2024, 5, 6, 7, 8, 9, 123456), metadata_json={"k": [1, 2.5, "é"]},
+        ))
+    db_session.add(Alert(provider_id=p.id, severity="info", window_days=7, message="naïve \"quoted\"",
+                         created_at=datetime(2024, 1, 2, 3, 4, 5)))
+    risk.rescore(db_session)
+    db_session.commit()
+    db_session.expire_all()  # the scores were written with plain UPDATEs
+
+    creds = db_session.query(Credential).order_by(Credential.expiry_date).all()
+    expected = TypeAdapter(List[ExpiringCredentialResult]).dump_json([
+        ExpiringCredentialResult(provider=p, credential=c, days_to_expiry=(c.expiry_date - date.today()).days,
+                                 risk_score=c.risk_score)
+        for c in creds
+    ])
+    assert client_cred.post("/credentials/expiring", json={"window_days": 60}).content == expected
+
+    alerts = db_session.query(Alert).all()
+    expected = TypeAdapter(List[AlertResponse]).dump_json([AlertResponse.model_validate(a) for a in alerts])
+    assert client_alert.get("/alerts/open").content == expected
+
+def test_provider_search_fts(client_cred, db_session):
+    providers = [
+        Provider(full_name="Dr. Zoë Carter", dept="Cardiology", location="Boston, MA", primary_specialty="Cardiology", is_active=True),
+        Provider(full_name="Dr. Carl Boston", dept="Pediatrics", location="New York, NY", is_active=True),
+        Provider(full_name="Dr. Ann Lee", dept="Cardiology", location="Newark, NJ", is_active=False),
+    ]
+    db_session.add_all(providers)
+    db_session.commit()
+    for p in providers:
+        db_session.add(Credential(provider_id=p.id, type="lic", issuer="State", number=f"N{p.id}", status="active",
+                                  expiry_date=date.today() + timedelta(days=10)))
+    db_session.commit()
+
+    def names(**params):
+        resp = client_cred.get("/providers/search", params=params)
+        assert resp.status_code == 200, resp.text
+        return [p["full_name"] for p in resp.json()]
+
+    assert names(q="zoe") == ["Dr. Zoë Carter"]
+    # Matches in two columns outrank one
+    assert names(q="cardio") == ["Dr. Zoë Carter"]
+    assert names(q="cardio", active_only=False) == ["Dr. Zoë Carter", "Dr. Ann Lee"]
+    assert sorted(names(q="boston")) == ["Dr. Carl Boston", "Dr. Zoë Carter"]
+    assert client_cred.get("/providers/search", params={"q": "\"*"}).status_code == 400
+
+    # Triggers keep the index in step with updates
+    providers[1].location = "Chicago, IL"
+    db_session.commit()
+    assert names(q="york") == []
+    assert names(q="chicago") == ["Dr. Carl Boston"]
+
+    # The expiring location filter goes through the index: word prefixes, not city-in-name
+    resp = client_cred.post("/credentials/expiring", json={"window_days": 30, "location": "bost"})
+    assert [r["provider"]["full_name"] for r in resp.json()] == ["Dr. Zoë Carter"]
+    # A location without words is an error, not "every location"
+    resp = client_cred.post("/credentials/expiring", json={"window_days": 30, "location": ",,"})
+    assert resp.status_code == 400, resp.text
+
+def test_roster_import_csv_and_jsonl(client_cred, db_session, monkeypatch):
+    import io
+    import json
+
+    from credentialwatch_backend import app_cred as app_cred_module, roster_import
+
+    # Upload in small pieces so the spool is written across several flushes
+    monkeypatch.setattr(app_cred_module, "ROSTER_SPOOL_BUFFER_BYTES", 64)
+
+    existing = Provider(full_name="Old Name", npi="1000000001", dept="Surgery", is_active=True)
+    db_session.add(existing)
+    db_session.commit()
+
+    expiry = str(date.today() + timedelta(days=40))
+    csv_body = "\n".join([
+        "npi,full_name,dept,location,type,issuer,number,expiry_date",
+        f"1000000001,Dr. New Name,,Boston MA,lic,State,A1,{expiry}",
+        f"1000000002,Dr. Created,Cardiology,,dea,DEA,D1,{expiry}",
+        f"1000000002,,,,lic,State,A2,2000-01-01",
+        f"1000000003,,,,lic,State,A3,{expiry}",        # unknown NPI, no name
+        f"12345,Dr. Bad,,,lic,State,A4,{expiry}",       # invalid NPI
+        f"1000000004,Dr. Half,,,lic,,A5,{expiry}",      # incomplete credential
+        "1000000005,Dr. Provider Only,,,,,,",
+    ]) + "\n"
+    pieces = (csv_body[i:i + 20].encode() for i in range(0, len(csv_body), 20))
+    resp = client_cred.post("/credentials/import", content=pieces, headers={"Content-Type": "text/csv"})
+    assert resp.status_code == 200, resp.text
+    report = resp.json()
+    assert (report["rows"], report["failed"]) == (7, 3), report["errors"]
+    assert {e["line"] for e in report["errors"]} == {5, 6, 7}
+    assert "npi" in next(e["error"] for e in report["errors"] if e["line"] == 6)
+    assert report["providers_created"] == 2 and report["providers_updated"] == 1
+    assert report["credentials_upserted"] == 3
+
+    db_session.expire_all()
+    db_session.refresh(existing)
+    assert (existing.full_name, existing.dept, existing.location) == ("Dr. New Name", "Surgery", "Boston MA")
+    created = db_session.query(Provider).filter_by(npi="1000000002").one()
+    assert {c.number: c.status for c in created.credentials} == {"D1": "active", "A2": "expired"}
+
+    # JSONL, re-importing the same credential updates it in place
+    lines = [json.dumps({"npi": "1000000002", "type": "dea", "issuer": "DEA", "number": "D1", "expiry_date": "2001-01-01"}), "not json"]
+    report = roster_import.import_roster(db_session, io.BytesIO("\n".join(lines).encode()), "jsonl", batch_size=1)
+    assert (report.rows, report.credentials_upserted, report.failed) == (2, 1, 1)
+    assert db_session.query(Credential).filter_by(number="D1").one().status == "expired"
+
+    assert client_cred.post("/credentials/import", content="x", headers={"Content-Type": "application/pdf"}).status_code == 415
+
+def test_roster_import_reports_non_utf8_rows(client_cred, db_session, monkeypatch):
+    from credentialwatch_backend import roster_import
+
+    expiry = str(date.today() + timedelta(days=40))
+    # Windows-1252, as Excel exports it: the accented row fails, the rest import
+    csv_body = "\n".join([
+        "npi,full_name,type,issuer,number,expiry_date",
+        f"1000000011,Dr. José Núñez,lic,State,B1,{expiry}",
+        f"1000000012,Dr. Plain,lic,State,B2,{expiry}",
+        f"1000000013,Dr. Nul\x00,lic,State,B3,{expiry}",
+    ]).encode("cp1252") + b"\n"
+    resp = client_cred.post("/credentials/import", content=csv_body, headers={"Content-Type": "text/csv"})
+    assert resp.status_code == 200, resp.text
+    report = resp.json()
+    assert (report["rows"], report["failed"], report["providers_created"]) == (3, 2, 1)
+    assert "UTF-8" in next(e["error"] for e in report["errors"] if e["line"] == 2)
+    assert "NUL" in next(e["error"] for e in report["errors"] if e["line"] == 4)
+
+    # A failed batch counts each row once, unknown-NPI rows included
+    def boom(*args, **kwargs):
+        raise roster_import.SQLAlchemyError("boom")
+    rows = f"npi,full_name,type,issuer,number,expiry_date\n1000000014,,lic,State,B4,{expiry}\n1000000012,,lic,State,B5,{expiry}\n"
+    monkeypatch.setattr(roster_import.risk, "rescore_providers", boom)
+    resp = client_cred.post("/credentials/import", content=rows, headers={"Content-Type": "text/csv"})
+    report = resp.json()
+    assert (report["rows"], report["failed"], len(report["errors"])) == (2, 2, 2)
+
+def test_metrics_middleware_and_server_timing(client_cred, db_session):
+    from credentialwatch_backend import metrics
+    from credentialwatch_backend.modal_app import create_app
+
+    p = Provider(full_name="Timed Prov", npi="5555555555", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+    client = TestClient(create_app())
+
+    resp = client.post("/cred/providers/snapshot", json={"provider_id": p.id})
+    assert resp.status_code == 200
+    timing = dict(part.strip().split(";", 1) for part in resp.headers["server-timing"].split(","))
+    assert set(timing) == {"db", "upstream", "serialize", "total"}
+    # Provider, credentials; the repeat below is served from the snapshot cache
+    assert 'desc="2 queries"' in timing["db"]
+
+    before = metrics.HTTP_DB_QUERIES.value("/cred/providers/snapshot")
+    resp = client.post("/cred/providers/snapshot", json={"provider_id": p.id})
+    queries = int(resp.headers["server-timing"].split('desc="')[1].split()[0])
+    assert metrics.HTTP_DB_QUERIES.value("/cred/providers/snapshot") == before + queries
+    assert metrics.HTTP_REQUESTS.value("POST", "/cred/providers/snapshot", "200") >= 2
+    client.get("/cred/no/such/path")
+    assert metrics.HTTP_REQUESTS.value("GET", "unmatched", "404") >= 1
+
+    resp = client.get("/metrics")
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/cred/providers/snapshot",le="+Inf"}' in resp.text
+    assert "db_query_duration_seconds_count" in resp.text
+
+def test_query_count_limits_per_endpoint(client_cred, db_session):
+    from credentialwatch_backend.diagnostics import assert_max_queries
+
+    providers = [Provider(full_name=f"Count {i}", npi=f"60000000{i:02d}", is_active=True) for i in range(10)]
+    db_session.add_all(providers)
+    db_session.commit()
+    db_session.add_all([
+        Credential(provider_id=p.id, type="lic", issuer="State", number=f"C{p.id}-{j}", status="active",
+                   expiry_date=date.today() + timedelta(days=5 + j))
+        for p in providers for j in range(3)
+    ])
+    db_session.commit()
+    provider_id = providers[0].id
+    db_session.expire_all()
+
+    # Per-row lazy loads would make these grow with the result size
+    with assert_max_queries(2):
+        resp = client_cred.post("/credentials/expiring", json={"window_days": 30})
+    assert len(resp.json()) == 30
+    with assert_max_queries(3):
+        client_cred.post("/providers/snapshot", json={"provider_id": provider_id})
+
+    with pytest.raises(AssertionError, match="expected at most 1"):
+        with assert_max_queries(1):
+            for p in providers[:3]:
+                db_session.expire(p)
+                p.credentials
+
+def test_diagnostics_logs_slow_queries_scans_and_n_plus_one(db_session, caplog, monkeypatch):
+    from credentialwatch_backend import diagnostics
+
+    providers = [Provider(full_name=f"Diag {i}", npi=f"70000000{i:02d}", is_active=True) for i in range(6)]
+    db_session.add_all(providers)
+    db_session.commit()
+    db_session.expire_all()
+
+    monkeypatch.setattr(diagnostics, "SLOW_QUERY_MS", 0)
+    diagnostics.enable(engine)
+    try:
+        with caplog.at_level("WARNING", logger="credentialwatch_backend.diagnostics"):
+            with diagnostics.request_scope("GET /test"):
+                for p in db_session.query(Provider).all():
+                    p.credentials
+                db_session.query(Credential).filter(Credential.issuer == "nobody").all()
+    finally:
+        diagnostics.disable(engine)
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(m.startswith("Slow query") and "plan:" in m for m in messages)
+    assert any(m.startswith("Full table scan (SCAN credentials)") and "issuer" in m for m in messages)
+    n_plus_one = [m for m in messages if m.startswith("Possible N+1 in GET /test: 6 x")]
+    assert len(n_plus_one) == 1 and "FROM credentials" in n_plus_one[0]
+
+# Self import time of our own modules (`python -X importtime`), with the
+# third-party stack already imported. About 20 ms and 130 ms when written;
+# the slack is for slow CI machines, not for new import-time work.
+CREATE_APP_IMPORT_BUDGET_MS = 60
+ALL_APPS_IMPORT_BUDGET_MS = 400
+
+def _own_import_times(code: str) -> dict:
+    import subprocess
+    import sys
+
+    preload = "import fastapi, modal, sqlalchemy, pydantic, httpx, orjson\n"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", preload + code], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if name.strip().startswith("credentialwatch_backend") and self_us.strip().isdigit():
+            times[name.strip()] = int(self_us) / 1000
+    return times
+
+def test_cold_start_import_budget(client_alert):
+    from credentialwatch_backend.modal_app import create_app
+    from credentialwatch_backend.startup import LazyApp
+
+    cold = _own_import_times("from credentialwatch_backend.modal_app import create_app\ncreate_app()")
+    # Sub-apps, their models and schemas load on first request, not at start-up
+    eager = {m for m in cold if m.split(".")[-1].startswith(("app_", "models", "schemas_"))}
+    assert not eager, f"imported by create_app(): {sorted(eager)}"
+    assert sum(cold.values()) < CREATE_APP_IMPORT_BUDGET_MS, cold
+
+    full = _own_import_times(
+        "import credentialwatch_backend.app_cred, credentialwatch_backend.app_npi, credentialwatch_backend.app_alert"
+    )
+    assert sum(full.values()) < ALL_APPS_IMPORT_BUDGET_MS, sorted(full.items(), key=lambda kv: -kv[1])[:10]
+
+    app = create_app()
+    lazy = {route.path: route.app for route in app.routes if isinstance(getattr(route, "app", None), LazyApp)}
+    assert set(lazy) == {"/cred", "/npi", "/alert"} and not any(sub.loaded for sub in lazy.values())
+    TestClient(app).get("/alert/alerts/open", params={"provider_id": 0})
+    assert lazy["/alert"].loaded and not lazy["/cred"].loaded
+
+def test_write_queue_group_commits_and_isolates_failures(db_session):
+    import asyncio
+    from fastapi import HTTPException
+    from sqlalchemy import event, func, select, text
+    from sqlalchemy.exc import OperationalError
+    from credentialwatch_backend import metrics
+
+    p = Provider(full_name="Queue Prov", npi="8888888888", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+    provider_id = p.id
+
+    def write(i):
+        def op(db):
+            if i == 3:
+                raise HTTPException(status_code=404, detail="Provider not found")
+            if i == 6:
+                db.execute(text("INSERT INTO no_such_table VALUES (1)"))
+            alert = Alert(provider_id=provider_id, severity="info", window_days=1, message=f"burst {i}")
+            db.add(alert)
+            db.flush()
+            return alert.id
+        return op
+
+    commits = []
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    event.listen(engine, "commit", on_commit)
+    batches = metrics.WRITE_BATCH_SIZE.count()
+    coordinator = WriteCoordinator(TestingSessionLocal, window_ms=20)
+
+    async def burst():
+        return await asyncio.gather(*(coordinator.submit(write(i)) for i in range(10)), return_exceptions=True)
+
+    try:
+        results = asyncio.run(burst())
+    finally:
+        event.remove(engine, "commit", on_commit)
+
+    # One transaction for the whole burst; each caller gets its own outcome
+    assert len(commits) == 1 and metrics.WRITE_BATCH_SIZE.count() == batches + 1
+    assert isinstance(results[3], HTTPException) and results[3].status_code == 404
+    assert isinstance(results[6], OperationalError)
+    ids = [r for i, r in enumerate(results) if i not in (3, 6)]
+    assert all(isinstance(r, int) for r in ids) and len(set(ids)) == 8
+    assert db_session.scalar(select(func.count()).select_from(Alert)) == 8
+
+def test_write_queue_default_dependency(client_alert, db_session, monkeypatch):
+    from contextvars import ContextVar
+    from credentialwatch_backend import write_queue as write_queue_module
+
+    # The real get_write_queue and module-level coordinator, on the test database
+    del app_alert.dependency_overrides[get_write_queue]
+    monkeypatch.setattr(write_queue_module.write_queue, "session_factory", TestingSessionLocal)
+    p = Provider(full_name="Default Queue Prov", npi="8989898989", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+
+    resp = client_alert.post("/alerts", json={"provider_id": p.id, "severity": "info", "window_days": 7, "message": "q"})
+    assert resp.status_code == 200, resp.text
+    resp = client_alert.post(f"/alerts/{resp.json()['id']}/resolve", json={})
+    assert resp.status_code == 200 and resp.json()["resolved_at"] is not None
+
+    # Ops run outside the submitting caller's context
+    caller = ContextVar("caller", default=None)
+
+    async def submit():
+        caller.set("request")
+        return await write_queue_module.write_queue.submit(lambda db: caller.get())
+    assert asyncio.run(submit()) is None
+
+def test_sqlite_profile_pragmas_and_read_only_pool(tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from credentialwatch_backend.db import create_sqlite_engine
+
+    url = f"sqlite:///{tmp_path / 'pragmas.db'}"
+    writer = create_sqlite_engine(url, profile="performance")
+    reader = create_sqlite_engine(url, profile="performance", read_only=True)
+    try:
+        with writer.begin() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert conn.execute(text("PRAGMA query_only")).scalar() == 0
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+
+        with reader.connect() as conn:
+            assert conn.execute(text("PRAGMA query_only")).scalar() == 1
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert conn.execute(text("SELECT x FROM t")).scalar() == 1
+            with pytest.raises(OperationalError, match="readonly"):
+                conn.execute(text("INSERT INTO t VALUES (2)"))
+    finally:
+        reader.dispose()
+        writer.dispose()
+
+def test_snapshot_cache_skips_db_and_follows_writes(client_cred, client_alert, db_session):
+    from credentialwatch_backend.diagnostics import assert_max_queries
+    from credentialwatch_backend.schemas_cred import ProviderSnapshotBatchResponse, ProviderSnapshotResponse
+    from credentialwatch_backend.snapshot_cache import SnapshotCache
+
+    p = Provider(full_name="Cached Prov", npi="4040404040", is_active=True)
+    db_session.add(p)
+    db_session.commit()
+    db_session.add(Credential(provider_id=p.id, type="lic", issuer="State", number="K1", status="active",
+                              expiry_date=date.today() + timedelta(days=20)))
+    db_session.commit()
+    provider_id = p.id
+
+    first = client_cred.post("/providers/snapshot", json={"provider_id": provider_id})
+    assert first.content == ProviderSnapshotResponse(provider=p, credentials=p.credentials).model_dump_json().encode()
+    with assert_max_queries(0):
+        hot = client_cred.post("/providers/snapshot", json={"provider_id": provider_id})
+        etag = hot.headers["ETag"]
+        assert client_cred.post("/providers/snapshot", json={"provider_id": provider_id},
+                                headers={"If-None-Match": etag}).status_code == 304
+    assert hot.content == first.content
+    client_cred.post("/providers/snapshot", json={"npi": "4040404040"})
+    with assert_max_queries(0):
+        assert client_cred.post("/providers/snapshot", json={"npi": "4040404040"}).content == first.content
+
+    batch = {"provider_ids": [provider_id, 9999], "include_alerts": True}
+    cold = client_cred.post("/providers/snapshot/batch", json=batch)
+    db_session.expire_all()
+    assert cold.content == ProviderSnapshotBatchResponse(
+        snapshots={provider_id: {"provider": p, "credentials": p.credentials, "open_alerts": []}},
+        missing_ids=[9999], missing_npis=[],
+    ).model_dump_json().encode()
+    # Unknown ids aren't cached; known ones are
+    with assert_max_queries(0):
+        hot = client_cred.post("/providers/snapshot/batch", json={"provider_ids": [provider_id], "include_alerts": True})
+    assert hot.json()["snapshots"] == cold.json()["snapshots"]
+
+    # An alert only invalidates the cached open alerts
+    client_alert.post("/alerts", json={"provider_id": provider_id, "severity": "info", "window_days": 30, "message": "m"})
+    with assert_max_queries(0):
+        client_cred.post("/providers/snapshot", json={"provider_id": provider_id})
+    snap = client_cred.post("/providers/snapshot/batch", json=batch).json()["snapshots"][str(provider_id)]
+    assert [a["message"] for a in snap["open_alerts"]] == ["m"]
+
+    # A credential write invalidates the provider
+    client_cred.post("/credentials/add_or_update", json={
+        "provider_id": provider_id, "type": "lic", "issuer": "State", "number": "K2",
+        "expiry_date": str(date.today() + timedelta(days=40)),
+    })
+    resp = client_cred.post("/providers/snapshot", json={"provider_id": provider_id})
+    assert resp.headers["ETag"] != etag
+    assert {c["number"] for c in resp.json()["credentials"]} == {"K1", "K2"}
+
+    stats = client_cred.get("/cache/stats").json()
+    assert stats["entries"] == 1 and stats["invalidations"] >= 2 and 0 < stats["hit_ratio"] < 1
+
+    # The byte budget evicts least recently used providers
+    small = SnapshotCache(max_bytes=1000)
+    others = [Provider(full_name=f"Budget {i}", npi=f"41000000{i:02d}", is_active=True) for i in range(5)]
+    db_session.add_all(others)
+    db_session.commit()
+    for other in others:
+        small.put(small.generation, other, [])
+    assert small.snapshot()["bytes"] <= 1000 and small.stats["evictions"] > 0
+    assert small.get(provider_id=others[-1].id) is not None and small.get(provider_id=others[0].id) is None
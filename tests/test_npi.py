@@ -0,0 +1,259 @@
+import asyncio
+
+import httpx
+
+from credentialwatch_backend.nppes_client import NPPESClient
+
+
+def test_nppes_client_coalesces_identical_inflight_requests():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(str(request.url))
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"results": [{"number": request.url.params["number"]}]})
+
+    async def run():
+        client = NPPESClient(base_url="http://nppes.test/api/", transport=httpx.MockTransport(handler))
+        same = [client.fetch({"version": "2.1", "number": "1234567890"}) for _ in range(5)]
+        other = client.fetch({"number": "0987654321", "version": "2.1"})
+        results = await asyncio.gather(*same, other)
+        # Once settled, a repeat lookup goes upstream again
+        await client.fetch({"version": "2.1", "number": "1234567890"})
+        await client.aclose()
+        return client, results
+
+    client, results = asyncio.run(run())
+    assert len(calls) == 3
+    assert client.upstream_calls == 3
+    assert client.coalesced_calls == 4
+    assert results[0] is results[4]
+    assert results[5]["results"][0]["number"] == "0987654321"
+
+
+def test_npi_cache_tiers_and_stale_while_revalidate():
+    from sqlalchemy import create_engine, StaticPool
+    from sqlalchemy.orm import sessionmaker
+
+    from credentialwatch_backend.db import Base
+    from credentialwatch_backend.npi_cache import NPICache
+
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    upstream = []
+
+    async def loader():
+        upstream.append(1)
+        return {"results": [{"number": "1234567890", "version": len(upstream)}]}
+
+    async def run():
+        cache = NPICache(max_entries=1, ttls={"provider": (60, 60)}, session_factory=factory)
+        first = await cache.get_or_fetch("provider", "1234567890", loader)
+        again = await cache.get_or_fetch("provider", "1234567890", loader)
+        assert again is first and len(upstream) == 1
+
+        # A fresh process only has the persistent tier
+        restarted = NPICache(ttls={"provider": (60, 60)}, session_factory=factory)
+        persisted = await restarted.get_or_fetch("provider", "1234567890", loader)
+        assert persisted == first and len(upstream) == 1
+
+        # Past the fresh TTL the stale payload is served while it refreshes
+        restarted._memory[("provider", "1234567890")].fetched_at -= 90
+        stale = await restarted.get_or_fetch("provider", "1234567890", loader)
+        assert stale["results"][0]["version"] == 1
+        await asyncio.sleep(0.05)
+        refreshed = await restarted.get_or_fetch("provider", "1234567890", loader)
+        assert refreshed["results"][0]["version"] == 2
+
+        await cache.get_or_fetch("provider", "0987654321", loader)
+
+        # Warm-up loads the newest persisted entries straight into memory
+        primed = NPICache(max_entries=1, ttls={"provider": (60, 60)}, session_factory=factory)
+        assert await primed.prime() == 1
+        assert list(primed._memory) == [("provider", "0987654321")]
+        return cache, restarted
+
+    cache, restarted = asyncio.run(run())
+    assert cache.stats["evictions"] == 1
+    assert cache.stats["memory_hits"] == 1
+    assert restarted.stats["persistent_hits"] == 1
+    assert restarted.stats["stale_hits"] == 1
+    assert restarted.stats["refreshes"] == 1
+
+
+def test_npi_cache_coalesces_misses_and_persists_once():
+    from sqlalchemy import create_engine, select, StaticPool
+    from sqlalchemy.orm import sessionmaker
+
+    from credentialwatch_backend.db import Base
+    from credentialwatch_backend.models import NPICacheEntry
+    from credentialwatch_backend.npi_cache import NPICache
+    from credentialwatch_backend.write_queue import WriteCoordinator
+
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    writes = WriteCoordinator(factory, window_ms=20)
+    submitted = []
+    submit = writes.submit
+
+    async def counting_submit(op):
+        submitted.append(op)
+        return await submit(op)
+    writes.submit = counting_submit
+    upstream = []
+
+    async def loader():
+        upstream.append(1)
+        await asyncio.sleep(0.01)
+        return {"results": [{"number": "1234567890"}]}
+
+    async def run():
+        cache = NPICache(ttls={"provider": (60, 60)}, session_factory=factory, writes=writes)
+        same = await asyncio.gather(*(cache.get_or_fetch("provider", "1234567890", loader) for _ in range(5)))
+        # Distinct misses are persisted in one group commit
+        await asyncio.gather(*(cache.get_or_fetch("provider", str(n), loader) for n in range(10)))
+        return cache, same
+
+    from credentialwatch_backend import metrics
+
+    batches = metrics.WRITE_BATCH_SIZE.count()
+    cache, same = asyncio.run(run())
+    assert metrics.WRITE_BATCH_SIZE.count() - batches <= 3  # not one commit per store
+    assert len(upstream) == 11 and all(r is same[0] for r in same)
+    assert cache.stats["misses"] == 15 and cache.stats["coalesced"] == 4
+    assert len(submitted) == 11
+    with factory() as db:
+        assert len(db.execute(select(NPICacheEntry.cache_key)).all()) == 11
+
+
+NPPES_HEADER = [
+    "NPI", "Entity Type Code", "Replacement NPI", "Employer Identification Number (EIN)",
+    "Provider Organization Name (Legal Business Name)", "Provider Last Name (Legal Name)",
+    "Provider First Name", "Provider Middle Name",
+    "Provider First Line Business Mailing Address", "Provider Second Line Business Mailing Address",
+    "Provider Business Mailing Address City Name", "Provider Business Mailing Address State Name",
+    "Provider Business Mailing Address Postal Code",
+    "Provider Business Mailing Address Country Code (If outside U.S.)",
+    "Provider First Line Business Practice Location Address",
+    "Provider Second Line Business Practice Location Address",
+    "Provider Business Practice Location Address City Name",
+    "Provider Business Practice Location Address State Name",
+    "Provider Business Practice Location Address Postal Code",
+    "Provider Business Practice Location Address Country Code (If outside U.S.)",
+    "Provider Business Practice Location Address Telephone Number",
+    "Last Update Date", "NPI Deactivation Date", "NPI Reactivation Date",
+    "Healthcare Provider Taxonomy Code_1", "Provider License Number_1",
+    "Provider License Number State Code_1", "Healthcare Provider Primary Taxonomy Switch_1",
+]
+
+
+def _write_nppes_file(path, rows):
+    import csv
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(NPPES_HEADER)
+        for r in rows:
+            writer.writerow([r.get(col, "") for col in NPPES_HEADER])
+
+
+def _nppes_row(npi, last, first, state, **extra):
+    row = {
+        "NPI": npi, "Entity Type Code": "1",
+        "Provider Last Name (Legal Name)": last, "Provider First Name": first,
+        "Provider First Line Business Practice Location Address": "1 MAIN ST",
+        "Provider Business Practice Location Address City Name": "SPRINGFIELD",
+        "Provider Business Practice Location Address State Name": state,
+        "Provider Business Practice Location Address Postal Code": "012340000",
+        "Provider Business Practice Location Address Country Code (If outside U.S.)": "US",
+        "Last Update Date": "01/15/2024",
+        "Healthcare Provider Taxonomy Code_1": "207RC0000X",
+        "Provider License Number_1": f"LIC{npi[-3:]}",
+        "Provider License Number State Code_1": state,
+        "Healthcare Provider Primary Taxonomy Switch_1": "Y",
+    }
+    row.update(extra)
+    return row
+
+
+def test_nppes_local_import_delta_and_lookup(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from credentialwatch_backend import app_npi, nppes_local
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'nppes.db'}")
+    full = tmp_path / "npidata_pfile.csv"
+    _write_nppes_file(full, [
+        _nppes_row(f"1{i:09d}", "SMITH" if i % 2 else "JONES", f"ALEX{i}", "MA" if i % 3 else "NY")
+        for i in range(1, 101)
+    ])
+    stats = nppes_local.import_file(str(full), engine=engine, batch_size=7, commit_every=20)
+    assert stats["rows"] == 100
+
+    # Weekly delta: one rename, one deactivation, one new NPI
+    delta = tmp_path / "npidata_pfile_weekly.csv"
+    _write_nppes_file(delta, [
+        _nppes_row("1000000001", "SMITH-BROWN", "ALEX1", "MA"),
+        _nppes_row("1000000003", "SMITH", "ALEX3", "MA", **{"NPI Deactivation Date": "02/01/2024"}),
+        _nppes_row("2000000000", "NEWMAN", "PAT", "CA"),
+    ])
+    stats = nppes_local.import_file(str(delta), engine=engine)
+    assert stats["rows"] == 3 and stats["deactivated"] == 1
+
+    monkeypatch.setattr(app_npi, "NPI_BACKEND", "local")
+    monkeypatch.setattr(app_npi, "ReadSessionLocal", sessionmaker(bind=engine))
+    client = TestClient(app_npi.app)
+
+    resp = client.get("/provider/1000000001")
+    assert resp.status_code == 200, resp.text
+    detail = resp.json()
+    assert detail["full_name"] == "ALEX1 SMITH-BROWN"
+    assert detail["addresses"][0]["city"] == "SPRINGFIELD"
+    assert detail["taxonomies"][0] == {"code": "207RC0000X", "desc": None, "primary": True, "state": "MA", "license": "LIC001"}
+
+    assert client.get("/provider/1000000003").status_code == 404
+    assert client.get("/provider/2000000000").status_code == 200
+
+    resp = client.post("/search_providers", json={"query": "smith", "state": "ma"})
+    assert resp.status_code == 200, resp.text
+    results = resp.json()["results"]
+    assert len(results) == 10
+    assert all(r["primary_address"]["state"] == "MA" and r["full_name"].endswith(" SMITH") for r in results)
+    assert "1000000003" not in {r["npi"] for r in results}
+
+
+def test_nppes_client_records_upstream_metrics():
+    from credentialwatch_backend import metrics
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.05)
+        if request.url.params["number"] == "bad":
+            return httpx.Response(503)
+        return httpx.Response(200, json={"results": []})
+
+    async def run():
+        client = NPPESClient(base_url="http://nppes.test/api/", transport=httpx.MockTransport(handler))
+        timings = metrics.RequestTimings()
+        token = metrics._current.set(timings)
+        try:
+            # Concurrent waits count once, as wall-clock time
+            await asyncio.gather(*(client.fetch({"number": str(n)}) for n in range(3)))
+            try:
+                await client.fetch({"number": "bad"})
+            except httpx.HTTPStatusError:
+                pass
+        finally:
+            metrics._current.reset(token)
+            await client.aclose()
+        return timings
+
+    ok = metrics.UPSTREAM_REQUESTS.value("nppes", "2xx")
+    failed = metrics.UPSTREAM_REQUESTS.value("nppes", "5xx")
+    timings = asyncio.run(run())
+    assert metrics.UPSTREAM_REQUESTS.value("nppes", "2xx") == ok + 3
+    assert metrics.UPSTREAM_REQUESTS.value("nppes", "5xx") == failed + 1
+    assert 0.1 <= timings.upstream_seconds < 0.2